@@ -88,7 +88,18 @@ class Recover(object):
     print 'Loading database from backup with ID %s' % audit_log_id
 
     self.db_instance.StartTransaction()
-    self.db_instance.cursor.execute(full_dump_file_contents)
+    try:
+      self.db_instance.cursor.execute(full_dump_file_contents)
+      # Every statement of the dump has a result to read before the next
+      # query.
+      while( self.db_instance.cursor.nextset() ):
+        pass
+      # The dump is loaded without MakeRow, so every cache has to be told
+      # by hand that anything may have changed.
+      self.db_instance.MarkAllGenerationsChanged()
+    except:
+      self.db_instance.EndTransaction(rollback=True)
+      raise
     self.db_instance.EndTransaction()
 
   def RunAuditStep(self, audit_log_id):
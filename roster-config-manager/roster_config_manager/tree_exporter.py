@@ -60,6 +60,30 @@ from roster_config_manager import zone_exporter_lib
 
 core.CheckCoreVersionMatches(__version__)
 
+# Stole these lines from mysqldump output, not sure all are needed
+DUMP_HEADER = ['SET @OLD_CHARACTER_SET_CLIENT=@@CHARACTER_SET_CLIENT;\n',
+               'SET @OLD_CHARACTER_SET_RESULTS=@@CHARACTER_SET_RESULTS;\n',
+               'SET @OLD_COLLATION_CONNECTION=@@COLLATION_CONNECTION;\n',
+               'SET NAMES utf8;\n'
+               'SET @OLD_TIME_ZONE=@@TIME_ZONE;\n',
+               "SET TIME_ZONE='+00:00';\n",
+               'SET @OLD_UNIQUE_CHECKS=@@UNIQUE_CHECKS;\n',
+               'SET UNIQUE_CHECKS=0;\n',
+               'SET @OLD_FOREIGN_KEY_CHECKS=@@FOREIGN_KEY_CHECKS;\n',
+               'SET FOREIGN_KEY_CHECKS=0;\n',
+               'SET @OLD_SQL_MODE=@@SQL_MODE;\n',
+               "SET SQL_MODE='NO_AUTO_VALUE_ON_ZERO';\n",
+               'SET @OLD_SQL_NOTES=@@SQL_NOTES;\n'
+               'SET SQL_NOTES=0;\n']
+
+DUMP_FOOTER = ['SET SQL_MODE=@OLD_SQL_MODE;\n',
+               'SET FOREIGN_KEY_CHECKS=@OLD_FOREIGN_KEY_CHECKS;\n',
+               'SET UNIQUE_CHECKS=@OLD_UNIQUE_CHECKS;\n',
+               'SET CHARACTER_SET_CLIENT=@OLD_CHARACTER_SET_CLIENT;\n',
+               'SET CHARACTER_SET_RESULTS=@OLD_CHARACTER_SET_RESULTS;\n',
+               'SET COLLATION_CONNECTION=@OLD_COLLATION_CONNECTION;\n',
+               'SET SQL_NOTES=@OLD_SQL_NOTES;\n']
+
 
 class Error(errors.CoreError):
   pass
@@ -93,8 +117,9 @@ class BindTreeExport(object):
         config_instance.config_file['exporter']['backup_dir']))
     self.root_hint_file = os.path.abspath(os.path.expanduser(
         config_instance.config_file['exporter']['root_hint_file']))
-    self.log_instance = audit_log.AuditLog(log_to_syslog=True, log_to_db=True,
-                                           db_instance=self.db_instance)
+    self.log_instance = audit_log.AuditLog(
+        log_to_syslog=True, log_to_db=True, db_instance=self.db_instance,
+        write_behind=self.db_instance.audit_log_write_behind)
 
   def NamedHeaderChangeDirectory(self, named_conf_header, new_directory):
     """Adds/Changes directory in named.conf header
@@ -168,6 +193,16 @@ class BindTreeExport(object):
     """
     function_name, current_args = helpers_lib.GetFunctionNameAndArgs()
     success = False
+    if( not os.path.exists(self.backup_dir) ):
+      os.makedirs(self.backup_dir)
+    # The dumps are written while the database is locked, before the log id
+    # that names them is known.
+    temp_audit_log_replay_dump_file_name = (
+        '%s/.audit_log_replay_dump-%s.bz2' % (self.backup_dir, os.getpid()))
+    temp_full_dump_file_name = '%s/.full_database_dump-%s.bz2' % (
+        self.backup_dir, os.getpid())
+    # Actions still queued for the audit log have to be in the dumps.
+    self.log_instance.Flush()
     try:
       self.db_instance.StartTransaction()
       try:
@@ -194,7 +229,9 @@ class BindTreeExport(object):
                 raise ChangesNotFoundError('No changes have been made to the '
                                            'database since last export, '
                                            'no export needed.')
-          data, raw_dump = self.GetRawData()
+          data, raw_dump = self.GetRawData(dump_database=False)
+          self.WriteDatabaseDumps(temp_audit_log_replay_dump_file_name,
+                                  temp_full_dump_file_name)
           current_time = self.db_instance.GetCurrentTime()
         finally:
           self.db_instance.UnlockDb()
@@ -308,40 +345,59 @@ class BindTreeExport(object):
             root_hint_file_handle.close()
           
 
-      audit_log_replay_dump, full_database_dump = self.CookRawDump(raw_dump)
-
       success = True
     finally:
       log_id = self.log_instance.LogAction(u'tree_export_user',
                                            function_name,
                                            current_args,
-                                           success)
+                                           success, synchronous=True)
+      if( not success ):
+        for temp_file_name in [temp_audit_log_replay_dump_file_name,
+                               temp_full_dump_file_name]:
+          if( os.path.exists(temp_file_name) ):
+            os.remove(temp_file_name)
 
 
     self.tar_file_name = '%s/dns_tree_%s-%s.tar.bz2' % (
         self.backup_dir, current_time.strftime("%d_%m_%yT%H_%M"), log_id)
-    if( not os.path.exists(self.backup_dir) ):
-      os.makedirs(self.backup_dir)
 
-    audit_log_replay_dump_file = bz2.BZ2File(
-        '%s/audit_log_replay_dump-%s.bz2' % (self.backup_dir, log_id), 'w')
-    try:
-      for audit_index, audit_entry in enumerate(audit_log_replay_dump):
-        audit_log_replay_dump[audit_index] = audit_entry.encode('utf-8')
-      audit_log_replay_dump_file.writelines(audit_log_replay_dump)
-    finally:
-      audit_log_replay_dump_file.close()
+    os.rename(temp_audit_log_replay_dump_file_name,
+              '%s/audit_log_replay_dump-%s.bz2' % (self.backup_dir, log_id))
+    os.rename(temp_full_dump_file_name,
+              '%s/full_database_dump-%s.bz2' % (self.backup_dir, log_id))
+
+    self.config_lib_instance.TarDnsTree(log_id)
+
+  def WriteDatabaseDumps(self, audit_log_replay_dump_file_name,
+                         full_dump_file_name):
+    """Streams the database into bz2 compressed mysqldump-like files. Both
+    files are written in a single pass over the database, the audit log
+    replay dump leaves out the tables that are not audit logged.
 
-    full_dump_file = bz2.BZ2File('%s/full_database_dump-%s.bz2' %
-                                 (self.backup_dir, log_id), 'w')
+    This function expects the database to be locked.
+
+    Inputs:
+      audit_log_replay_dump_file_name: string of audit log replay dump file
+      full_dump_file_name: string of full database dump file
+    """
+    audit_log_replay_dump_file = bz2.BZ2File(audit_log_replay_dump_file_name,
+                                             'w')
     try:
-      for full_dump_index, full_dump_entry in enumerate(full_database_dump):
-        full_database_dump[full_dump_index] = full_dump_entry.encode('utf-8')
-      full_dump_file.writelines(full_database_dump)
+      full_dump_file = bz2.BZ2File(full_dump_file_name, 'w')
+      try:
+        audit_log_replay_dump_file.writelines(DUMP_HEADER)
+        full_dump_file.writelines(DUMP_HEADER)
+        for table_name, statement in self.db_instance.IterDumpDatabase():
+          statement = statement.encode('utf-8')
+          full_dump_file.write(statement)
+          if( table_name not in constants.TABLES_NOT_AUDIT_LOGGED ):
+            audit_log_replay_dump_file.write(statement)
+        audit_log_replay_dump_file.writelines(DUMP_FOOTER)
+        full_dump_file.writelines(DUMP_FOOTER)
+      finally:
+        full_dump_file.close()
     finally:
-      full_dump_file.close()
-
-    self.config_lib_instance.TarDnsTree(log_id)
+      audit_log_replay_dump_file.close()
 
   def CookRawDump(self, raw_dump):
     """This takes raw data from the database and turns it into a
@@ -354,34 +410,10 @@ class BindTreeExport(object):
     Outputs:
       list: tuple of list of strings to be concatenated into mysql dump files
     """
-    # Stole these lines from mysqldump output, not sure all are needed
-    header = ['SET @OLD_CHARACTER_SET_CLIENT=@@CHARACTER_SET_CLIENT;\n',
-              'SET @OLD_CHARACTER_SET_RESULTS=@@CHARACTER_SET_RESULTS;\n',
-              'SET @OLD_COLLATION_CONNECTION=@@COLLATION_CONNECTION;\n',
-              'SET NAMES utf8;\n'
-              'SET @OLD_TIME_ZONE=@@TIME_ZONE;\n',
-              "SET TIME_ZONE='+00:00';\n",
-              'SET @OLD_UNIQUE_CHECKS=@@UNIQUE_CHECKS;\n',
-              'SET UNIQUE_CHECKS=0;\n',
-              'SET @OLD_FOREIGN_KEY_CHECKS=@@FOREIGN_KEY_CHECKS;\n',
-              'SET FOREIGN_KEY_CHECKS=0;\n',
-              'SET @OLD_SQL_MODE=@@SQL_MODE;\n',
-              "SET SQL_MODE='NO_AUTO_VALUE_ON_ZERO';\n",
-              'SET @OLD_SQL_NOTES=@@SQL_NOTES;\n'
-              'SET SQL_NOTES=0;\n']
-
-    footer = ['SET SQL_MODE=@OLD_SQL_MODE;\n',
-              'SET FOREIGN_KEY_CHECKS=@OLD_FOREIGN_KEY_CHECKS;\n',
-              'SET UNIQUE_CHECKS=@OLD_UNIQUE_CHECKS;\n',
-              'SET CHARACTER_SET_CLIENT=@OLD_CHARACTER_SET_CLIENT;\n',
-              'SET CHARACTER_SET_RESULTS=@OLD_CHARACTER_SET_RESULTS;\n',
-              'SET COLLATION_CONNECTION=@OLD_COLLATION_CONNECTION;\n',
-              'SET SQL_NOTES=@OLD_SQL_NOTES;\n']
-
     full_database_dump = []
-    full_database_dump.extend(header)
+    full_database_dump.extend(DUMP_HEADER)
     audit_log_replay_dump = []
-    audit_log_replay_dump.extend(header)
+    audit_log_replay_dump.extend(DUMP_HEADER)
 
     for table_name, table_data in raw_dump.iteritems():
       table_lines = []
@@ -398,8 +430,8 @@ class BindTreeExport(object):
       if( table_name not in constants.TABLES_NOT_AUDIT_LOGGED ):
         audit_log_replay_dump.extend(table_lines)
 
-    full_database_dump.extend(footer)
-    audit_log_replay_dump.extend(footer)
+    full_database_dump.extend(DUMP_FOOTER)
+    audit_log_replay_dump.extend(DUMP_FOOTER)
 
     return (audit_log_replay_dump, full_database_dump)
 
@@ -586,15 +618,21 @@ class BindTreeExport(object):
         acl_list.append(view_acl_assignment['view_acl_assignments_acl_name'])
     return acl_list
 
-  def GetRawData(self):
+  def GetRawData(self, dump_database=True):
     """Gets raw data from database
 
+    Inputs:
+      dump_database: boolean of if the database should be dumped into memory,
+                     see WriteDatabaseDumps to dump it to files instead
+
     Outputs:
       tuple of two dictionaries:
         dictionary of raw data keyed by data name with values of dicts
-            containing values of that type's attributes
+            containing values of that type's attributes, records are
+            under sorted_records as returned by SortRecords
         dictionary of the raw dump keyed by data name with values of
-            dicts containing the db dump keyed by row, column, and schema
+            dicts containing the db dump keyed by row, column, and schema,
+            None if dump_database is False
       example:
         ({'view_acl_assignments': ({
           'view_acl_assignments_view_name': u'external',
@@ -659,10 +697,12 @@ class BindTreeExport(object):
         'record_arguments_records_assignments',
         record_arguments_records_assignments_dict)
 
+    # Records are by far the largest join, they are sorted as they are
+    # streamed as compact rows rather than read into memory first.
     records_dict = self.db_instance.GetEmptyRowDict('records')
-    data['records'] = self.db_instance.ListRow(
+    data['sorted_records'] = self.SortRecords(self.db_instance.IterRow(
         'records', records_dict, 'record_arguments_records_assignments',
-        record_arguments_records_assignments_dict)
+        record_arguments_records_assignments_dict, compact=True))
 
     zone_view_assignments_dict = self.db_instance.GetEmptyRowDict(
         'zone_view_assignments')
@@ -672,7 +712,9 @@ class BindTreeExport(object):
     record_arguments_dict = self.db_instance.GetEmptyRowDict('record_arguments')
     data['record_arguments'] = self.db_instance.ListRow('record_arguments',
                                                         record_arguments_dict)
-    raw_dump = self.db_instance.DumpDatabase()
+    raw_dump = None
+    if( dump_database ):
+      raw_dump = self.db_instance.DumpDatabase()
 
     return (data, raw_dump)
 
@@ -680,7 +722,7 @@ class BindTreeExport(object):
     """Sorts records for zone exporter
 
     Inputs:
-      records: list of records
+      records: iterable of record rows, dicts or CompactRows
 
     Outputs:
       dict: dictionary keyed by tuple (zone, view_dep)
@@ -793,7 +835,7 @@ class BindTreeExport(object):
     cooked_data = {}
     cooked_data['dns_server_sets'] = {}
     cooked_data['dns_servers'] = {}
-    sorted_records = self.SortRecords(data['records'])
+    sorted_records = data['sorted_records']
 
     for dns_server_set in data['dns_server_sets']:
       dns_server_set_name = dns_server_set['dns_server_set_name']
@@ -37,16 +37,204 @@ __license__ = 'BSD'
 __version__ = "#TRUNK#"
 
 
+import atexit
 import cPickle
 import datetime
+import Queue
 import syslog
+import threading
+import time
 import unicodedata
 
+import constants
+
+
+# Write behind audit log writers of this process, keyed by database host and
+# name. All AuditLog instances of a database share one writer thread.
+audit_log_writers = {}
+audit_log_writers_lock = threading.Lock()
+
+
+def GetAuditLogWriter(db_instance):
+  """Gets the write behind audit log writer of a database, starting one if
+  this process has none or the one it had did not survive a fork.
+
+  Inputs:
+    db_instance: instance of DbAccess class, None if only syslog and files
+                 are written
+
+  Outputs:
+    AuditLogWriter instance
+  """
+  if( db_instance is None ):
+    writer_key = None
+  else:
+    writer_key = (db_instance.db_host, db_instance.db_name)
+  audit_log_writers_lock.acquire()
+  try:
+    writer = audit_log_writers.get(writer_key)
+    if( writer is None or not writer.thread.isAlive() ):
+      writer = AuditLogWriter(db_instance)
+      audit_log_writers[writer_key] = writer
+    return writer
+  finally:
+    audit_log_writers_lock.release()
+
+
+def FlushAuditLogWriters():
+  """Waits for every write behind audit log writer of this process to write
+  the actions queued so far, for at most constants.AUDIT_LOG_FLUSH_TIMEOUT
+  seconds in all. Run when the interpreter exits.
+  """
+  audit_log_writers_lock.acquire()
+  try:
+    writers = audit_log_writers.values()
+  finally:
+    audit_log_writers_lock.release()
+  deadline = time.time() + constants.AUDIT_LOG_FLUSH_TIMEOUT
+  for writer in writers:
+    writer.Flush(max(deadline - time.time(), 0))
+
+atexit.register(FlushAuditLogWriters)
+
+
+class AuditLogWriter(object):
+  """This class writes audit log actions from a bounded queue with a
+  background thread.
+
+  Database rows waiting in the queue are written with multi-row inserts of
+  up to constants.BULK_ROW_CHUNK_SIZE rows in a transaction of their own,
+  and syslog is opened once for the life of the thread.
+  """
+  def __init__(self, db_instance):
+    """Starts the writer thread.
+
+    Inputs:
+      db_instance: instance of DbAccess class
+    """
+    self.db_instance = db_instance
+    self.queue = Queue.Queue(constants.AUDIT_LOG_QUEUE_SIZE)
+    self.thread = threading.Thread(target=self.Run,
+                                   name='audit_log_writer')
+    self.thread.setDaemon(True)
+    self.thread.start()
+
+  def Write(self, log_dict, log_string, log_to_syslog, log_file_name):
+    """Queues an action to be written, waits for room in the queue if it
+    is full.
+
+    Inputs:
+      log_dict: dictionary of audit_log row, None if the database is not
+                written to
+      log_string: string of human readable log message
+      log_to_syslog: bool of if log_string is written to syslog
+      log_file_name: string of file name to write log_string to, None if
+                     no file is written to
+    """
+    self.queue.put((log_dict, log_string, log_to_syslog, log_file_name))
+
+  def Flush(self, timeout=constants.AUDIT_LOG_FLUSH_TIMEOUT):
+    """Waits until every action queued so far is written. If they are not
+    written in time a warning is sent to syslog and they are left to the
+    writer thread.
+
+    Inputs:
+      timeout: number of seconds to wait
+
+    Outputs:
+      bool: if every queued action was written
+    """
+    deadline = time.time() + timeout
+    self.queue.all_tasks_done.acquire()
+    try:
+      while( self.queue.unfinished_tasks ):
+        wait_seconds = deadline - time.time()
+        if( wait_seconds <= 0 ):
+          unwritten_actions = self.queue.unfinished_tasks
+          break
+        self.queue.all_tasks_done.wait(wait_seconds)
+      else:
+        return True
+    finally:
+      self.queue.all_tasks_done.release()
+    syslog.syslog(syslog.LOG_WARNING, 'Gave up waiting for %s audit log '
+                  'actions to be written after %s seconds' % (
+                      unwritten_actions, timeout))
+    return False
+
+  def Run(self):
+    """Writes queued actions until the process exits."""
+    syslog.openlog('dnsManagement')
+    while( True ):
+      actions = [self.queue.get()]
+      try:
+        while( len(actions) < constants.BULK_ROW_CHUNK_SIZE ):
+          actions.append(self.queue.get_nowait())
+      except Queue.Empty:
+        pass
+      try:
+        # The thread has to outlive any action, or Write would wait for it
+        # forever and every Flush would time out.
+        try:
+          self.WriteActions(actions)
+        except Exception, error:
+          syslog.syslog(syslog.LOG_ERR, 'Could not write %s audit log '
+                        'actions: %r' % (len(actions), error))
+      finally:
+        for action in actions:
+          self.queue.task_done()
+
+  def WriteActions(self, actions):
+    """Writes a list of queued actions. Errors are sent to syslog, as there
+    is no caller left to raise them to.
+
+    Inputs:
+      actions: list of tuples of the arguments of Write
+    """
+    log_dicts = []
+    for log_dict, log_string, log_to_syslog, log_file_name in actions:
+      if( log_dict is not None ):
+        log_dicts.append(log_dict)
+    if( log_dicts ):
+      try:
+        self.db_instance.StartTransaction()
+        try:
+          self.db_instance.MakeRows('audit_log', log_dicts)
+        except:
+          self.db_instance.EndTransaction(rollback=True)
+          raise
+        self.db_instance.EndTransaction()
+      except Exception, error:
+        syslog.syslog(syslog.LOG_ERR, 'Could not write %s audit log rows: %s' %
+                      (len(log_dicts), error))
+
+    log_files = {}
+    try:
+      for log_dict, log_string, log_to_syslog, log_file_name in actions:
+        if( log_to_syslog ):
+          # Convert the unicode strings to ascii if needed
+          if( isinstance(log_string, unicode) ):
+            syslog.syslog(unicodedata.normalize('NFKD', log_string).encode(
+                'ASCII', 'replace'))
+          else:
+            syslog.syslog(log_string)
+        if( log_file_name is not None ):
+          try:
+            if( log_file_name not in log_files ):
+              log_files[log_file_name] = open(log_file_name, 'a')
+            log_files[log_file_name].write('%s\n' % log_string)
+          except Exception, error:
+            syslog.syslog(syslog.LOG_ERR, 'Could not write audit log file '
+                          '%s: %s' % (log_file_name, error))
+    finally:
+      for log_file in log_files.itervalues():
+        log_file.close()
+
 
 class AuditLog(object):
 
   def __init__(self, log_to_syslog=False, log_to_db=False, db_instance=None,
-               log_to_file=False, log_file_name=None):
+               log_to_file=False, log_file_name=None, write_behind=False):
     """Sets where log messages get sent.
     
     Inputs:
@@ -55,16 +243,29 @@ class AuditLog(object):
       db_instance: instance of DbAccess class
       log_to_file: bool of if file is used
       log_file: string of file name to log to
+      write_behind: bool of if actions are queued and written by a
+                    background thread instead of before LogAction returns
     """
     self.log_to_syslog = log_to_syslog
     self.log_to_db = log_to_db
     self.db_instance = db_instance
     self.log_to_file = log_to_file
     self.log_file_name = log_file_name
+    self.writer = None
+    if( write_behind ):
+      self.writer = GetAuditLogWriter(db_instance)
 
-  def LogAction(self, user, action, data, success, current_transaction=False):
+  def LogAction(self, user, action, data, success, current_transaction=False,
+                synchronous=False):
     """Logs action to places specified in initalizer.
 
+    In write behind mode the database row is only written before this
+    returns when the caller needs its id, with synchronous, or when it is
+    part of the caller's transaction, with current_transaction. Actions
+    queued before a synchronous one are written first, so audit log ids stay
+    in the order of the actions unless they could not be written within
+    constants.AUDIT_LOG_FLUSH_TIMEOUT seconds.
+
     Inputs:
       user: string of user name
       action: string of function name that is being logged
@@ -75,6 +276,12 @@ class AuditLog(object):
                             'acl_name': u'test_acl'}}
       success: bool of success of action
       current_transaction: boolean for if a transaction is already started
+      synchronous: boolean of if the audit log id is needed in write behind
+                   mode
+
+    Outputs:
+      int: audit log id if the database is logged to, None if the row was
+           queued
     """
     current_datetime = datetime.datetime.now()
     current_timestamp = current_datetime.strftime('%Y-%m-%d %H:%M:%S')
@@ -82,6 +289,29 @@ class AuditLog(object):
                                                          success,
                                                          current_timestamp)
 
+    if( self.writer is not None ):
+      log_dict = None
+      audit_log_id = None
+      if( self.log_to_db ):
+        if( synchronous and not current_transaction ):
+          self.writer.Flush()
+        if( synchronous or current_transaction ):
+          audit_log_id = self._LogToDatabase(user, action, data, success,
+                                             current_datetime,
+                                             current_transaction)
+        else:
+          log_dict = self._MakeLogDict(user, action, data, success,
+                                       current_datetime)
+      log_file_name = None
+      if( self.log_to_file ):
+        log_file_name = self.log_file_name
+      if( log_dict is not None or self.log_to_syslog or self.log_to_file ):
+        self.writer.Write(log_dict, pretty_print_log_string,
+                          self.log_to_syslog, log_file_name)
+      if( self.log_to_db ):
+        return audit_log_id
+      return
+
     if( self.log_to_db ):
       audit_log_id = self._LogToDatabase(user, action, data, success,
                                          current_datetime, current_transaction)
@@ -95,6 +325,17 @@ class AuditLog(object):
     if( self.log_to_db ):
       return audit_log_id
 
+  def Flush(self):
+    """Waits for actions queued in write behind mode to be written, for at
+    most constants.AUDIT_LOG_FLUSH_TIMEOUT seconds.
+
+    Outputs:
+      bool: if every queued action was written
+    """
+    if( self.writer is not None ):
+      return self.writer.Flush()
+    return True
+
   def _LogToSyslog(self, log_string):
     """Writes log string to syslog.
 
@@ -123,17 +364,8 @@ class AuditLog(object):
       current_timestamp: string of mysql formated time stamp
       current_transaction: boolean for if a transaction is already started
     """
-    if( success ):
-      success = 1
-    else:
-      success = 0
-    data = cPickle.dumps(data)
-    log_dict = {'audit_log_id': None,
-                'audit_log_user_name': user,
-                'action': action,
-                'data': data,
-                'success': success,
-                'audit_log_timestamp': current_timestamp}
+    log_dict = self._MakeLogDict(user, action, data, success,
+                                 current_timestamp)
     if( not current_transaction ):
       self.db_instance.StartTransaction()
     try:
@@ -146,6 +378,31 @@ class AuditLog(object):
 
     return audit_log_id
 
+  def _MakeLogDict(self, user, action, data, success, current_timestamp):
+    """Makes an audit_log row of an action.
+
+    Inputs:
+      user: string of user name
+      action: string of action
+      data: string of data
+      success: bool of success of action
+      current_timestamp: string of mysql formated time stamp
+
+    Outputs:
+      dictionary of audit_log row
+    """
+    if( success ):
+      success = 1
+    else:
+      success = 0
+    data = cPickle.dumps(data)
+    return {'audit_log_id': None,
+            'audit_log_user_name': user,
+            'action': action,
+            'data': data,
+            'success': success,
+            'audit_log_timestamp': current_timestamp}
+
   def _LogToFile(self, log_string):
     """Writes log string to file.
 
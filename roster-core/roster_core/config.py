@@ -59,6 +59,9 @@ class Config(object):
       ConfigError: Variable is not used
       ConfigError: Datatype is not supported
       ConfigError: Variable is missing in config file section
+
+    Variables in constants.CONFIG_FILE_DEFAULTS that are missing are set to
+    their defaults.
     """
     cp = ConfigParser.SafeConfigParser()
     a = cp.read(file_name)
@@ -73,6 +76,7 @@ class Config(object):
       self.config_file[section] = {}
       if( cp.has_section(section) ):
         variables = file_schema[section]
+        variable_defaults = constants.CONFIG_FILE_DEFAULTS.get(section, {})
         file_variables = cp.options(section)
         for variable in file_variables:
           if( variable not in variables ):
@@ -80,6 +84,9 @@ class Config(object):
                                      variable, file_name))
         for variable in variables:
           if( variable not in file_variables ):
+            if( variable in variable_defaults ):
+              self.config_file[section][variable] = variable_defaults[variable]
+              continue
             raise errors.ConfigError('Variable "%s" is missing in config file: '
                                      '"%s", in the "%s" section.' % ( 
                                      variable, file_name, section))
@@ -119,7 +126,20 @@ class Config(object):
             self.config_file['database']['database'],
             self.config_file['database']['big_lock_timeout'],
             self.config_file['database']['big_lock_wait']]
-    kwargs = {}
+    kwargs = {'connection_pool_size':
+                  self.config_file['database']['connection_pool_size'],
+              'connection_idle_timeout':
+                  self.config_file['database']['connection_idle_timeout'],
+              'connection_wait_timeout':
+                  self.config_file['database']['connection_wait_timeout'],
+              'connection_probe_idle':
+                  self.config_file['database']['connection_probe_idle'],
+              'maintenance_flag_ttl':
+                  self.config_file['database']['maintenance_flag_ttl'],
+              'audit_log_write_behind':
+                  self.config_file['database']['audit_log_write_behind'],
+              'authorization_ttl':
+                  self.config_file['database']['authorization_ttl']}
     if( self.config_file['database']['ssl'] ):
       kwargs['ssl'] = True
       kwargs['ssl_ca'] = self.config_file['database']['ssl_ca']
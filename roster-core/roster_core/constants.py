@@ -52,6 +52,98 @@ MAX_SOA_SERIAL = 4294967295
 # database of records or read each record individually
 RECORD_RATIO = 20
 
+# This is the number of ListRow query plans kept by each dbAccess instance.
+LIST_ROW_PLAN_CACHE_SIZE = 256
+
+# This is the number of rows IterRow reads from a server side cursor at a time.
+ITER_ROW_CHUNK_SIZE = 1000
+
+# This is the number of rows MakeRows, RemoveRows and UpdateRows change with
+# a single query, and the number of rows in each INSERT of IterDumpDatabase.
+BULK_ROW_CHUNK_SIZE = 500
+
+# This is the number of seconds LockDb waits for another holder of the big
+# lock, such as a second tree export, before giving up.
+BIG_LOCK_GET_TIMEOUT = 86400
+
+# This is the number of audit log actions that can wait to be written in write
+# behind mode before LogAction waits for the writer thread.
+AUDIT_LOG_QUEUE_SIZE = 10000
+
+# This is the number of seconds flushing the write behind audit log waits for
+# queued actions, such as when the process exits or before a tree export,
+# before giving up and warning in syslog.
+AUDIT_LOG_FLUSH_TIMEOUT = 60
+
+# This is the number of parsed ip addresses and cidr blocks ip_lib keeps.
+IP_PARSE_CACHE_SIZE = 4096
+
+# These are the tables DataValidation is built from. Committing a change to
+# any of them makes every dbAccess instance in the process load them again.
+DATA_VALIDATION_TABLES = frozenset(['reserved_words', 'record_types'])
+
+# These are the tables the view dependency graph is built from, committing a
+# change to any of them makes dbAccess build the graph again.
+VIEW_DEPENDENCY_TABLES = frozenset(['views', 'view_dependencies',
+                                    'view_dependency_assignments'])
+
+# These are the tables user authorization snapshots are built from, committing
+# a change to any of them makes every user snapshot in the process stale.
+AUTHORIZATION_TABLES = frozenset([
+    'users', 'groups', 'user_group_assignments', 'forward_zone_permissions',
+    'group_forward_permissions', 'reverse_range_permissions',
+    'group_reverse_permissions', 'zones', 'zone_view_assignments', 'views',
+    'view_dependencies'])
+
+# These are the generations of the generations table user authorization
+# snapshots are checked against, so changes committed by other processes are
+# seen. They count every table in AUTHORIZATION_TABLES.
+AUTHORIZATION_GENERATIONS = [u'users', u'zones', u'views']
+
+# These are the generations counted up when a transaction that changed a table
+# commits, keyed by table name. Records are counted per zone and view
+# dependency whenever the SOA of a zone is incremented instead.
+GENERATION_TABLES = {
+    'views': u'views', 'view_dependencies': u'views',
+    'view_dependency_assignments': u'views',
+    'view_acl_assignments': u'views',
+    'acls': u'acls', 'acl_ranges': u'acls',
+    'zones': u'zones', 'zone_view_assignments': u'zones',
+    'reverse_range_zone_assignments': u'zones',
+    'users': u'users', 'groups': u'users', 'user_group_assignments': u'users',
+    'forward_zone_permissions': u'users',
+    'group_forward_permissions': u'users',
+    'reverse_range_permissions': u'users',
+    'group_reverse_permissions': u'users',
+    'dns_servers': u'named_conf', 'dns_server_sets': u'named_conf',
+    'dns_server_set_assignments': u'named_conf',
+    'dns_server_set_view_assignments': u'named_conf',
+    'named_conf_global_options': u'named_conf',
+    'reserved_words': u'reserved_words', 'record_types': u'reserved_words'}
+
+# These are the combinations of tables that are joined by ListRow in core,
+# core_helpers and db_access. Their join predicates are worked out as soon as
+# the foreign keys are loaded, other combinations are worked out on first use.
+JOINED_TABLES = [
+    ('records', 'record_arguments_records_assignments'),
+    ('records', 'record_arguments_records_assignments',
+     'zone_view_assignments'),
+    ('records', 'zones', 'zone_view_assignments',
+     'record_arguments_records_assignments'),
+    ('ipv4_index', 'records', 'zones', 'zone_view_assignments',
+     'record_arguments_records_assignments'),
+    ('ipv6_index', 'records', 'zones', 'zone_view_assignments',
+     'record_arguments_records_assignments'),
+    ('users', 'groups', 'user_group_assignments', 'forward_zone_permissions',
+     'group_forward_permissions'),
+    ('users', 'groups', 'user_group_assignments', 'reverse_range_permissions',
+     'group_reverse_permissions'),
+    ('users', 'user_group_assignments', 'groups', 'forward_zone_permissions',
+     'zones', 'zone_view_assignments'),
+    ('views', 'users', 'user_group_assignments', 'groups',
+     'reverse_range_permissions', 'zones', 'zone_view_assignments',
+     'reverse_range_zone_assignments')]
+
 # These are access levels in enum like variables for readability. These
 # access levels are primarilly for the user table and it's type checking.
 # Any access level used in the code should be listed here.
@@ -63,14 +155,29 @@ ACCESS_LEVELS = {'dns_admin': 128,
 
 # This is a list of tables that are not audit logged when changes are made.
 # it is important not to overwrite these tables when doing a partial replay
-TABLES_NOT_AUDIT_LOGGED = ['audit_log', 'locks']
+TABLES_NOT_AUDIT_LOGGED = ['audit_log', 'locks', 'generations']
 
 # This is a list of record types that can be indexed by IP address.
 RECORD_TYPES_INDEXED_BY_IP = ['ptr', 'a', 'aaaa']
 
+# These are record arguments left out of record fingerprints, keyed by record
+# type. SOA serial numbers change with every write to their zone.
+RECORD_FINGERPRINT_EXCLUDED_ARGUMENTS = {'soa': ['serial_number']}
+
 # This is the default config file location for roster server
 SERVER_CONFIG_FILE_LOCATION = '/etc/roster/roster_server.conf'
 
+# These are the config file variables that can be left out of config files
+# written before they were added, with the values used when they are, keyed by
+# section. They are the dbAccess defaults.
+CONFIG_FILE_DEFAULTS = {'database': {'connection_pool_size': 1,
+                                     'connection_idle_timeout': 0,
+                                     'connection_wait_timeout': 0,
+                                     'connection_probe_idle': 0,
+                                     'maintenance_flag_ttl': 0,
+                                     'audit_log_write_behind': False,
+                                     'authorization_ttl': 0}}
+
 # CONFIG_FILE_SCHMEA holds the expected inputs from config files and
 # their types for checking.
 # Supported data types: str, int, boolean, float
@@ -79,7 +186,14 @@ CONFIG_FILE_SCHEMA = {'database': {'server': 'str', 'login': 'str',
                                    'big_lock_timeout': 'int',
                                    'big_lock_wait': 'int', 'ssl': 'boolean',
                                    'ssl_ca': 'str', 'db_debug': 'boolean',
-                                   'db_debug_log': 'str'},
+                                   'db_debug_log': 'str',
+                                   'connection_pool_size': 'int',
+                                   'connection_idle_timeout': 'int',
+                                   'connection_wait_timeout': 'int',
+                                   'connection_probe_idle': 'int',
+                                   'maintenance_flag_ttl': 'int',
+                                   'audit_log_write_behind': 'boolean',
+                                   'authorization_ttl': 'int'},
                       'server': {'inf_renew_time': 'int', 'core_die_time': 'int',
                                  'get_credentials_wait_increment': 'int',
                                  'run_as_username': 'str',
@@ -473,6 +587,11 @@ SUPPORTED_METHODS = {
                      'write': False,
                      'access_level': ACCESS_LEVELS['dns_admin']},
 
+    'ListGenerations':
+                    {'check': False,
+                     'write': False,
+                     'access_level': ACCESS_LEVELS['user']},
+
     'ListCredentials':
                     {'check': False,
                      'write': False,
@@ -625,6 +744,18 @@ TABLES = {
     'locks':
         {'lock_name': 'UnicodeString', 'locked': 'IntBool'},
 
+    'generations':
+        {'generation_name': 'UnicodeString',
+         'generation_zone_name': 'UnicodeString',
+         'generation_view_dependency': 'UnicodeString',
+         'generation': 'UnsignedInt'},
+
+    'record_fingerprints':
+        {'record_fingerprint': 'UnicodeString',
+         'record_fingerprints_zone_name': 'UnicodeString',
+         'record_fingerprints_view_dependency': 'UnicodeString',
+         'record_fingerprints_record_id': 'UnsignedInt'},
+
     'ipv4_index':
         {'ipv4_dec_address': 'UnsignedInt',
          'ipv4_index_record_id': 'UnsignedInt'},
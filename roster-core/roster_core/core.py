@@ -38,13 +38,13 @@ __version__ = '#TRUNK#'
 import datetime
 import uuid
 
-import IPy
 import iscpy
 
 import audit_log
 import constants
 import errors
 import helpers_lib
+import ip_lib
 import user
 
 class Core(object):
@@ -70,8 +70,9 @@ class Core(object):
     self.dirty = False
     self.unittest_timestamp = unittest_timestamp
     self.db_instance = config_instance.GetDb()
-    self.log_instance = audit_log.AuditLog(log_to_syslog=True, log_to_db=True,
-                                           db_instance=self.db_instance)
+    self.log_instance = audit_log.AuditLog(
+        log_to_syslog=True, log_to_db=True, db_instance=self.db_instance,
+        write_behind=self.db_instance.audit_log_write_behind)
     self.user_instance = user.User(user_name, self.db_instance,
                                    self.log_instance)
     self.parent_server_instance = parent_server_instance
@@ -2006,6 +2007,7 @@ class Core(object):
             'forward_zone_permissions', forward_zone_permissions_dict)
 
         ## Add associated group_forward_permissions
+        group_forward_permissions = []
         for group_perm in group_permission:
           group_forward_permissions_dict = self.db_instance.GetEmptyRowDict(
               'group_forward_permissions')
@@ -2015,8 +2017,9 @@ class Core(object):
           group_forward_permissions_dict[
               'group_forward_permissions_group_permission'] = (
                   group_perm)
-          self.db_instance.MakeRow('group_forward_permissions',
-                                   group_forward_permissions_dict)
+          group_forward_permissions.append(group_forward_permissions_dict)
+        self.db_instance.MakeRows('group_forward_permissions',
+                                  group_forward_permissions)
 
       except:
         self.db_instance.EndTransaction(rollback=True)
@@ -2303,6 +2306,7 @@ class Core(object):
             'reverse_range_permissions', reverse_range_permissions_dict)
 
         ## Add associated group_forward_permissions
+        group_reverse_permissions = []
         for group_perm in group_permission:
           group_reverse_permissions_dict = self.db_instance.GetEmptyRowDict(
               'group_reverse_permissions')
@@ -2312,8 +2316,9 @@ class Core(object):
           group_reverse_permissions_dict[
               'group_reverse_permissions_group_permission'] = (
                   group_perm)
-          self.db_instance.MakeRow('group_reverse_permissions',
-                                   group_reverse_permissions_dict)
+          group_reverse_permissions.append(group_reverse_permissions_dict)
+        self.db_instance.MakeRows('group_reverse_permissions',
+                                  group_reverse_permissions)
       except:
         self.db_instance.EndTransaction(rollback=True)
         raise
@@ -2564,7 +2569,8 @@ class Core(object):
     try:
       records = self.db_instance.ListRow('records', records_dict,
                                          'record_arguments_records_assignments',
-                                         record_args_assignment_dict)
+                                         record_args_assignment_dict,
+                                         compact=True)
     finally:
       self.db_instance.EndTransaction()
 
@@ -2623,10 +2629,6 @@ class Core(object):
     if( ttl is None ):
       ttl = constants.DEFAULT_TTL
 
-    if( record_type in ['cname', 'a', 'aaaa'] ):
-      search_type = None
-    else:
-      search_type = record_type
     records_dict = {'records_id': None,
                     'record_target': target,
                     'record_type': None,
@@ -2634,8 +2636,6 @@ class Core(object):
                     'record_zone_name': zone_name,
                     'record_view_dependency': None,
                     'record_last_user': None}
-    record_args_assignment_dict = self.db_instance.GetEmptyRowDict(
-        'record_arguments_records_assignments')
 
     zone_view_assignments_dict = self.db_instance.GetEmptyRowDict(
         'zone_view_assignments')
@@ -2646,27 +2646,9 @@ class Core(object):
     try:
       self.db_instance.StartTransaction()
       try:
-        view_assignments = self.db_instance.ListRow(
-            'view_dependency_assignments',
-            {'view_dependency_assignments_view_name': None,
-             'view_dependency_assignments_view_dependency': view_name})
-        views = []
-        view_deps = []
-        for view_assignment in view_assignments:
-          if( view_assignment['view_dependency_assignments_view_name'] 
-              not in views ):
-            views.append(view_assignment['view_dependency_assignments_'
-                                         'view_name'])
-          view_assignments_dependencies = self.db_instance.ListRow(
-              'view_dependency_assignments',
-              {'view_dependency_assignments_view_name': view_assignment['view_'
-                  'dependency_assignments_view_name'],
-              'view_dependency_assignments_view_dependency': None})
-          for view in view_assignments_dependencies:
-            if( view['view_dependency_assignments_view_dependency'] 
-                not in view_deps ):
-              view_deps.append(view['view_dependency_'
-                                    'assignments_view_dependency'])
+        # Views the record is in and every view dependency of those views
+        views, view_deps = self.db_instance.GetViewDependencyGraph(
+            view_name).get(view_name, ([], []))
 
         zone_view_assignments = self.db_instance.ListRow('zone_view_assignments',
             zone_view_assignments_dict)
@@ -2705,40 +2687,40 @@ class Core(object):
               raise errors.InvalidInputError('CNAME already exists with '
                                              'target %s.' % target)
 
-        records_dict['record_type'] = search_type
-        raw_records = self.db_instance.ListRow(
-            'records', records_dict, 'record_arguments_records_assignments',
-            record_args_assignment_dict)
+        record_fingerprint_dict = self.db_instance.GetEmptyRowDict(
+            'record_fingerprints')
+        record_fingerprint_dict['record_fingerprint'] = (
+            helpers_lib.GetRecordFingerprint(record_type, target,
+                                             record_args_dict))
+        record_fingerprint_dict['record_fingerprints_zone_name'] = zone_name
+        for record_fingerprint in self.db_instance.ListRow(
+            'record_fingerprints', record_fingerprint_dict):
+          fingerprint_view_name = record_fingerprint[
+              'record_fingerprints_view_dependency']
+          if( fingerprint_view_name == view_name or
+              fingerprint_view_name in views or
+              fingerprint_view_name in view_deps ):
+            raise errors.InvalidInputError('Duplicate record found')
 
-        current_records = (
-            helpers_lib.GetRecordsFromRecordRowsAndArgumentRows(
-                raw_records, record_args_dict))
         records_dict['record_ttl'] = ttl
         records_dict['record_type'] = record_type
         records_dict['record_last_user'] = self.user_instance.GetUserName()
-        
-        for record in current_records:
-          for arg in record_args_dict:
-            if( arg not in record ):
-              break
-            if( record_args_dict[arg] != record[arg] ):
-              break
-          else:
-            if( record['view_name'] in views or 
-                record['view_name'] in view_deps ):
-              raise errors.InvalidInputError('Duplicate record found')
-
-        records_dict['record_type'] = record_type
         records_dict['record_view_dependency'] = view_name
         record_id = self.db_instance.MakeRow('records', records_dict)
+        record_fingerprint_dict['record_fingerprints_view_dependency'] = (
+            view_name)
+        record_fingerprint_dict['record_fingerprints_record_id'] = record_id
+        self.db_instance.MakeRow('record_fingerprints',
+                                 record_fingerprint_dict)
+        record_argument_assignments = []
         for arg_name in record_args_dict:
-          record_argument_assignments_dict = {
+          record_argument_assignments.append({
              'record_arguments_records_assignments_record_id': record_id,
              'record_arguments_records_assignments_type': record_type,
              'record_arguments_records_assignments_argument_name': arg_name,
-             'argument_value': unicode(record_args_dict[arg_name])}
-          self.db_instance.MakeRow('record_arguments_records_assignments',
-                                   record_argument_assignments_dict)
+             'argument_value': unicode(record_args_dict[arg_name])})
+        self.db_instance.MakeRows('record_arguments_records_assignments',
+                                  record_argument_assignments)
         if( record_type in constants.RECORD_TYPES_INDEXED_BY_IP ):
           self._AddRecordToIpIndex(record_type, zone_name, view_name,
                                    record_id, target, record_args_dict)
@@ -2964,6 +2946,7 @@ class Core(object):
                 self.db_instance.UpdateRow(
                     'record_arguments_records_assignments',
                     search_args, update_args)
+          self._UpdateRecordFingerprint(search_records_dict['records_id'])
         else:
           raise errors.InvalidInputError(
               'Multiple records found for used search '
@@ -3436,90 +3419,71 @@ class Core(object):
     return row_count
 
   def _IncrementSoa(self, view_name, zone_name, missing_ok=False):
-    """Increments soa serial number.
+    """Increments soa serial number when the current transaction commits,
+    once per transaction however many records of the zone are changed.
+    Missing or multiple SOA records are raised by dbAccess.EndTransaction
+    then, not by this.
 
     Inputs:
       view_name: string of view name
       zone_name: string of view namea
       missing_ok: boolean of whether or not missing SOA records are allowed
-
-    Raises:
-      InvalidInputError: Multiple SOA records found..
-      RecordError: No SOA record found for zone.
-
-    Outputs:
-      int: number of rows modified
     """
-    soa_dict = self.db_instance.GetEmptyRowDict('records')
-    soa_arguments_dict = self.db_instance.GetEmptyRowDict(
-        'record_arguments_records_assignments')
-    zone_view_assignments_dict = self.db_instance.GetEmptyRowDict(
-        'zone_view_assignments')
-    zone_view_assignments_dict['zone_view_assignments_zone_name'] = zone_name
-    row_count = 0
-
-    soa_dict['record_type'] = u'soa'
     if( view_name is None ):
       view_name = u'any'
 
-    zone_view_assignment_rows = self.db_instance.ListRow(
-        'zone_view_assignments', zone_view_assignments_dict)
-
-    zone_view_assignments = {}
-    for zone_view_assignment in zone_view_assignment_rows:
-      zv_zone_name = zone_view_assignment['zone_view_assignments_zone_name']
-      zv_view_name = zone_view_assignment[
-          'zone_view_assignments_view_dependency']
-      if( zv_zone_name not in zone_view_assignments ):
-        zone_view_assignments[zv_zone_name] = []
-      zone_view_assignments[zv_zone_name].append(zv_view_name)
-
     view_deps = [view_name]
     if( view_name != u'any' and not view_name.endswith('_dep') ):
       view_deps = [u'%s_dep' % view_name]
     elif( view_name == u'any' ):
-      view_deps = zone_view_assignments[zone_name]
+      # The view dependencies of every zone changed in any are read together
+      # when the transaction commits.
+      self.db_instance.MarkZoneSoaSerialsChanged(zone_name,
+                                                 missing_ok=missing_ok)
+      return
 
     for view_name in view_deps:
+      self.db_instance.MarkGenerationChanged(u'records', zone_name, view_name)
       if( view_name == u'any' ):
         continue
-      soa_dict['record_view_dependency'] = view_name
-      soa_dict['record_zone_name'] = zone_name
+      self.db_instance.MarkSoaSerialChanged(zone_name, view_name,
+                                            missing_ok=missing_ok)
 
-      soa_records_list = self.db_instance.ListRow('records', soa_dict)
+  def _UpdateRecordFingerprint(self, record_id):
+    """Sets the fingerprint of a record from its current row and arguments.
 
-      if( len(soa_records_list) > 1 ):
-        raise errors.InvalidInputError('Multiple SOA records found: %s' % 
-                                       str(soa_records_list))
-
-      if( len(soa_records_list) == 0 ):
-        if( not missing_ok ):
-          raise errors.RecordError(
-              'No SOA record found for zone "%s" view "%s".' % (
-              zone_name, view_name))
-      else:
-        soa_records_list = soa_records_list[0]
-        soa_arguments_dict[
-            'record_arguments_records_assignments_record_id'] = (
-                soa_records_list['records_id'])
-        soa_record_arguments = self.db_instance.ListRow(
-            'record_arguments_records_assignments', soa_arguments_dict)
-        for argument in soa_record_arguments:
-          if( argument[
-              'record_arguments_records_assignments_argument_name'] == (
-                  u'serial_number') ):
-            serial_number = int(argument['argument_value'])
-            search_soa_dict = argument
-
-        if( serial_number >= constants.MAX_SOA_SERIAL ):
-          soa_arguments_dict[u'argument_value'] = u'1'
-        else:
-          soa_arguments_dict[u'argument_value'] = unicode(serial_number + 1)
+    Inputs:
+      record_id: int of id for record
 
-        row_count += self.db_instance.UpdateRow(
-            'record_arguments_records_assignments', search_soa_dict,
-            soa_arguments_dict)
-    return row_count
+    Raises:
+      InvalidInputError: Duplicate record found.
+    """
+    records_dict = self.db_instance.GetEmptyRowDict('records')
+    records_dict['records_id'] = record_id
+    record_rows = self.db_instance.ListRow(
+        'records', records_dict, 'record_arguments_records_assignments',
+        self.db_instance.GetEmptyRowDict(
+            'record_arguments_records_assignments'))
+    record_args_dict = {}
+    for record_row in record_rows:
+      record_args_dict[record_row[
+          'record_arguments_records_assignments_argument_name']] = (
+              record_row['argument_value'])
+    fingerprint_key = (
+        helpers_lib.GetRecordFingerprint(
+            record_rows[0]['record_type'], record_rows[0]['record_target'],
+            record_args_dict),
+        record_rows[0]['record_zone_name'],
+        record_rows[0]['record_view_dependency'])
+    self.db_instance.RemoveRows('record_fingerprints',
+                                'record_fingerprints_record_id', [record_id])
+    if( self.db_instance.GetRecordFingerprints([fingerprint_key]) ):
+      raise errors.InvalidInputError('Duplicate record found')
+    self.db_instance.MakeRow('record_fingerprints', {
+        'record_fingerprint': fingerprint_key[0],
+        'record_fingerprints_zone_name': fingerprint_key[1],
+        'record_fingerprints_view_dependency': fingerprint_key[2],
+        'record_fingerprints_record_id': record_id})
 
   def _AddRecordToIpIndex(self, record_type, zone_name, view_name, record_id,
                           target, record_args_dict):
@@ -3533,13 +3497,33 @@ class Core(object):
       target: string of the target of the record
       record_args_dict: dictionary of args for the record
     """
+    ip_index_row = self._GetIpIndexRow(record_type, zone_name, view_name,
+                                       record_id, target, record_args_dict)
+    if( ip_index_row ):
+      self.db_instance.MakeRow(*ip_index_row)
+
+  def _GetIpIndexRow(self, record_type, zone_name, view_name, record_id,
+                     target, record_args_dict):
+    """Gets the ipv4 or ipv6 index row of a record.
+
+    Inputs:
+      record_type: string of type of record
+      zone_name: string of zone name
+      view_name: string of view_name
+      record_id: int of id for record
+      target: string of the target of the record
+      record_args_dict: dictionary of args for the record
+
+    Outputs:
+      tuple: table name and row dict of the index row, None if the record
+             is not indexed
+    """
     ip = ''
     if( record_type == 'ptr' ):
       origin = self.db_instance.GetZoneOrigins(zone_name, view_name)[
           zone_name][0]
       ip = helpers_lib.UnReverseIP('%s.%s' % (target, origin))
-      if( self.db_instance.data_validation_instance is None ):
-        self.db_instance.InitDataValidation()
+      self.db_instance.CheckDataValidation()
       if( self.db_instance.data_validation_instance.isIPv4IPAddress(ip) ):
         record_type = 'a'
       elif( self.db_instance.data_validation_instance.isIPv6IPAddress(ip) ):
@@ -3548,21 +3532,23 @@ class Core(object):
     if( record_type == 'a' ):
       if( not ip ):
         ip = record_args_dict['assignment_ip']
-      decimal_ip = int(IPy.IP(ip).strDec())
+      decimal_ip = ip_lib.ParseIP(ip)[1]
       ipv4_index_dict = {'ipv4_dec_address': decimal_ip,
                          'ipv4_index_record_id': record_id}
-      self.db_instance.MakeRow('ipv4_index', ipv4_index_dict)
+      return ('ipv4_index', ipv4_index_dict)
 
     if( record_type == 'aaaa' ):
       if( not ip ):
         ip = record_args_dict['assignment_ip']
-      ip_obj = IPy.IP(ip)
-      decimal_ip_lower = ip_obj.int() & 0x0000000000000000ffffffffffffffff
-      decimal_ip_upper = ip_obj.int() >> 64
+      decimal_ip = ip_lib.ParseIP(ip)[1]
+      decimal_ip_lower = decimal_ip & 0x0000000000000000ffffffffffffffff
+      decimal_ip_upper = decimal_ip >> 64
       ipv6_index_dict = {'ipv6_dec_upper': decimal_ip_upper,
                          'ipv6_dec_lower': decimal_ip_lower,
                          'ipv6_index_record_id': record_id}
-      self.db_instance.MakeRow('ipv6_index', ipv6_index_dict)
+      return ('ipv6_index', ipv6_index_dict)
+
+    return None
 
 
   def _MakeCredential(self, credential, user_name, last_used=None,
@@ -3822,6 +3808,45 @@ class Core(object):
 
     return audit_log_rows
 
+  def ListGenerations(self):
+    """Lists the generations of everything that can change. A generation is
+    counted up by every committed transaction that changes it, so a cache
+    only needs to compare generations to know if it is still current.
+
+    Outputs:
+      dict: dictionary of generations keyed by generation name, the records
+            generations are keyed by zone name and view dependency
+        example: {u'views': 3, u'acls': 1, u'zones': 2, u'users': 5,
+                  u'named_conf': 1, u'reserved_words': 0,
+                  u'records': {u'university.edu': {u'internal_dep': 12,
+                                                   u'any': 3}}}
+    """
+    self.user_instance.Authorize('ListGenerations')
+    generation_dict = self.db_instance.GetEmptyRowDict('generations')
+    self.db_instance.StartTransaction()
+    try:
+      generation_rows = self.db_instance.ListRow('generations',
+                                                 generation_dict)
+    finally:
+      self.db_instance.EndTransaction()
+
+    generations = {u'records': {}}
+    for generation_name in constants.GENERATION_TABLES.itervalues():
+      generations[generation_name] = 0
+    for generation_row in generation_rows:
+      if( generation_row['generation_name'] == u'records' ):
+        zone_name = generation_row['generation_zone_name']
+        if( zone_name not in generations[u'records'] ):
+          generations[u'records'][zone_name] = {}
+        generations[u'records'][zone_name][
+            generation_row['generation_view_dependency']] = (
+                generation_row['generation'])
+      else:
+        generations[generation_row['generation_name']] = (
+            generation_row['generation'])
+
+    return generations
+
   def SetMaintenanceFlag(self, value):
     """Sets maintenance flag
 
@@ -38,6 +38,7 @@ __version__ = '#TRUNK#'
 import constants
 import errors
 import helpers_lib
+import ip_lib
 
 import datetime
 import dns.zone
@@ -323,8 +324,8 @@ class CoreHelpers(object):
       view_name: string of view name
       ttl: time to live
     """
-    record_args_dict['assignment_ip'] = unicode(IPy.IP(record_args_dict[
-        'assignment_ip']).strFullsize())
+    record_args_dict['assignment_ip'] = unicode(ip_lib.ExpandIP(
+        record_args_dict['assignment_ip']))
     self.core_instance.MakeRecord(u'aaaa', target, zone_name, record_args_dict,
                                   view_name, ttl)
 
@@ -684,7 +685,7 @@ class CoreHelpers(object):
             'record_arguments_records_assignments', 
             record_arguments_records_assignments_dict,
             column='ipv4_dec_address',
-            range_values=(decimal_ip_lower, decimal_ip_upper))
+            range_values=(decimal_ip_lower, decimal_ip_upper), compact=True)
       finally:
         self.db_instance.EndTransaction()
     elif( cidr_ip.version() == 6 ):
@@ -723,7 +724,7 @@ class CoreHelpers(object):
             'record_arguments_records_assignments',
             record_arguments_records_assignments_dict,
             column=column,
-            range_values=range_values)
+            range_values=range_values, compact=True)
       finally:
         self.db_instance.EndTransaction()
 
@@ -742,14 +743,14 @@ class CoreHelpers(object):
         parsed_record_dict[record_view] = {}
       if( u'ipv4_dec_address' in record_entry ):
         record_ip = u'%s' % (
-            IPy.IP(record_entry[u'ipv4_dec_address']).strNormal(1))
+            ip_lib.FormatIP(record_entry[u'ipv4_dec_address']))
         if( record_ip not in parsed_record_dict[record_view] ):
           parsed_record_dict[record_view][record_ip] = []
       elif( u'ipv6_dec_upper' in record_entry ):
         decimal_ip = (
             (record_entry[u'ipv6_dec_upper'] << 64) +
             (record_entry[u'ipv6_dec_lower']) )
-        record_ip = u'%s' % IPy.IP(decimal_ip).strFullsize(0)
+        record_ip = u'%s' % ip_lib.FormatIP(decimal_ip)
         if( record_ip not in parsed_record_dict[record_view] ):
           parsed_record_dict[record_view][record_ip] = []
       else:
@@ -844,8 +845,9 @@ class CoreHelpers(object):
     args_ipv4.append(ipv4_index_dict)
     self.db_instance.StartTransaction()
     try:
-      record_list = self.db_instance.ListRow(*args_ipv4)
-      record_list = record_list + self.db_instance.ListRow(*args_ipv6)
+      record_list = self.db_instance.ListRow(*args_ipv4, compact=True)
+      record_list = record_list + self.db_instance.ListRow(*args_ipv6,
+                                                           compact=True)
     finally:
       self.db_instance.EndTransaction()
     #Parsing Records
@@ -863,14 +865,14 @@ class CoreHelpers(object):
           parsed_record_dict[record_view] = {}
       if( u'ipv4_dec_address' in record_entry ):
         record_ip = u'%s' % (
-            IPy.IP(record_entry[u'ipv4_dec_address']).strNormal(1))
+            ip_lib.FormatIP(record_entry[u'ipv4_dec_address']))
         if( record_ip not in parsed_record_dict[record_view] ):
           parsed_record_dict[record_view][record_ip] = []
       elif( u'ipv6_dec_upper' in record_entry ):
         decimal_ip = (
             (record_entry[u'ipv6_dec_upper'] << 64) +
             (record_entry[u'ipv6_dec_lower']) )
-        record_ip = u'%s' % IPy.IP(decimal_ip).strFullsize(0)
+        record_ip = u'%s' % ip_lib.FormatIP(decimal_ip)
         if( record_ip not in parsed_record_dict[record_view] ):
           parsed_record_dict[record_view][record_ip] = []
       else:
@@ -929,7 +931,7 @@ class CoreHelpers(object):
     for view in records_dict:
       for ip in records_dict[view]:
         for record in records_dict[view][ip]:
-          target_sort.append(dict({'ip_address':IPy.IP(ip).strFullsize()}.items() + 
+          target_sort.append(dict({'ip_address':ip_lib.ExpandIP(ip)}.items() + 
                                   record.items()))
     sorted_list = sorted(target_sort, key=lambda x: x['host'])
     return sorted_list
@@ -1101,7 +1103,6 @@ class CoreHelpers(object):
       add_records: list of dictionaries of records
     
     Raises: 
-      RecordsBatchError: Record specification too broad
       RecordsBatchError: No record found
       RecordsBatchError: Record already exists
       RecordsBatchError: CNAME already exists
@@ -1126,7 +1127,11 @@ class CoreHelpers(object):
 
       self.db_instance.StartTransaction()
       try:
-        # REMOVE RECORDS
+        # FIND RECORDS TO REMOVE
+        self.db_instance.CheckDataValidation(writing=True)
+        record_args_assignment_dict = self.db_instance.GetEmptyRowDict(
+            'record_arguments_records_assignments')
+        delete_record_rows = []
         for record in delete_records:
           record_dict = self.db_instance.GetEmptyRowDict('records')
           record_dict['records_id'] = record['records_id']
@@ -1142,31 +1147,28 @@ class CoreHelpers(object):
                 '%s_dep' % record['record_view_dependency'])
           record_dict['record_zone_name'] = record['record_zone_name']
           record_dict['record_last_user'] = record['record_last_user']
-          record_args_dict = self.ConstructRecordArgsDictFromRecordID(
-              record['records_id'])
-
-          self.user_instance.Authorize('ProcessRecordsBatch',
-              record_data = {
-                  'target': record['record_target'],
-                  'zone_name': record['record_zone_name'],
-                  'view_name': record_dict['record_view_dependency'],
-                  'record_type': record['record_type'],
-                  'record_args_dict': record_args_dict},
-              current_transaction=True)
-
-          rows_deleted = self.db_instance.RemoveRow('records', record_dict)
-          log_dict['delete'].append(record)
-          row_count += 1
-          if( rows_deleted > 1 ):
-            raise errors.RecordsBatchError(
-                  'Record specification too broad, '
-                  'found %d matching records for %s.' % (
-                      rows_deleted, record_dict))
-          elif( rows_deleted == 0 ):
-            raise errors.RecordsBatchError(
-                  'No record found for :%s' % record_dict)
+          self.db_instance.data_validation_instance.ValidateRowDict(
+              'records', record_dict)
+          # One query both finds the record and gets its arguments.
+          record_rows = self.db_instance.ListRow(
+              'records', record_dict, 'record_arguments_records_assignments',
+              record_args_assignment_dict)
+          if( record_rows ):
+            record_args_dict = {}
+            for record_row in record_rows:
+              argument_value = record_row['argument_value']
+              if( argument_value.isdigit() ):
+                argument_value = int(argument_value)
+              record_args_dict[record_row[
+                  'record_arguments_records_assignments_argument_name']] = (
+                      argument_value)
+          else:
+            record_args_dict = self.ConstructRecordArgsDictFromRecordID(
+                record['records_id'])
+          delete_record_rows.append((record_dict, record_rows,
+                                     record_args_dict))
 
-        # ADD RECORDS
+        add_view_names = []
         for record in add_records:
 
           #Target length check
@@ -1179,19 +1181,90 @@ class CoreHelpers(object):
           if( not record['record_view_dependency'].endswith('_dep') and record[
                 'record_view_dependency'] != u'any'):
             view_name = '%s_dep' % record['record_view_dependency']
-          self.user_instance.Authorize('ProcessRecordsBatch',
-              record_data = {
-                  'target': record['record_target'],
-                  'zone_name': record['record_zone_name'],
-                  'view_name': view_name,
-                  'record_type': record['record_type'],
-                  'record_args_dict': record['record_arguments']},
-              current_transaction=True)
+          add_view_names.append(view_name)
+
+        # Every record is authorized at once, so that all of the records the
+        # user may not change are reported together.
+        authorize_records = []
+        for record, (record_dict, record_rows, record_args_dict) in zip(
+            delete_records, delete_record_rows):
+          authorize_records.append({
+              'target': record['record_target'],
+              'zone_name': record['record_zone_name'],
+              'view_name': record_dict['record_view_dependency'],
+              'record_type': record['record_type'],
+              'record_args_dict': record_args_dict})
+        for record, view_name in zip(add_records, add_view_names):
+          authorize_records.append({
+              'target': record['record_target'],
+              'zone_name': record['record_zone_name'],
+              'view_name': view_name,
+              'record_type': record['record_type'],
+              'record_args_dict': record['record_arguments']})
+        authorization_errors = self.user_instance.AuthorizeMany(
+            'ProcessRecordsBatch', authorize_records, current_transaction=True)
+        if( len(authorization_errors) == 1 ):
+          raise authorization_errors[0]
+        elif( authorization_errors ):
+          raise errors.AuthorizationError('\n'.join(
+              [str(error) for error in authorization_errors]))
+
+        # REMOVE RECORDS
+        delete_record_ids = []
+        for record, (record_dict, record_rows, record_args_dict) in zip(
+            delete_records, delete_record_rows):
+          log_dict['delete'].append(record)
+          row_count += 1
+          if( not record_rows or record['records_id'] in delete_record_ids ):
+            raise errors.RecordsBatchError(
+                  'No record found for :%s' % record_dict)
+          delete_record_ids.append(record['records_id'])
+        self.db_instance.RemoveRows('records', 'records_id', delete_record_ids)
+
+        # CHECK RECORDS TO ADD
+        # What is already in the database is looked up for the whole batch at
+        # once, then every record is checked in order against it and against
+        # the records before it in the batch.
+        target_keys = []
+        fingerprint_keys = []
+        for record, view_name in zip(add_records, add_view_names):
           if( record['record_type'] == u'ptr' ):
             if( record['record_arguments'][
                 'assignment_host'].startswith('@.') ):
               record['record_arguments']['assignment_host'] = record[
                   'record_arguments']['assignment_host'].lstrip('@.')
+          target_keys.append((record['record_zone_name'], view_name,
+                              record['record_target']))
+          fingerprint_keys.append((helpers_lib.GetRecordFingerprint(
+              record['record_type'], record['record_target'],
+              record['record_arguments']), record['record_zone_name'],
+              view_name))
+        target_record_types = self.db_instance.GetRecordTypesByTarget(
+            target_keys)
+        fingerprints = self.db_instance.GetRecordFingerprints(
+            fingerprint_keys)
+        for record, target_key, fingerprint_key in zip(
+            add_records, target_keys, fingerprint_keys):
+          record_types = target_record_types.setdefault(target_key, set())
+          if( record['record_type'] == 'cname' and record_types ):
+            raise errors.RecordsBatchError(
+                'Record already exists with target %s.' % (
+                record['record_target']))
+          if( u'cname' in record_types ):
+            raise errors.RecordsBatchError('CNAME already exists with target '
+                                           '%s.' % (record['record_target']))
+          if( fingerprint_key in fingerprints ):
+            raise errors.RecordsBatchError('Duplicate record found: %s' %
+                                           record)
+          record_types.add(record['record_type'])
+          fingerprints.add(fingerprint_key)
+
+        # ADD RECORDS
+        ip_index_rows = {}
+        record_argument_assignments = []
+        record_fingerprint_rows = []
+        for record, view_name, fingerprint_key in zip(
+            add_records, add_view_names, fingerprint_keys):
           changed_view_dep.append((view_name, record['record_zone_name']))
           ttl = None
           if( 'ttl' in record ):
@@ -1201,68 +1274,46 @@ class CoreHelpers(object):
 
           records_dict = {'records_id': None,
                           'record_target': record['record_target'],
-                          'record_type': None,
-                          'record_ttl': None,
+                          'record_type': record['record_type'],
+                          'record_ttl': ttl,
                           'record_zone_name': record['record_zone_name'],
                           'record_view_dependency': view_name,
-                          'record_last_user': None}
-
-          if( record['record_type'] == 'cname' ):
-            all_records = self.db_instance.ListRow('records', records_dict)
-            if( len(all_records) > 0 ):
-              raise errors.RecordsBatchError(
-                  'Record already exists with target %s.' % (
-                  record['record_target']))
-          records_dict['record_type'] = u'cname'
-          cname_records = self.db_instance.ListRow('records', records_dict)
-          if( len(cname_records) > 0 ):
-            raise errors.RecordsBatchError('CNAME already exists with target '
-                                           '%s.' % (record['record_target']))
-
-          record_args_assignment_dict = self.db_instance.GetEmptyRowDict(
-              'record_arguments_records_assignments')
-          records_dict['record_type'] = record['record_type']
-          raw_records = self.db_instance.ListRow(
-              'records', records_dict, 'record_arguments_records_assignments',
-              record_args_assignment_dict)
-          records_dict['record_last_user'] = self.user_instance.GetUserName()
-          records_dict['record_ttl'] = ttl
-          current_records = (
-              helpers_lib.GetRecordsFromRecordRowsAndArgumentRows(
-              raw_records, record['record_arguments']))
-          for current_record in current_records:
-            for arg in record['record_arguments'].keys():
-              if( arg not in current_record ):
-                break
-              if( record['record_arguments'][arg] is None ):
-                continue
-              if( record['record_arguments'][arg] != current_record[arg] ):
-                break
-            else:
-              raise errors.RecordsBatchError('Duplicate record found: %s' %
-                                             current_record)
-
-
-          records_dict['record_type'] = record['record_type']
+                          'record_last_user': self.user_instance.GetUserName()}
+          # One at a time, the ids of a multi-row insert are not known
           record_id = self.db_instance.MakeRow('records', records_dict)
+          record_fingerprint_rows.append(
+              {'record_fingerprint': fingerprint_key[0],
+               'record_fingerprints_zone_name': record['record_zone_name'],
+               'record_fingerprints_view_dependency': view_name,
+               'record_fingerprints_record_id': record_id})
           for arg in record['record_arguments'].keys():
-            record_argument_assignments_dict = {
+            record_argument_assignments.append({
                'record_arguments_records_assignments_record_id': record_id,
                'record_arguments_records_assignments_type': record[
                    'record_type'],
                'record_arguments_records_assignments_argument_name': arg,
-               'argument_value': unicode(record['record_arguments'][arg])}
-            self.db_instance.MakeRow('record_arguments_records_assignments',
-                                     record_argument_assignments_dict)
+               'argument_value': unicode(record['record_arguments'][arg])})
             log_dict['add'].append(record)
             row_count += 1
           if( records_dict['record_type'] in
               constants.RECORD_TYPES_INDEXED_BY_IP ):
-            self.core_instance._AddRecordToIpIndex(
+            ip_index_row = self.core_instance._GetIpIndexRow(
                 records_dict['record_type'], records_dict['record_zone_name'],
                 records_dict['record_view_dependency'],
                 record_id, records_dict['record_target'],
                 record['record_arguments'])
+            if( ip_index_row ):
+              ip_index_rows.setdefault(ip_index_row[0], []).append(
+                  ip_index_row[1])
+        # Every record was checked before any was added, so arguments,
+        # fingerprints and index rows are not needed until the batch is done.
+        self.db_instance.MakeRows('record_arguments_records_assignments',
+                                  record_argument_assignments)
+        self.db_instance.MakeRows('record_fingerprints',
+                                  record_fingerprint_rows)
+        for ip_index_table in sorted(ip_index_rows):
+          self.db_instance.MakeRows(ip_index_table,
+                                    ip_index_rows[ip_index_table])
         changed_view_dep = set(changed_view_dep)
         for view_dep_pair in changed_view_dep:
           self.core_instance._IncrementSoa(*view_dep_pair, missing_ok=zone_import)
@@ -40,11 +40,9 @@ import cPickle
 import datetime
 import re
 
-import IPy
-
 import constants
 import errors
-import helpers_lib
+import ip_lib
 
 from roster_core import punycode_lib
 
@@ -53,6 +51,42 @@ class DataValidation(object):
   def __init__(self, reserved_words, group_permissions):
     self.reserved_words = reserved_words
     self.group_permissions = group_permissions
+    # One pattern finds any reserved word in a single pass, the words are
+    # only scanned in order to name the word that was found.
+    self.reserved_words_regex = None
+    if( reserved_words ):
+      self.reserved_words_regex = re.compile(u'|'.join(
+          [re.escape(word.lower()) for word in reserved_words]))
+    self.group_permissions_set = frozenset(
+        [permission.lower() for permission in group_permissions])
+    self.row_validators = {}
+    for table_name, columns in constants.TABLES.iteritems():
+      self.row_validators[table_name] = self.MakeRowValidator(columns)
+
+  def MakeRowValidator(self, columns):
+    """Compiles the checks ValidateRowDict does for one table.
+
+    Inputs:
+      columns: dictionary of data types keyed by column name from
+               constants.TABLES
+
+    Outputs:
+      tuple: tuple of column checks and a dictionary of the same checks keyed
+             by column name. A column check is a tuple of column name, data
+             type, bound validator or None if there is no function to check
+             the data type, and if the column is an id column that may be None
+        example: ((('acl_name', 'UnicodeString', <bound method>, False),),
+                  {'acl_name': ('acl_name', 'UnicodeString', <bound method>,
+                                False)})
+    """
+    column_checks = []
+    for column_name, data_type in columns.iteritems():
+      column_checks.append((column_name, data_type,
+                            getattr(self, 'is%s' % data_type, None),
+                            column_name.endswith('_id')))
+    column_checks = tuple(column_checks)
+    return (column_checks, dict([(column_check[0], column_check) for
+                                 column_check in column_checks]))
 
   def isUnicodeString(self, u_string):
     """Checks that a string is unicode.
@@ -68,10 +102,13 @@ class DataValidation(object):
     """
     if( not isinstance(u_string, unicode) ):
       return False
-    for word in self.reserved_words:
-      if( u_string.lower().find(word.lower()) != -1 ):
-        raise errors.ReservedWordError('Reserved word %s found, unable '
-                                       'to complete request' % word)
+    if( self.reserved_words_regex is not None ):
+      lower_string = u_string.lower()
+      if( self.reserved_words_regex.search(lower_string) ):
+        for word in self.reserved_words:
+          if( lower_string.find(word.lower()) != -1 ):
+            raise errors.ReservedWordError('Reserved word %s found, unable '
+                                           'to complete request' % word)
 
     return True
 
@@ -97,10 +134,8 @@ class DataValidation(object):
     Outputs:
       bool: if group permission is valid or not
     """
-    group_permissions_list = [
-        permission.lower() for permission in self.group_permissions]
     if( self.isUnicodeString(group_permission) and
-        group_permission.lower() in group_permissions_list ):
+        group_permission.lower() in self.group_permissions_set ):
       return True
     return False
 
@@ -151,13 +186,12 @@ class DataValidation(object):
         not ip_address.find('/') == -1 ):
       return False
     try:
-      ip = IPy.IP(ip_address)
+      version, ip, prefix_length = ip_lib.ParseIP(ip_address)
     except ValueError:
       return False
-    if( not ip.strFullsize() == ip_address ):
+    if( not ip_lib.FormatIP(ip, version, prefix_length) == ip_address ):
       return False
-    if( not str(ip.netmask()) == 'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff' or
-        not ip.version() == 6 ):
+    if( not prefix_length == 128 or not version == 6 ):
       return False
     return True
 
@@ -177,7 +211,7 @@ class DataValidation(object):
         cidr_block.isdigit() ):
       return False
     try:
-      IPy.IP(cidr_block)
+      ip_lib.ParseIP(cidr_block)
     except ValueError:
       return False
     return True
@@ -348,24 +382,27 @@ class DataValidation(object):
       UnexpectedDataError: Invalid data type
       UnexpectedDataError: Need to fill out at least one value in dict
     """
-    main_dict = helpers_lib.GetRowDict(table_name)
-    for key in main_dict.iterkeys():
-      if( key not in row_dict ):
-        raise errors.UnexpectedDataError('Missing key %s in dictionary' % key)
+    column_checks, column_check_dict = self.row_validators.get(table_name,
+                                                              ((), {}))
+    for column_check in column_checks:
+      if( column_check[0] not in row_dict ):
+        raise errors.UnexpectedDataError('Missing key %s in dictionary' % (
+            column_check[0]))
 
     for key, value in row_dict.iteritems():
-      if( key not in main_dict ):
+      if( key not in column_check_dict ):
         raise errors.UnexpectedDataError('Dictionary has extra key that is not '
                                          'used: %s' % key)
+      column_name, data_type, validator, id_column = column_check_dict[key]
 
-      if( not 'is%s' % main_dict[key] in dir(self) ):
+      if( validator is None ):
         raise errors.FunctionError('No function to check data '
-                                   'type: %s' % main_dict[key])
-      if( not getattr(self, 'is%s' % main_dict[key])(value) ):
-        if( (not none_ok and not key.endswith('_id')) or
+                                   'type: %s' % data_type)
+      if( not validator(value) ):
+        if( (not none_ok and not id_column) or
             (none_ok and value is not None) ):
           raise errors.UnexpectedDataError('Invalid data type %s for %s: %s' % (
-              main_dict[key], key, value))
+              data_type, key, value))
 
     if( none_ok and not all_none_ok ):
       for value in row_dict.values():
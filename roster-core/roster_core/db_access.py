@@ -69,10 +69,9 @@ __license__ = 'BSD'
 __version__ = '#TRUNK#'
 
 
-import Queue
+import collections
 import threading
 import time
-import uuid
 import warnings
 
 import MySQLdb
@@ -84,15 +83,466 @@ import errors
 import helpers_lib
 import codecs
 
+def _ThreadLocalProperty(attribute_name, default=None):
+  """Creates a property that is stored separately for every thread.
+
+  Inputs:
+    attribute_name: string of attribute name in the thread local storage
+    default: value returned when the current thread has not set the attribute
+
+  Outputs:
+    property: property object to be placed on a class that has a
+              thread_state attribute
+  """
+  def GetAttribute(self):
+    return getattr(self.thread_state, attribute_name, default)
+  def SetAttribute(self, value):
+    setattr(self.thread_state, attribute_name, value)
+  return property(GetAttribute, SetAttribute)
+
+
+class ConnectionPool(object):
+  """This class keeps a bounded set of database connections that can be
+  checked out by one thread at a time.
+
+  The pool itself does not open connections, it only hands out slots and
+  idle connections. A slot that is checked out without a connection is
+  expected to be filled by the caller.
+
+  Threads waiting for a slot are served in the order they arrived. Every
+  waiter sleeps on its own condition and a returned slot wakes only the
+  waiter at the front of the line.
+  """
+
+  def __init__(self, pool_size, idle_timeout, wait_timeout=0):
+    """Instantiates the ConnectionPool class.
+
+    Inputs:
+      pool_size: integer of the maximum number of connections checked out
+                 at once
+      idle_timeout: integer of seconds an idle connection is kept before it
+                    is closed, 0 keeps idle connections forever
+      wait_timeout: integer of seconds to wait for a free slot before giving
+                    up, 0 waits forever
+    """
+    if( pool_size < 1 ):
+      raise errors.ConfigError('Connection pool size must be at least 1.')
+    self.pool_size = pool_size
+    self.idle_timeout = idle_timeout
+    self.wait_timeout = wait_timeout
+    # List of (connection, last_used) tuples, most recently used last.
+    self.idle_connections = []
+    self.free_slots = pool_size
+    # Conditions of the threads waiting for a slot, in arrival order.
+    self.waiters = collections.deque()
+    self.pool_lock = threading.Lock()
+    self.wait_count = 0
+    self.total_wait_time = 0.0
+    self.max_wait_time = 0.0
+
+  def CheckOut(self, blocking=True):
+    """Checks out a slot in the pool.
+
+    Inputs:
+      blocking: boolean of if the call should wait for a free slot
+
+    Raises:
+      TransactionError: No database connections available.
+      TransactionError: Timed out waiting for a database connection.
+
+    Outputs:
+      tuple of the most recently used idle MySQLdb connection and the time
+      it was last used, or (None, None) if no idle connection exists and the
+      caller must open one.
+    """
+    self.pool_lock.acquire()
+    try:
+      if( self.waiters or not self.free_slots ):
+        if( not blocking ):
+          raise errors.TransactionError('No database connections available.')
+        self.WaitForSlot()
+      self.free_slots -= 1
+      self.WakeNextWaiter()
+      self.EvictIdleConnections()
+      if( self.idle_connections ):
+        return self.idle_connections.pop()
+      return None, None
+    finally:
+      self.pool_lock.release()
+
+  def WaitForSlot(self):
+    """Waits in line until this thread is first and a slot is free.
+
+    This function expects pool_lock to be held.
+
+    Raises:
+      TransactionError: Timed out waiting for a database connection.
+    """
+    waiter = threading.Condition(self.pool_lock)
+    self.waiters.append(waiter)
+    start_time = time.time()
+    try:
+      while( self.waiters[0] is not waiter or not self.free_slots ):
+        if( self.wait_timeout ):
+          remaining = start_time + self.wait_timeout - time.time()
+          if( remaining <= 0 ):
+            raise errors.TransactionError('Timed out waiting for a database '
+                                          'connection.')
+          waiter.wait(remaining)
+        else:
+          waiter.wait()
+      self.waiters.popleft()
+    finally:
+      if( waiter in self.waiters ):
+        # This thread gave up its place, which may have been first in line.
+        self.waiters.remove(waiter)
+        self.WakeNextWaiter()
+      wait_time = time.time() - start_time
+      self.wait_count += 1
+      self.total_wait_time += wait_time
+      self.max_wait_time = max(self.max_wait_time, wait_time)
+
+  def WakeNextWaiter(self):
+    """Wakes the thread at the front of the line if a slot is free.
+
+    This function expects pool_lock to be held.
+    """
+    if( self.waiters and self.free_slots ):
+      self.waiters[0].notify()
+
+  def GetWaitStatistics(self):
+    """Reports how long threads have waited for a slot.
+
+    Outputs:
+      dictionary: keyed by statistic name
+        example: {'wait_count': 3, 'total_wait_time': 0.25,
+                  'max_wait_time': 0.125, 'waiting': 1}
+    """
+    self.pool_lock.acquire()
+    try:
+      return {'wait_count': self.wait_count,
+              'total_wait_time': self.total_wait_time,
+              'max_wait_time': self.max_wait_time,
+              'waiting': len(self.waiters)}
+    finally:
+      self.pool_lock.release()
+
+  def CheckIn(self, connection):
+    """Returns a slot to the pool.
+
+    Inputs:
+      connection: MySQLdb connection to keep for reuse or None
+    """
+    self.pool_lock.acquire()
+    try:
+      if( connection is not None ):
+        self.idle_connections.append((connection, time.time()))
+      self.EvictIdleConnections()
+      self.free_slots += 1
+      self.WakeNextWaiter()
+    finally:
+      self.pool_lock.release()
+
+  def EvictIdleConnections(self):
+    """Closes idle connections that have not been used within the idle
+    timeout.
+
+    This function expects pool_lock to be held.
+    """
+    if( not self.idle_timeout ):
+      return
+    oldest_allowed = time.time() - self.idle_timeout
+    while( self.idle_connections and
+           self.idle_connections[0][1] < oldest_allowed ):
+      CloseConnection(self.idle_connections.pop(0)[0])
+
+  def CloseIdleConnections(self):
+    """Closes every idle connection in the pool."""
+    self.pool_lock.acquire()
+    try:
+      while( self.idle_connections ):
+        CloseConnection(self.idle_connections.pop()[0])
+    finally:
+      self.pool_lock.release()
+
+
+class QueryPlanCache(object):
+  """This class is a least recently used cache of finished queries keyed by
+  the shape of the call that produced them.
+  """
+
+  def __init__(self, max_size):
+    """Instantiates the QueryPlanCache class.
+
+    Inputs:
+      max_size: integer of the maximum number of plans kept
+    """
+    self.max_size = max_size
+    self.plans = collections.OrderedDict()
+    self.cache_lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def GetPlan(self, plan_key):
+    """Gets a plan and marks it as most recently used.
+
+    Inputs:
+      plan_key: hashable key of the plan
+
+    Outputs:
+      the cached plan or None if it is not cached
+    """
+    self.cache_lock.acquire()
+    try:
+      plan = self.plans.pop(plan_key, None)
+      if( plan is None ):
+        self.misses += 1
+      else:
+        self.hits += 1
+        self.plans[plan_key] = plan
+      return plan
+    finally:
+      self.cache_lock.release()
+
+  def AddPlan(self, plan_key, plan):
+    """Adds a plan, evicting the least recently used plan if full.
+
+    Inputs:
+      plan_key: hashable key of the plan
+      plan: plan to cache
+    """
+    self.cache_lock.acquire()
+    try:
+      self.plans[plan_key] = plan
+      while( len(self.plans) > self.max_size ):
+        self.plans.popitem(last=False)
+    finally:
+      self.cache_lock.release()
+
+  def GetStatistics(self):
+    """Reports how well the cache is doing.
+
+    Outputs:
+      dictionary: keyed by statistic name
+        example: {'hits': 10, 'misses': 2, 'size': 2}
+    """
+    self.cache_lock.acquire()
+    try:
+      return {'hits': self.hits, 'misses': self.misses,
+              'size': len(self.plans)}
+    finally:
+      self.cache_lock.release()
+
+
+class ForeignKeyGraph(object):
+  """This class holds the foreign keys of a database and the join
+  predicates they give for sets of tables.
+
+  One instance is shared read-only by every dbAccess instance in the process
+  that uses the same database, see GetForeignKeyGraph.
+  """
+
+  def __init__(self, foreign_keys):
+    """Instantiates the ForeignKeyGraph class.
+
+    Inputs:
+      foreign_keys: list of dicts with table_name, column_name,
+                    referenced_table_name and referenced_column_name keys
+    """
+    self.foreign_keys = tuple(foreign_keys)
+    # Join predicates keyed by frozenset of table names.
+    self.join_predicates = {}
+    for table_names in constants.JOINED_TABLES:
+      self.GetJoinPredicates(table_names)
+
+  def GetJoinPredicates(self, table_names):
+    """Gets the join predicates for a set of tables.
+
+    Inputs:
+      table_names: list of table names
+
+    Outputs:
+      tuple of strings of join predicates
+        example: ('(credentials.credential_user_name=users.user_name)',)
+    """
+    table_set = frozenset(table_names)
+    predicates = self.join_predicates.get(table_set)
+    if( predicates is None ):
+      predicates = []
+      for key in self.foreign_keys:
+        if( key['table_name'] in table_set and
+            key['referenced_table_name'] in table_set ):
+          predicates.append('(%(table_name)s.%(column_name)s='
+                            '%(referenced_table_name)s.'
+                            '%(referenced_column_name)s)' % key)
+      predicates = tuple(predicates)
+      self.join_predicates[table_set] = predicates
+    return predicates
+
+
+# ForeignKeyGraph instances keyed by database host and name.
+foreign_key_graphs = {}
+foreign_key_graphs_lock = threading.Lock()
+
+# ListRow QueryPlanCache instances keyed by database host and name, plans only
+# depend on table and column names so every user of a database shares them.
+list_row_plan_caches = {}
+list_row_plan_caches_lock = threading.Lock()
+
+# Generations of the tables DataValidation is built from, keyed by database
+# host and name. A generation is bumped when a transaction that changed one of
+# constants.DATA_VALIDATION_TABLES commits.
+data_validation_generations = {}
+# Tuples of generation and DataValidation instance keyed by database host and
+# name, shared by every instance using the database.
+data_validation_instances = {}
+data_validation_lock = threading.Lock()
+
+# Generations of the tables user authorization is built from, keyed by
+# database host and name. A generation is bumped when a transaction that
+# changed one of constants.AUTHORIZATION_TABLES commits.
+authorization_generations = {}
+authorization_lock = threading.Lock()
+
+# Tuples of generation and view dependency graph keyed by database host and
+# name, and their generations, bumped when a transaction that changed one of
+# constants.VIEW_DEPENDENCY_TABLES commits.
+view_dependency_graphs = {}
+view_dependency_generations = {}
+view_dependency_lock = threading.Lock()
+
+# Tuples of maintenance flag and the time it expires keyed by database host
+# and name, and generations that are bumped whenever the flag changes in this
+# process so a flag read before the change is never cached.
+maintenance_flags = {}
+maintenance_flag_generations = {}
+maintenance_flag_lock = threading.Lock()
+
+
+class CompactRow(object):
+  """Base class of the compact rows returned by ListRow and IterRow when
+  compact is set.
+
+  Every query plan gets its own subclass with a slot per column, so a row
+  only stores its values. Rows can be read and changed like the dicts the
+  DictCursor returns.
+  """
+  __slots__ = ()
+
+  def __init__(self, values):
+    """Sets the columns of the row.
+
+    Inputs:
+      values: tuple of column values in the order of __slots__
+    """
+    for column_name, value in zip(self.__slots__, values):
+      setattr(self, column_name, value)
+
+  def __getitem__(self, column_name):
+    if( column_name not in self.__slots__ ):
+      raise KeyError(column_name)
+    return getattr(self, column_name)
+
+  def __setitem__(self, column_name, value):
+    if( column_name not in self.__slots__ ):
+      raise KeyError(column_name)
+    setattr(self, column_name, value)
+
+  def __contains__(self, column_name):
+    return column_name in self.__slots__
+
+  def __iter__(self):
+    return iter(self.__slots__)
+
+  def __len__(self):
+    return len(self.__slots__)
+
+  def __eq__(self, other):
+    return dict(self.items()) == dict(other.items())
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return repr(dict(self.items()))
+
+  def get(self, column_name, default=None):
+    if( column_name not in self.__slots__ ):
+      return default
+    return getattr(self, column_name)
+
+  def keys(self):
+    return list(self.__slots__)
+
+  def items(self):
+    return [(column_name, getattr(self, column_name)) for
+            column_name in self.__slots__]
+
+
+def MakeCompactRowClass(column_names):
+  """Makes a CompactRow subclass for the columns of a query.
+
+  Inputs:
+    column_names: list of column names, optionally prefixed with the table
+                  name as in 'users.user_name'
+
+  Outputs:
+    class: CompactRow subclass with a slot per column
+  """
+  return type('CompactRow', (CompactRow,), {
+      '__slots__': tuple([str(column_name.split('.')[-1]) for
+                          column_name in column_names])})
+
+
+def CloseConnection(connection):
+  """Closes a connection, ignoring errors from connections that are already
+  broken.
+
+  Inputs:
+    connection: MySQLdb connection
+  """
+  try:
+    connection.close()
+  except MySQLdb.Error:
+    pass
+
+
 class dbAccess(object):
   """This class provides the primary interface for connecting and interacting
    with the roster database.
+
+   Connections are kept in a ConnectionPool, every thread that starts a
+   transaction checks out its own connection and cursor and returns them
+   when the transaction ends.
    """
 
+  # Every thread gets its own connection, cursor and transaction state.
+  transaction_init = _ThreadLocalProperty('transaction_init', False)
+  connection = _ThreadLocalProperty('connection')
+  cursor = _ThreadLocalProperty('cursor')
+  locked_db = _ThreadLocalProperty('locked_db', False)
+  big_lock_checked = _ThreadLocalProperty('big_lock_checked', False)
+  statement_executed = _ThreadLocalProperty('statement_executed', False)
+  changed_tables = _ThreadLocalProperty('changed_tables')
+  changed_generations = _ThreadLocalProperty('changed_generations')
+  changed_soa_serials = _ThreadLocalProperty('changed_soa_serials')
+  changed_zone_soa_serials = _ThreadLocalProperty('changed_zone_soa_serials')
+  database_generations = _ThreadLocalProperty('database_generations')
+  data_validation_checked = _ThreadLocalProperty('data_validation_checked',
+                                                 False)
+  transaction_generation = _ThreadLocalProperty('transaction_generation')
+  transaction_maintenance_flag_generation = _ThreadLocalProperty(
+      'transaction_maintenance_flag_generation')
+  transaction_view_dependency_generation = _ThreadLocalProperty(
+      'transaction_view_dependency_generation')
+
   def __init__(self, db_host, db_user, db_passwd, db_name, big_lock_timeout,
                big_lock_wait, thread_safe=True, ssl=False, ssl_ca=None,
                ssl_cert=None, ssl_key=None, ssl_capath=None, ssl_cipher=None,
-               db_debug=False, db_debug_log=None):
+               db_debug=False, db_debug_log=None, connection_pool_size=1,
+               connection_idle_timeout=0, connection_wait_timeout=0,
+               connection_probe_idle=0, maintenance_flag_ttl=0,
+               audit_log_write_behind=False, authorization_ttl=0):
     """Instantiates the db_access class.
 
     Inputs:
@@ -103,7 +553,27 @@ class dbAccess(object):
       big_lock_timeout: integer of how long the big lock should be valid for
       big_lock_wait: integer of how long to wait for proccesses to finish
                      before locking the database
-      thread_safe: boolean of if db_acceess should be thread safe
+      thread_safe: boolean of if db_acceess should be thread safe, threads
+                   wait for a free connection instead of raising a
+                   TransactionError
+      connection_pool_size: integer of how many connections can be open
+                            at once
+      connection_idle_timeout: integer of seconds an unused connection is
+                               kept open, 0 keeps them open
+      connection_wait_timeout: integer of seconds to wait for a free
+                               connection, 0 waits forever
+      connection_probe_idle: integer of seconds a connection can be idle
+                             before it is checked with a probe query,
+                             0 checks it on every transaction
+      maintenance_flag_ttl: integer of seconds the maintenance flag is cached
+                            for, 0 does not cache it
+      audit_log_write_behind: boolean of if audit logs of this database are
+                              written by a background thread, see
+                              audit_log.AuditLog
+      authorization_ttl: integer of seconds user authorization snapshots are
+                         used for before the generations table is read to
+                         find changes made by other processes, 0 reads it
+                         every time
     """
     # Do some better checking of these args
     self.db_host = db_host
@@ -112,6 +582,8 @@ class dbAccess(object):
     self.db_name = db_name
     self.big_lock_timeout = big_lock_timeout
     self.big_lock_wait = big_lock_wait
+    # MySQL named locks are server wide, so the name includes the database.
+    self.big_lock_name = '%s.db_lock_lock' % db_name
     self.ssl = ssl
     self.ssl_ca = ssl_ca
     self.ssl_settings = {}
@@ -122,36 +594,42 @@ class dbAccess(object):
         self.ssl_settings['ca'] = ssl_ca
       else:
         raise errors.ConfigError('ssl_ca not specified in config file.')
-    self.transaction_init = False
-    self.connection = None
-    self.cursor = None
-    # This is generated only when ListRow is called and is then cached for
-    # the life of the object.
-    self.foreign_keys = []
+    self.thread_state = threading.local()
     self.data_validation_instance = None
-    self.locked_db = False
+    self.data_validation_generation = None
+    self.data_validation_database_generation = None
     self.thread_safe = thread_safe
-    self.queue = Queue.Queue()
-    self.now_serving = None
-    self.queue_update_lock = threading.Lock()
+    self.connection_probe_idle = connection_probe_idle
+    self.maintenance_flag_ttl = maintenance_flag_ttl
+    self.audit_log_write_behind = audit_log_write_behind
+    self.authorization_ttl = authorization_ttl
+    self.connection_pool = ConnectionPool(connection_pool_size,
+                                          connection_idle_timeout,
+                                          connection_wait_timeout)
 
   def close(self):
-    """Closes a connection that has been opened. 
+    """Closes connections that have been opened and are not in use.
 
     A new connection will be created on StartTransaction.
     """
-    if( self.connection is not None ):
-      self.connection.close()
-    self.connection = None
+    self.connection_pool.CloseIdleConnections()
 
 
-  def cursor_execute(self, execution_string, values={}):
+  def cursor_execute(self, execution_string, values={}, cursor_class=None):
     """This function allows for the capture of every mysql command that
        is run in this class. 
 
+    If the connection turns out to be lost on the first statement of a
+    transaction, the connection is replaced and the statement is run again.
+
     Inputs:
       execution_string: mysql command string
       values: dictionary of values for mysql command
+      cursor_class: MySQLdb cursor class to run the command on a new cursor
+                    of, by default self.cursor is used
+
+    Outputs:
+      MySQLdb cursor the command was run on
     """
     if( self.db_debug ):
       if( self.db_debug_log ):
@@ -165,8 +643,24 @@ class dbAccess(object):
         debug_log_handle.close()
       else:
         print execution_string % values
+    if( cursor_class is None ):
+      cursor = self.cursor
+    else:
+      cursor = self.connection.cursor(cursor_class)
     try:
-      self.cursor.execute(execution_string, values)
+      try:
+        cursor.execute(execution_string, values)
+      except MySQLdb.OperationalError, e:
+        if( self.statement_executed or
+            e[0] not in errors.LOST_CONNECTION_MYSQL_ERRORS ):
+          raise
+        self.Reconnect()
+        if( cursor_class is None ):
+          cursor = self.cursor
+        else:
+          cursor = self.connection.cursor(cursor_class)
+        cursor.execute(execution_string, values)
+      self.statement_executed = True
     except MySQLdb.ProgrammingError:
       raise
     except MySQLdb.Error, e:
@@ -174,140 +668,484 @@ class dbAccess(object):
         raise errors.DatabaseError(e)
       else:
         raise
+    return cursor
     
+  def Connect(self):
+    """Opens a new connection to the database.
+
+    Outputs:
+      MySQLdb connection
+    """
+    if( self.ssl ):
+      return MySQLdb.connect(
+          host=self.db_host, user=self.db_user, passwd=self.db_passwd,
+          db=self.db_name, use_unicode=True, charset='utf8',
+          ssl=self.ssl_settings)
+    return MySQLdb.connect(
+        host=self.db_host, user=self.db_user, passwd=self.db_passwd,
+        db=self.db_name, use_unicode=True, charset='utf8')
+
+  def Reconnect(self):
+    """Replaces the connection of the calling thread with a new one."""
+    if( self.connection is not None ):
+      CloseConnection(self.connection)
+    self.connection = None
+    self.connection = self.Connect()
+    self.cursor = self.connection.cursor(MySQLdb.cursors.DictCursor)
     
   def StartTransaction(self):
     """Starts a transaction.
 
-    Also it starts a db connection if none exists or it times out.
-    Always creates a new cursor.
+    Checks a connection out of the connection pool for the calling thread.
+    A connection that has been idle for connection_probe_idle seconds is
+    checked with a probe query and replaced if it has timed out. Always
+    creates a new cursor.
     
-    This function also serializes all requests on this object and if the 
-    big lock has been activated will wait for it to be released.
+    In thread safe mode this function waits for a free connection. Waiting
+    for the big lock is left to the first write of the transaction, see
+    WaitForBigLock.
+
+    A DataValidation instance that is older than the current generation of
+    constants.DATA_VALIDATION_TABLES is loaded again. One that is older than
+    the reserved_words generation of the generations table is loaded again
+    the first time it is used in the transaction, see CheckDataValidation.
 
     Raises:
       TransactionError: Cannot start new transaction last transaction not
                         committed or rolled-back.
+      TransactionError: Timed out waiting for a database connection.
     """
+    if( self.transaction_init ):
+      raise errors.TransactionError('Cannot start new transaction last '
+                                    'transaction not committed or '
+                                    'rolled-back.')
     if( self.thread_safe ):
-      unique_id = uuid.uuid4()
-      self.queue.put(unique_id)
-
-      while_sleep = 0
-      while( unique_id != self.now_serving ):
-        time.sleep(while_sleep)
-        self.queue_update_lock.acquire()
-        if( self.now_serving is None ):
-          self.now_serving = self.queue.get()
-        self.queue_update_lock.release()
-        while_sleep = 0.005
-
+      connection, last_used = self.connection_pool.CheckOut()
     else:
-      if( self.transaction_init ):
+      try:
+        connection, last_used = self.connection_pool.CheckOut(blocking=False)
+      except errors.TransactionError:
         raise errors.TransactionError('Cannot start new transaction last '
                                       'transaction not committed or '
                                       'rolled-back.')
-
-    if( self.connection is not None ):
-      try:
-        self.cursor = self.connection.cursor(MySQLdb.cursors.DictCursor)
-        self.cursor_execute('DO 0') # NOOP to test connection
-      except MySQLdb.OperationalError:
-        self.connection = None
-
-    if( self.connection is None ):
-      if( self.ssl ):
-        self.connection = MySQLdb.connect(
-            host=self.db_host, user=self.db_user, passwd=self.db_passwd,
-            db=self.db_name, use_unicode=True, charset='utf8',
-            ssl=self.ssl_settings)
+    self.statement_executed = False
+    # Read before the transaction reads anything, see CheckMaintenanceFlag
+    # and GetViewDependencyGraph
+    self.transaction_maintenance_flag_generation = (
+        maintenance_flag_generations.get((self.db_host, self.db_name), 0))
+    self.transaction_view_dependency_generation = (
+        view_dependency_generations.get((self.db_host, self.db_name), 0))
+    try:
+      if( connection is None ):
+        self.Reconnect()
       else:
-        self.connection = MySQLdb.connect(
-            host=self.db_host, user=self.db_user, passwd=self.db_passwd,
-            db=self.db_name, use_unicode=True, charset='utf8')
-      self.cursor = self.connection.cursor(MySQLdb.cursors.DictCursor)
-
-    while_sleep = 0
-    db_lock_locked = 1
-    while( db_lock_locked ):
-      time.sleep(while_sleep)
-      try:
-        self.cursor_execute('SELECT `locked`, `lock_last_updated`, '
-                            'NOW() as `now` from `locks` WHERE '
-                            '`lock_name`="db_lock_lock"')
-        rows = self.cursor.fetchall()
-      except MySQLdb.ProgrammingError:
-        break
-      if( not rows ):
-        break
-      lock_last_updated = rows[0]['lock_last_updated']
-      db_lock_locked = rows[0]['locked']
-      now = rows[0]['now']
-      if( (now - lock_last_updated).seconds > self.big_lock_timeout ):
-        break
-      while_sleep = 1
+        self.connection = connection
+        self.cursor = self.connection.cursor(MySQLdb.cursors.DictCursor)
+        if( time.time() - last_used >= self.connection_probe_idle ):
+          self.cursor_execute('DO 0') # NOOP to test connection
+          self.statement_executed = False
+    except:
+      self.connection_pool.CheckIn(self.connection)
+      self.connection = None
+      self.cursor = None
+      raise
 
+    self.big_lock_checked = False
+    self.changed_tables = set()
+    self.changed_generations = set()
+    self.changed_soa_serials = {}
+    self.changed_zone_soa_serials = {}
+    self.database_generations = None
+    self.data_validation_checked = False
+    self.transaction_generation = self.GetDataValidationGeneration()
     self.transaction_init = True
 
+    if( self.data_validation_instance is not None and
+        self.data_validation_generation != self.transaction_generation ):
+      try:
+        self.InitDataValidation()
+      except:
+        self.EndTransaction(rollback=True)
+        raise
+      self.statement_executed = False
+
   def EndTransaction(self, rollback=False):
     """Ends a transaction.
 
     Also does some simple checking to make sure a connection was open first
-    and releases itself from the current queue.
+    and returns the connection to the connection pool. SOA serials and
+    generations changed by the transaction are counted up just before it is
+    committed, the transaction is rolled back if that fails.
 
     Inputs:
       rollback: boolean of if the transaction should be rolled back
 
     Raises:
       TransactionError: Must run StartTansaction before EndTransaction.
+      InvalidInputError: Multiple SOA records found.
+      RecordError: No SOA record found for zone.
     """
-    if( not self.thread_safe ):
-      if( not self.transaction_init ):
+    if( not self.transaction_init ):
+      if( not self.thread_safe ):
         raise errors.TransactionError('Must run StartTansaction before '
                                       'EndTransaction.')
+      return
 
+    connection = self.connection
     try:
+      if( not rollback ):
+        try:
+          self.IncrementSoaSerials()
+          self.CountGenerations()
+        except:
+          self.cursor.close()
+          connection.rollback()
+          raise
       self.cursor.close()
       if( rollback ):
-        self.connection.rollback()
+        connection.rollback()
       else:
-        self.connection.commit()
+        connection.commit()
+        if( self.changed_tables.intersection(
+            constants.DATA_VALIDATION_TABLES) ):
+          self.BumpDataValidationGeneration()
+        if( self.changed_tables.intersection(
+            constants.AUTHORIZATION_TABLES) ):
+          self.BumpAuthorizationGeneration()
+        if( self.changed_tables.intersection(
+            constants.VIEW_DEPENDENCY_TABLES) ):
+          self.BumpViewDependencyGeneration()
+        if( 'locks' in self.changed_tables ):
+          self.ClearMaintenanceFlagCache()
 
     finally:
+      self.changed_tables = None
+      self.changed_generations = None
+      self.changed_soa_serials = None
+      self.changed_zone_soa_serials = None
+      self.database_generations = None
       self.transaction_init = False
-      if( self.thread_safe ):
-        if( not self.queue.empty() ):
-          self.now_serving = self.queue.get()
-        else:
-          self.now_serving = None
+      self.cursor = None
+      self.connection = None
+      self.connection_pool.CheckIn(connection)
+
+  def MarkGenerationChanged(self, generation_name, zone_name=u'',
+                            view_dependency=u''):
+    """Marks a generation to be counted up when the current transaction
+    commits. Generations of tables in constants.GENERATION_TABLES are marked
+    by the functions that change them, this is for the record generations of
+    zones and view dependencies.
+
+    Inputs:
+      generation_name: string of generation name
+      zone_name: string of zone name
+      view_dependency: string of view dependency
+
+    Raises:
+      TransactionError: Must run StartTansaction before changing generations.
+    """
+    if( not self.transaction_init ):
+      raise errors.TransactionError('Must run StartTansaction before '
+                                    'changing generations.')
+    self.changed_generations.add((generation_name, zone_name, view_dependency))
+
+  def GetDatabaseGenerations(self, generation_names):
+    """Gets generations from the generations table, where changes committed
+    by every process are counted. All of them are read with one query the
+    first time this is run in a transaction, later runs in the same
+    transaction return what was read then.
+
+    A transaction is started if one is not already running.
+
+    Inputs:
+      generation_names: list of generation names from
+                        constants.GENERATION_TABLES
+
+    Outputs:
+      tuple: generations in the order of generation_names, 0 for generations
+             that have never been counted
+    """
+    own_transaction = not self.transaction_init
+    if( own_transaction ):
+      self.StartTransaction()
+    try:
+      if( self.database_generations is None ):
+        self.cursor_execute('SELECT generation_name, generation FROM '
+                            'generations WHERE generation_zone_name="" AND '
+                            'generation_view_dependency=""')
+        database_generations = {}
+        for row in self.cursor.fetchall():
+          database_generations[row['generation_name']] = row['generation']
+        self.database_generations = database_generations
+      generations = []
+      for generation_name in generation_names:
+        generations.append(self.database_generations.get(generation_name, 0))
+    finally:
+      if( own_transaction ):
+        self.EndTransaction()
+    return tuple(generations)
+
+  def MarkAllGenerationsChanged(self):
+    """Marks every generation to be counted up when the current transaction
+    commits, for changes made without MakeRow such as loading a dump. The
+    records generations of every zone and view dependency are counted up
+    right away in the same transaction.
+
+    Raises:
+      TransactionError: Must run StartTansaction before changing generations.
+    """
+    if( not self.transaction_init ):
+      raise errors.TransactionError('Must run StartTansaction before '
+                                    'changing generations.')
+    self.changed_tables.update(constants.GENERATION_TABLES.iterkeys())
+    self.changed_tables.add('locks')
+    self.cursor_execute('UPDATE generations SET generation=generation+1 '
+                        'WHERE generation_name=%(generation_name)s',
+                        {'generation_name': u'records'})
+
+  def CountGenerations(self):
+    """Counts up every generation changed by the current transaction with
+    one query in the same transaction.
+
+    Rows are always written in the same order so that transactions committing
+    the same generations wait for each other instead of deadlocking.
+    """
+    generation_keys = set(self.changed_generations)
+    for table_name in self.changed_tables:
+      if( table_name in constants.GENERATION_TABLES ):
+        generation_keys.add(
+            (constants.GENERATION_TABLES[table_name], u'', u''))
+    if( not generation_keys ):
+      return
+    value_rows = []
+    values_dict = {}
+    for index, generation_key in enumerate(sorted(generation_keys)):
+      value_rows.append('(%%(name_%s)s,%%(zone_%s)s,%%(view_%s)s,1)' % (
+          index, index, index))
+      values_dict['name_%s' % index] = generation_key[0]
+      values_dict['zone_%s' % index] = generation_key[1]
+      values_dict['view_%s' % index] = generation_key[2]
+    self.cursor_execute('INSERT INTO generations (generation_name, '
+                        'generation_zone_name, generation_view_dependency, '
+                        'generation) VALUES %s ON DUPLICATE KEY UPDATE '
+                        'generation=generation+1' % ','.join(value_rows),
+                        values_dict)
+
+  def MarkSoaSerialChanged(self, zone_name, view_dependency,
+                           missing_ok=False):
+    """Marks the SOA serial of a zone in a view dependency to be incremented
+    once when the current transaction commits, however many times it is
+    marked.
+
+    Inputs:
+      zone_name: string of zone name
+      view_dependency: string of view dependency
+      missing_ok: boolean of whether or not a missing SOA record is allowed
+
+    Raises:
+      TransactionError: Must run StartTansaction before changing SOA serials.
+    """
+    if( not self.transaction_init ):
+      raise errors.TransactionError('Must run StartTansaction before '
+                                    'changing SOA serials.')
+    soa_key = (zone_name, view_dependency)
+    self.changed_soa_serials[soa_key] = self.changed_soa_serials.get(
+        soa_key, True) and missing_ok
+
+  def MarkZoneSoaSerialsChanged(self, zone_name, missing_ok=False):
+    """Marks the SOA serials of a zone in every view dependency it is
+    assigned to, along with their record generations, to be counted up when
+    the current transaction commits. The view dependencies of every zone
+    marked are read with one query then, see MarkSoaSerialChanged.
+
+    Inputs:
+      zone_name: string of zone name
+      missing_ok: boolean of whether or not missing SOA records are allowed
+
+    Raises:
+      TransactionError: Must run StartTansaction before changing SOA serials.
+    """
+    if( not self.transaction_init ):
+      raise errors.TransactionError('Must run StartTansaction before '
+                                    'changing SOA serials.')
+    self.changed_zone_soa_serials[zone_name] = (
+        self.changed_zone_soa_serials.get(zone_name, True) and missing_ok)
+
+  def IncrementSoaSerials(self):
+    """Increments every SOA serial marked by the current transaction with
+    one query in the same transaction, wrapping around to 1 after
+    constants.MAX_SOA_SERIAL. The serials are counted up by the database so
+    concurrent transactions can not overwrite each other's increments. Zones
+    marked with MarkZoneSoaSerialsChanged are looked up first, and the SOA
+    records of every zone are counted before anything is incremented.
+
+    Raises:
+      InvalidInputError: Multiple SOA records found.
+      RecordError: No SOA record found for zone.
+    """
+    if( self.changed_zone_soa_serials ):
+      zone_view_dependencies = self.GetZoneOriginsByView(
+          self.changed_zone_soa_serials.keys())
+      for zone_name, missing_ok in self.changed_zone_soa_serials.iteritems():
+        for view_dependency in zone_view_dependencies.get(zone_name, {}):
+          self.MarkGenerationChanged(u'records', zone_name, view_dependency)
+          if( view_dependency != u'any' ):
+            self.MarkSoaSerialChanged(zone_name, view_dependency,
+                                      missing_ok=missing_ok)
+      self.changed_zone_soa_serials = {}
+    if( not self.changed_soa_serials ):
+      return
+    soa_searches = []
+    values_dict = {'max_soa_serial': constants.MAX_SOA_SERIAL}
+    for index, soa_key in enumerate(sorted(self.changed_soa_serials)):
+      soa_searches.append('(record_zone_name=%%(zone_%s)s AND '
+                          'record_view_dependency=%%(view_%s)s)' % (
+                              index, index))
+      values_dict['zone_%s' % index] = soa_key[0]
+      values_dict['view_%s' % index] = soa_key[1]
+    self.WaitForBigLock()
+    # Every zone is counted, a zone with two SOA records and another with
+    # none would update as many rows as expected. The records are locked so
+    # they are still the ones counted when they are updated.
+    self.cursor_execute(
+        'SELECT record_zone_name, record_view_dependency, COUNT(*) AS '
+        'soa_count FROM records WHERE record_type="soa" AND (%s) GROUP BY '
+        'record_zone_name, record_view_dependency FOR UPDATE' % ' OR '.join(
+            soa_searches), values_dict)
+    soa_counts = {}
+    for row in self.cursor.fetchall():
+      soa_counts[(row['record_zone_name'],
+                  row['record_view_dependency'])] = row['soa_count']
+    for soa_key in sorted(self.changed_soa_serials):
+      soa_count = soa_counts.get(soa_key, 0)
+      if( soa_count > 1 ):
+        raise errors.InvalidInputError(
+            'Multiple SOA records found for zone "%s" view "%s".' % soa_key)
+      if( soa_count == 0 and not self.changed_soa_serials[soa_key] ):
+        raise errors.RecordError(
+            'No SOA record found for zone "%s" view "%s".' % soa_key)
+
+    self.changed_tables.add('record_arguments_records_assignments')
+    self.cursor_execute(
+        'UPDATE record_arguments_records_assignments JOIN records ON '
+        'record_arguments_records_assignments_record_id=records_id SET '
+        'argument_value=IF(CAST(argument_value AS UNSIGNED)>='
+        '%%(max_soa_serial)s,1,CAST(argument_value AS UNSIGNED)+1) WHERE '
+        'record_type="soa" AND '
+        'record_arguments_records_assignments_argument_name="serial_number" '
+        'AND (%s)' % ' OR '.join(soa_searches), values_dict)
 
   def CheckMaintenanceFlag(self):
     """Checks the maintenance flag in the database.
 
+    The flag read is cached for maintenance_flag_ttl seconds for
+    GetCachedMaintenanceFlag, unless it changed in this process since the
+    transaction started.
+
     Outputs:
       bool: boolean of maintenance mode
     """
     row = self.ListRow('locks', {'lock_name': u'maintenance', 'locked': None})
-    return bool(row[0]['locked'])
+    maintenance_flag = bool(row[0]['locked'])
+    if( self.maintenance_flag_ttl ):
+      maintenance_key = (self.db_host, self.db_name)
+      maintenance_flag_lock.acquire()
+      try:
+        if( maintenance_flag_generations.get(maintenance_key, 0) ==
+            self.transaction_maintenance_flag_generation ):
+          maintenance_flags[maintenance_key] = (
+              maintenance_flag, time.time() + self.maintenance_flag_ttl)
+      finally:
+        maintenance_flag_lock.release()
+    return maintenance_flag
+
+  def GetCachedMaintenanceFlag(self):
+    """Gets the maintenance flag last read by CheckMaintenanceFlag without
+    going to the database.
+
+    A change made in this process clears the cached flag right away, a change
+    made by another process is seen at most maintenance_flag_ttl seconds
+    later.
+
+    Outputs:
+      bool: boolean of maintenance mode, or None if the flag is not cached
+    """
+    cached_flag = maintenance_flags.get((self.db_host, self.db_name))
+    if( cached_flag is None or cached_flag[1] <= time.time() ):
+      return None
+    return cached_flag[0]
+
+  def ClearMaintenanceFlagCache(self):
+    """Clears the cached maintenance flag so it is read from the database
+    by the next check in this process.
+    """
+    maintenance_key = (self.db_host, self.db_name)
+    maintenance_flag_lock.acquire()
+    try:
+      maintenance_flag_generations[maintenance_key] = (
+          maintenance_flag_generations.get(maintenance_key, 0) + 1)
+      maintenance_flags.pop(maintenance_key, None)
+    finally:
+      maintenance_flag_lock.release()
+
+  def WaitForBigLock(self):
+    """Waits for the big lock to be released before the first write of a
+    transaction.
+
+    The big lock is a MySQL named lock held by LockDb for as long as the
+    tables are locked. Waiting for it with GET_LOCK blocks in the database
+    server and returns the moment UnlockDb releases it. Only writes need to
+    wait since reading is allowed while the tables are locked for reading.
+    A lock held for longer than big_lock_timeout is ignored.
+    """
+    if( self.big_lock_checked or self.locked_db ):
+      return
+    self.big_lock_checked = True
+    lock_dict = {'lock_name': self.big_lock_name,
+                 'timeout': self.big_lock_timeout}
+    self.cursor_execute('SELECT IS_FREE_LOCK(%(lock_name)s) AS `free`',
+                        lock_dict)
+    if( self.cursor.fetchone()['free'] != 0 ):
+      return
+    self.cursor_execute('SELECT GET_LOCK(%(lock_name)s, %(timeout)s) AS '
+                        '`locked`', lock_dict)
+    if( self.cursor.fetchone()['locked'] ):
+      self.cursor_execute('DO RELEASE_LOCK(%(lock_name)s)', lock_dict)
 
   def LockDb(self):
     """This function is to lock the whole database for consistent data
     retrevial.
 
+    The big lock is taken first so that new writes wait for it, then
+    in-flight transactions are given big_lock_wait seconds to finish before
+    the tables are locked.
+
     This function expects for self.db_instance.cursor to be instantiated and
     valid.
 
     Raises: 
       TransactionError: Must unlock tables before re-locking them.
+      TransactionError: Could not get the big lock.
     """
     if( self.locked_db is True ):
       raise errors.TransactionError('Must unlock tables before re-locking them')
-    self.cursor_execute('UPDATE `locks` SET `locked`=1 WHERE '
-                        '`lock_name`="db_lock_lock"')
-    time.sleep(self.big_lock_wait)
-    self.cursor_execute(
-        'LOCK TABLES %s READ' % ' READ, '.join(self.ListTableNames()))
+    # Negative timeouts only wait forever from MySQL 5.7.5 on.
+    self.cursor_execute('SELECT GET_LOCK(%(lock_name)s, %(timeout)s) AS '
+                        '`locked`',
+                        {'lock_name': self.big_lock_name,
+                         'timeout': constants.BIG_LOCK_GET_TIMEOUT})
+    if( self.cursor.fetchone()['locked'] != 1 ):
+      raise errors.TransactionError('Could not get the big lock.')
     self.locked_db = True
+    try:
+      time.sleep(self.big_lock_wait)
+      self.cursor_execute(
+          'LOCK TABLES %s READ' % ' READ, '.join(self.ListTableNames()))
+    except:
+      self.locked_db = False
+      self.cursor_execute('DO RELEASE_LOCK(%(lock_name)s)',
+                          {'lock_name': self.big_lock_name})
+      raise
 
   def UnlockDb(self):
     """This function is to unlock the whole database.
@@ -320,51 +1158,224 @@ class dbAccess(object):
     """
     if( self.locked_db is False ):
       raise errors.TransactionError('Must lock tables before unlocking them')
-    self.cursor_execute('UNLOCK TABLES')
-    self.cursor_execute('UPDATE `locks` SET `locked`=0 WHERE '
-                        '`lock_name`="db_lock_lock"')
-    self.locked_db = False
+    try:
+      self.cursor_execute('UNLOCK TABLES')
+    finally:
+      self.cursor_execute('DO RELEASE_LOCK(%(lock_name)s)',
+                          {'lock_name': self.big_lock_name})
+      self.locked_db = False
 
   def InitDataValidation(self):
     """Get all reserved words and group permissions and init the
     data_validation_instance
+
+    The DataValidation instance is shared by every instance in the process
+    using the same database, the tables are only read again after a change to
+    constants.DATA_VALIDATION_TABLES has been committed, in this process or,
+    as counted by the reserved_words generation of the generations table, in
+    any other.
+
+    A transaction is started if one is not already running.
     """
-    cursor = self.connection.cursor()
+    validation_key = (self.db_host, self.db_name)
+    generation = self.GetDataValidationGeneration()
+    own_transaction = not self.transaction_init
+    if( own_transaction ):
+      self.StartTransaction()
     try:
-      if( self.db_debug ):
-        if( self.db_debug_log ):
-          #If the execution_string contains a unicode character we must account
-          #for it. So we need to use the codecs package to write to a utf-8 log
-          #file, instead of ASCII like the 'normal' open() results in.
-          debug_log_handle = codecs.open(self.db_debug_log, encoding='utf-8',
-              mode='a')
-          debug_log_handle.write('SELECT reserved_word FROM reserved_words')
-          debug_log_handle.write('\n')
-          debug_log_handle.close()
-        else:
-          print 'SELECT reserved_word FROM reserved_words'
-      cursor.execute('SELECT reserved_word FROM reserved_words')
-      reserved_words_rows = cursor.fetchall()
-
-      if( self.db_debug ):
-        if( self.db_debug_log ):
-          debug_log_handle = codecs.open(self.db_debug_log, encoding='utf-8',
-              mode='a')
-          debug_log_handle.write('SELECT record_type FROM record_types')
-          debug_log_handle.write('\n')
-          debug_log_handle.close()
-        else:
-          print 'SELECT record_type FROM record_types'
-      cursor.execute('SELECT record_type FROM record_types')
-      record_types_rows = cursor.fetchall()
+      database_generation = self.GetDatabaseGenerations(
+          [u'reserved_words'])[0]
+      self.data_validation_checked = True
+      cached_validation = data_validation_instances.get(validation_key)
+      if( cached_validation is not None and
+          cached_validation[:2] == (generation, database_generation) ):
+        (self.data_validation_generation,
+         self.data_validation_database_generation,
+         self.data_validation_instance) = cached_validation
+        return
+
+      # Rows read by a transaction that changed the tables itself, or that
+      # may have started reading before the last change was committed, are
+      # only used by this instance.
+      shared = (
+          self.transaction_generation == generation and
+          not self.changed_tables.intersection(
+              constants.DATA_VALIDATION_TABLES))
+      self.cursor_execute('SELECT reserved_word FROM reserved_words')
+      reserved_words_rows = self.cursor.fetchall()
+      self.cursor_execute('SELECT record_type FROM record_types')
+      record_types_rows = self.cursor.fetchall()
     finally:
-      cursor.close()
+      if( own_transaction ):
+        self.EndTransaction()
 
-    words = [row[0] for row in reserved_words_rows]
-    record_types = [row[0] for row in record_types_rows]
+    words = [row['reserved_word'] for row in reserved_words_rows]
+    record_types = [row['record_type'] for row in record_types_rows]
 
     self.data_validation_instance = data_validation.DataValidation(
         words, record_types)
+    self.data_validation_generation = generation
+    self.data_validation_database_generation = database_generation
+    if( shared ):
+      data_validation_lock.acquire()
+      try:
+        if( data_validation_generations.get(validation_key, 0) ==
+            generation ):
+          data_validation_instances[validation_key] = (
+              generation, database_generation, self.data_validation_instance)
+      finally:
+        data_validation_lock.release()
+
+  def CheckDataValidation(self, writing=False):
+    """Makes sure data_validation_instance is there and current before it is
+    used. The first time this is run for a change in a transaction the
+    instance is checked against the reserved_words generation of the
+    generations table, so changes committed by other processes are read
+    before they could be written around. Transactions that only read do not
+    query the generations table.
+
+    Inputs:
+      writing: boolean of if the instance is used to check a change
+    """
+    if( self.data_validation_instance is None ):
+      self.InitDataValidation()
+    elif( writing and self.transaction_init and
+          not self.data_validation_checked ):
+      if( self.GetDatabaseGenerations([u'reserved_words'])[0] !=
+          self.data_validation_database_generation ):
+        self.InitDataValidation()
+      self.data_validation_checked = True
+
+  def GetDataValidationGeneration(self):
+    """Gets the generation of the tables DataValidation is built from.
+
+    Outputs:
+      int: generation number
+    """
+    return data_validation_generations.get((self.db_host, self.db_name), 0)
+
+  def BumpDataValidationGeneration(self):
+    """Bumps the generation of the tables DataValidation is built from so
+    every instance using the database reads them again on its next
+    transaction.
+    """
+    validation_key = (self.db_host, self.db_name)
+    data_validation_lock.acquire()
+    try:
+      data_validation_generations[validation_key] = (
+          data_validation_generations.get(validation_key, 0) + 1)
+      data_validation_instances.pop(validation_key, None)
+    finally:
+      data_validation_lock.release()
+
+  def GetAuthorizationGeneration(self):
+    """Gets the generation of the tables user authorization is built from.
+
+    Outputs:
+      int: generation number
+    """
+    return authorization_generations.get((self.db_host, self.db_name), 0)
+
+  def BumpAuthorizationGeneration(self):
+    """Bumps the generation of the tables user authorization is built from
+    so every user snapshot of the database is built again on its next use.
+    """
+    authorization_key = (self.db_host, self.db_name)
+    authorization_lock.acquire()
+    try:
+      authorization_generations[authorization_key] = (
+          authorization_generations.get(authorization_key, 0) + 1)
+    finally:
+      authorization_lock.release()
+
+  def GetViewDependencyGraph(self, view_dependency=None):
+    """Gets the views every view dependency is assigned to, along with all
+    of the view dependencies of those views.
+
+    The graph is shared by every instance using the database and only built
+    again after a change to constants.VIEW_DEPENDENCY_TABLES is committed,
+    which is found in the views generation of the generations table when
+    another process committed it. It is never taken from or put in the cache
+    by a transaction that changed those tables itself.
+
+    Inputs:
+      view_dependency: string of view dependency that is needed, the graph is
+                       built again if the cached one does not have it
+
+    Raises:
+      TransactionError: Must run StartTansaction before getting the view
+                        dependency graph.
+
+    Outputs:
+      dict: tuples of list of views and list of view dependencies keyed by
+            view dependency, which must not be changed
+        example: {u'any': ([u'internal', u'external'],
+                           [u'internal_dep', u'any', u'external_dep']),
+                  u'internal_dep': ([u'internal'], [u'internal_dep', u'any'])}
+    """
+    if( not self.transaction_init ):
+      raise errors.TransactionError('Must run StartTansaction before getting '
+                                    'the view dependency graph.')
+    graph_key = (self.db_host, self.db_name)
+    changed_here = self.changed_tables.intersection(
+        constants.VIEW_DEPENDENCY_TABLES)
+    if( not changed_here ):
+      database_generation = self.GetDatabaseGenerations([u'views'])[0]
+      cached_graph = view_dependency_graphs.get(graph_key)
+      if( cached_graph is not None and cached_graph[:2] == (
+              view_dependency_generations.get(graph_key, 0),
+              database_generation) and
+          (view_dependency is None or view_dependency in cached_graph[2]) ):
+        return cached_graph[2]
+
+    views = {}
+    view_dependencies = {}
+    for row in self.ListRow('view_dependency_assignments',
+                            self.GetEmptyRowDict(
+                                'view_dependency_assignments')):
+      view_name = row['view_dependency_assignments_view_name']
+      view_dependency = row['view_dependency_assignments_view_dependency']
+      if( view_name not in views.setdefault(view_dependency, []) ):
+        views[view_dependency].append(view_name)
+      if( view_dependency not in view_dependencies.setdefault(view_name,
+                                                              []) ):
+        view_dependencies[view_name].append(view_dependency)
+
+    graph = {}
+    for view_dependency in views:
+      related_view_dependencies = []
+      for view_name in views[view_dependency]:
+        for related_view_dependency in view_dependencies[view_name]:
+          if( related_view_dependency not in related_view_dependencies ):
+            related_view_dependencies.append(related_view_dependency)
+      graph[view_dependency] = (views[view_dependency],
+                                related_view_dependencies)
+
+    if( not changed_here ):
+      view_dependency_lock.acquire()
+      try:
+        # Only a graph read before any newer change may be cached.
+        if( view_dependency_generations.get(graph_key, 0) ==
+            self.transaction_view_dependency_generation ):
+          view_dependency_graphs[graph_key] = (
+              self.transaction_view_dependency_generation,
+              database_generation, graph)
+      finally:
+        view_dependency_lock.release()
+    return graph
+
+  def BumpViewDependencyGeneration(self):
+    """Bumps the generation of the view dependency graph so it is built
+    again by the next instance using the database that needs it.
+    """
+    graph_key = (self.db_host, self.db_name)
+    view_dependency_lock.acquire()
+    try:
+      view_dependency_generations[graph_key] = (
+          view_dependency_generations.get(graph_key, 0) + 1)
+      view_dependency_graphs.pop(graph_key, None)
+    finally:
+      view_dependency_lock.release()
 
   def MakeRow(self, table_name, row_dict):
     """Creates a row in the database using the table name and row dict
@@ -385,9 +1396,10 @@ class dbAccess(object):
     if( not self.transaction_init ):
       raise errors.TransactionError('Must run StartTansaction before '
                                     'inserting.')
-    if( self.data_validation_instance is None ):
-      self.InitDataValidation()
+    self.CheckDataValidation(writing=True)
     self.data_validation_instance.ValidateRowDict(table_name, row_dict) 
+    self.WaitForBigLock()
+    self.changed_tables.add(table_name)
 
     column_names = []
     column_assignments = []
@@ -442,9 +1454,10 @@ class dbAccess(object):
       raise errors.InvalidInputError('Table name not valid: %s' % table_name)
     if( not self.transaction_init ):
       raise errors.TransactionError('Must run StartTansaction before deleting.')
-    if( self.data_validation_instance is None ):
-      self.InitDataValidation()
+    self.CheckDataValidation(writing=True)
     self.data_validation_instance.ValidateRowDict(table_name, row_dict) 
+    self.WaitForBigLock()
+    self.changed_tables.add(table_name)
 
     where_list = []
     for k in row_dict.iterkeys():
@@ -475,12 +1488,13 @@ class dbAccess(object):
       raise errors.InvalidInputError('Table name not valid: %s' % table_name)
     if( not self.transaction_init ):
       raise errors.TransactionError('Must run StartTansaction before deleting.')
-    if( self.data_validation_instance is None ):
-      self.InitDataValidation()
+    self.CheckDataValidation(writing=True)
     self.data_validation_instance.ValidateRowDict(table_name, search_row_dict,
                                                   none_ok=True)
     self.data_validation_instance.ValidateRowDict(table_name, update_row_dict,
                                                   none_ok=True)
+    self.WaitForBigLock()
+    self.changed_tables.add(table_name)
     
     query_updates = []
     query_searches = []
@@ -500,10 +1514,185 @@ class dbAccess(object):
     self.cursor_execute(query, combined_dict)
     return self.cursor.rowcount
 
+  def MakeRows(self, table_name, row_dicts):
+    """Creates rows in the database using multi-row inserts of up to
+    constants.BULK_ROW_CHUNK_SIZE rows.
+
+    The auto increment ids of the rows are not returned, MySQL only reports
+    the first id of a multi-row insert and the rest are not consecutive with
+    innodb_autoinc_lock_mode 2 or an auto_increment_increment above 1. Use
+    MakeRow for rows whose ids are needed.
+
+    Inputs:
+      table_name: string of valid table name from constants
+      row_dicts: list of dictionaries that corespond to table_name
+
+    Raises:
+      InvalidInputError: Table name not valid
+      TransactionError: Must run StartTansaction before inserting
+
+    Outputs:
+      int: number of rows created
+    """
+    if( not table_name in helpers_lib.GetValidTables() ):
+      raise errors.InvalidInputError('Table name not valid: %s' % table_name)
+    if( not self.transaction_init ):
+      raise errors.TransactionError('Must run StartTansaction before '
+                                    'inserting.')
+    self.CheckDataValidation(writing=True)
+    for row_dict in row_dicts:
+      self.data_validation_instance.ValidateRowDict(table_name, row_dict)
+    if( not row_dicts ):
+      return 0
+    self.WaitForBigLock()
+    self.changed_tables.add(table_name)
+
+    column_names = sorted(row_dicts[0].iterkeys())
+    row_count = 0
+    for chunk_start in range(0, len(row_dicts), constants.BULK_ROW_CHUNK_SIZE):
+      chunk = row_dicts[chunk_start:
+                        chunk_start + constants.BULK_ROW_CHUNK_SIZE]
+      row_values = []
+      values_dict = {}
+      for index, row_dict in enumerate(chunk):
+        column_assignments = []
+        for k in column_names:
+          column_assignments.append('%s%s_%s%s' % ('%(', k, index, ')s'))
+          values_dict['%s_%s' % (k, index)] = row_dict[k]
+        row_values.append('(%s)' % ','.join(column_assignments))
+
+      query = 'INSERT INTO %s (%s) VALUES %s' % (table_name,
+                                                 ','.join(column_names),
+                                                 ','.join(row_values))
+      self.cursor_execute(query, values_dict)
+      row_count += self.cursor.rowcount
+    return row_count
+
+  def RemoveRows(self, table_name, column, values):
+    """Removes rows in the database where a column is one of a list of values.
+
+    Inputs:
+      table_name: string of valid table name from constants
+      column: string of column name in table_name, usually the id column
+      values: list of values of column to remove
+
+    Raises:
+      InvalidInputError: Table name not valid
+      InvalidInputError: Column not found in table
+      TransactionError: Must run StartTansaction before deleting
+
+    Outputs:
+      int: number of rows affected
+    """
+    if( not table_name in helpers_lib.GetValidTables() ):
+      raise errors.InvalidInputError('Table name not valid: %s' % table_name)
+    if( not self.transaction_init ):
+      raise errors.TransactionError('Must run StartTansaction before deleting.')
+    queries, values_dicts = self.MakeColumnInQuery(
+        'DELETE FROM %s' % table_name, table_name, column, values)
+    row_count = 0
+    for query, values_dict in zip(queries, values_dicts):
+      self.cursor_execute(query, values_dict)
+      row_count += self.cursor.rowcount
+    return row_count
+
+  def UpdateRows(self, table_name, column, values, update_row_dict):
+    """Updates rows in the database where a column is one of a list of values.
+
+    Inputs:
+      table_name: string of valid table name from constants
+      column: string of column name in table_name, usually the id column
+      values: list of values of column to update
+      update_row_dict: dictionary that coresponds to table_name containing
+                       update args
+
+    Raises:
+      InvalidInputError: Table name not valid
+      InvalidInputError: Column not found in table
+      TransactionError: Must run StartTansaction before updating
+
+    Outputs:
+      int: number of rows affected
+    """
+    if( not table_name in helpers_lib.GetValidTables() ):
+      raise errors.InvalidInputError('Table name not valid: %s' % table_name)
+    if( not self.transaction_init ):
+      raise errors.TransactionError('Must run StartTansaction before updating.')
+    self.CheckDataValidation(writing=True)
+    self.data_validation_instance.ValidateRowDict(table_name, update_row_dict,
+                                                  none_ok=True)
+    query_updates = []
+    update_dict = {}
+    for k, v in update_row_dict.iteritems():
+      if( v is not None ):
+        query_updates.append('%s%s%s%s' % (k, '=%(update_', k, ')s'))
+        update_dict['update_%s' % k] = v
+
+    queries, values_dicts = self.MakeColumnInQuery(
+        'UPDATE %s SET %s' % (table_name, ','.join(query_updates)),
+        table_name, column, values)
+    row_count = 0
+    for query, values_dict in zip(queries, values_dicts):
+      values_dict.update(update_dict)
+      self.cursor_execute(query, values_dict)
+      row_count += self.cursor.rowcount
+    return row_count
+
+  def MakeColumnInQuery(self, query_start, table_name, column, values):
+    """Checks the values of RemoveRows and UpdateRows and builds their
+    queries in chunks of up to constants.BULK_ROW_CHUNK_SIZE values.
+
+    Waits for the big lock if there is anything to change.
+
+    Inputs:
+      query_start: string of the query before the WHERE clause
+      table_name: string of valid table name from constants
+      column: string of column name in table_name
+      values: list of values of column
+
+    Raises:
+      InvalidInputError: Column not found in table
+
+    Outputs:
+      tuple of list of query strings and list of dictionaries of values
+    """
+    if( column not in constants.TABLES[table_name] ):
+      raise errors.InvalidInputError('Column %s not found in table %s' % (
+          column, table_name))
+    self.CheckDataValidation(writing=True)
+    row_dict = helpers_lib.GetRowDict(table_name)
+    for key in row_dict:
+      row_dict[key] = None
+    for value in values:
+      row_dict[column] = value
+      self.data_validation_instance.ValidateRowDict(table_name, row_dict,
+                                                    none_ok=True)
+    queries = []
+    values_dicts = []
+    if( not values ):
+      return queries, values_dicts
+    self.WaitForBigLock()
+    self.changed_tables.add(table_name)
+
+    values = list(values)
+    for chunk_start in range(0, len(values), constants.BULK_ROW_CHUNK_SIZE):
+      values_dict = {}
+      value_assignments = []
+      for index, value in enumerate(
+          values[chunk_start:chunk_start + constants.BULK_ROW_CHUNK_SIZE]):
+        value_assignments.append('%s%s_%s%s' % ('%(', column, index, ')s'))
+        values_dict['%s_%s' % (column, index)] = value
+      queries.append('%s WHERE %s IN (%s)' % (query_start, column,
+                                              ','.join(value_assignments)))
+      values_dicts.append(values_dict)
+    return queries, values_dicts
+
   def ListRow(self, *args, **kwargs):
     """Lists rows in the database using a dictionary of tables. Then returns 
     the rows found. Joins are auto generated on the fly based on foreign keys
-    in the database.
+    in the database. The finished query is cached by the tables, searched
+    columns, range column and row locking of the call, so repeated calls of
+    the same shape only bind new values.
 
     Inputs:
       args: pairs of string of table name and dict of rows
@@ -513,6 +1702,8 @@ class dbAccess(object):
                            in args.
               range_values: range tuple of values to search within for on column
               is_date: boolean of if range is of dates
+              compact: boolean of if rows should be CompactRows instead of
+                       dicts, for callers reading many rows
 
       example usage: ListRow('users', user_row_dict,
                              'user_group_assignments', user_assign_row_dict,
@@ -536,6 +1727,7 @@ class dbAccess(object):
     Outputs:
       tuple of row dicts consisting of all the tables that were in the input.
       all column names in the db are unique so no colisions occour
+      CompactRows have the same keys and values as the row dicts
         example: ({'user_name': 'sharrell', 'access_level': 10, 
                    'user_group_assignments_group_name: 'cs',
                    'user_group_assignments_user_name: 'sharrell'},
@@ -543,11 +1735,92 @@ class dbAccess(object):
                    'user_group_assignments_group_name: 'eas',
                    'user_group_assignments_user_name: 'sharrell'})
     """
+    compact = kwargs.pop('compact', False)
+    query, search_dict, row_class = self.GetListRowQuery(*args, **kwargs)
+    if( compact ):
+      cursor = self.cursor_execute(query, search_dict,
+                                   cursor_class=MySQLdb.cursors.Cursor)
+      try:
+        return tuple([row_class(row) for row in cursor.fetchall()])
+      finally:
+        cursor.close()
+    self.cursor_execute(query, search_dict)
+    return self.cursor.fetchall()
+
+  def IterRow(self, *args, **kwargs):
+    """Lists rows in the database the same way as ListRow, but streams them
+    from a server side cursor instead of reading the whole result at once.
+
+    The arguments are checked when IterRow is called, the query is run when
+    the first row is asked for. No other query can be run in the transaction
+    until every row has been read or the iterator has been closed.
+
+    Inputs:
+      args: pairs of string of table name and dict of rows
+      kwargs: same as ListRow
+
+    Raises:
+      Same as ListRow
+
+    Outputs:
+      iterator of rows, same as the rows ListRow returns
+    """
+    compact = kwargs.pop('compact', False)
+    query, search_dict, row_class = self.GetListRowQuery(*args, **kwargs)
+    if( compact ):
+      return self.StreamRows(query, search_dict, row_class=row_class)
+    return self.StreamRows(query, search_dict)
+
+  def StreamRows(self, query, values={}, row_class=None):
+    """Runs a query on a server side cursor and yields the rows in chunks of
+    constants.ITER_ROW_CHUNK_SIZE.
+
+    Inputs:
+      query: mysql query string
+      values: dictionary of values for mysql query
+      row_class: CompactRow class to make rows of, by default rows are dicts
+
+    Outputs:
+      generator of rows
+    """
+    if( row_class is None ):
+      cursor = self.cursor_execute(query, values,
+                                   cursor_class=MySQLdb.cursors.SSDictCursor)
+    else:
+      cursor = self.cursor_execute(query, values,
+                                   cursor_class=MySQLdb.cursors.SSCursor)
+    try:
+      while( True ):
+        rows = cursor.fetchmany(constants.ITER_ROW_CHUNK_SIZE)
+        if( not rows ):
+          break
+        for row in rows:
+          if( row_class is not None ):
+            row = row_class(row)
+          yield row
+    finally:
+      # Closing reads whatever is left of the result off the connection.
+      cursor.close()
+
+  def GetListRowQuery(self, *args, **kwargs):
+    """Checks the arguments of ListRow and IterRow and gets the query for
+    them from the query plan cache.
+
+    Inputs:
+      args: pairs of string of table name and dict of rows
+      kwargs: same as ListRow
+
+    Raises:
+      Same as ListRow
+
+    Outputs:
+      tuple of query string, dictionary of values for the query and
+      CompactRow class of the query
+    """
     if( not self.transaction_init ):
       raise errors.TransactionError('Must run StartTansaction before getting '
                                     'data.')
-    if( self.data_validation_instance is None ):
-      self.InitDataValidation()
+    self.CheckDataValidation()
 
     valid_tables = helpers_lib.GetValidTables()
     tables = {}
@@ -621,38 +1894,60 @@ class dbAccess(object):
           if( not self.data_validation_instance.isUnsignedInt(value) ):
             raise errors.InvalidInputError('Range must be int if is_date '
                                            'is not set')
-    query_where = []
-    if( len(tables) > 1 ):
-      if( not self.foreign_keys ):
-        self.cursor_execute('SELECT table_name, column_name, '
-                            'referenced_table_name, referenced_column_name '
-                            'FROM information_schema.key_column_usage WHERE '
-                            'referenced_table_name IS NOT NULL AND '
-                            'referenced_table_schema="%s"' % self.db_name)
-        self.foreign_keys = self.cursor.fetchall()
+    search_columns = []
+    search_dict = {}
+    for table_name in table_names:
+      for key, value in sorted(tables[table_name].iteritems()):
+        if( value is not None ):
+          search_columns.append(key)
+          search_dict[key] = value
+    if( range_values ):
+      search_dict['start'] = range_values[0]
+      search_dict['end'] = range_values[1]
 
-      for key in self.foreign_keys:
-        if( key['table_name'] in table_names and
-            key['referenced_table_name'] in table_names ):
-          
-          query_where.append('(%(table_name)s.%(column_name)s='
-                             '%(referenced_table_name)s.'
-                             '%(referenced_column_name)s)' % key)
+    plan_key = (tuple(table_names), tuple(search_columns), column,
+                bool(lock_rows))
+    list_row_plan_cache = self.GetListRowPlanCache()
+    plan = list_row_plan_cache.GetPlan(plan_key)
+    if( plan is None ):
+      plan = self.MakeListRowPlan(table_names, tables, search_columns, column,
+                                  lock_rows)
+      list_row_plan_cache.AddPlan(plan_key, plan)
+    query, row_class = plan
+    return query, search_dict, row_class
+
+  def MakeListRowPlan(self, table_names, tables, search_columns, column,
+                      lock_rows):
+    """Builds the query used by ListRow for one shape of call.
+
+    Inputs:
+      table_names: list of table names in the order they were passed in
+      tables: dictionary of row dicts keyed by table name
+      search_columns: list of column names that have values to search on
+      column: column to search range on or None
+      lock_rows: boolean of if rows should be locked
+
+    Raises:
+      InvalidInputError: Multiple tables were passed in but no joins were found
+
+    Outputs:
+      tuple of query string and CompactRow class of the columns selected
+    """
+    query_where = []
+    if( len(table_names) > 1 ):
+      query_where.extend(
+          self.GetForeignKeyGraph().GetJoinPredicates(table_names))
       if( not query_where ):
         raise errors.InvalidInputError('Multiple tables were passed in but no '
                                        'joins were found')
     column_names = []
-    search_dict = {}
-    for table_name, row_dict in tables.iteritems():
-      for key, value in row_dict.iteritems():
+    for table_name in table_names:
+      for key in tables[table_name].iterkeys():
         column_names.append('%s.%s' % (table_name, key))
-        if( value is not None ):
-          search_dict[key] = value
-          query_where.append('%s%s%s%s' % (key, '=%(', key, ')s'))
+    for key in search_columns:
+      query_where.append('%s%s%s%s' % (key, '=%(', key, ')s'))
 
-    if( range_values ):
-      search_dict['start'] = range_values[0]
-      search_dict['end'] = range_values[1]
+    if( column ):
       query_where.append('%s%s%s%s' % (column, '>=%(start)s AND ',
                                        column, '<=%(end)s'))
 
@@ -665,9 +1960,70 @@ class dbAccess(object):
     query = 'SELECT %s FROM %s %s' % (','.join(column_names),
                                       ','.join(table_names),
                                       query_end)
+    return query, MakeCompactRowClass(column_names)
 
-    self.cursor_execute(query, search_dict)
-    return self.cursor.fetchall()
+  def GetListRowPlanCache(self):
+    """Gets the ListRow plan cache of the database.
+
+    Outputs:
+      QueryPlanCache instance shared by all instances using this database
+    """
+    cache_key = (self.db_host, self.db_name)
+    list_row_plan_cache = list_row_plan_caches.get(cache_key)
+    if( list_row_plan_cache is None ):
+      list_row_plan_caches_lock.acquire()
+      try:
+        list_row_plan_cache = list_row_plan_caches.get(cache_key)
+        if( list_row_plan_cache is None ):
+          list_row_plan_cache = QueryPlanCache(
+              constants.LIST_ROW_PLAN_CACHE_SIZE)
+          list_row_plan_caches[cache_key] = list_row_plan_cache
+      finally:
+        list_row_plan_caches_lock.release()
+    return list_row_plan_cache
+
+  def ClearSchemaCaches(self):
+    """Drops the foreign key graph and ListRow plans of the database, so they
+    are made again from a new schema by every instance using it.
+    """
+    cache_key = (self.db_host, self.db_name)
+    foreign_key_graphs_lock.acquire()
+    try:
+      foreign_key_graphs.pop(cache_key, None)
+    finally:
+      foreign_key_graphs_lock.release()
+    list_row_plan_caches_lock.acquire()
+    try:
+      list_row_plan_caches.pop(cache_key, None)
+    finally:
+      list_row_plan_caches_lock.release()
+
+  def GetForeignKeyGraph(self):
+    """Gets the foreign key graph of the database, loading it from
+    information_schema the first time it is used in the process.
+
+    This function expects for self.cursor to be instantiated and valid.
+
+    Outputs:
+      ForeignKeyGraph instance shared by all instances using this database
+    """
+    graph_key = (self.db_host, self.db_name)
+    foreign_key_graph = foreign_key_graphs.get(graph_key)
+    if( foreign_key_graph is None ):
+      foreign_key_graphs_lock.acquire()
+      try:
+        foreign_key_graph = foreign_key_graphs.get(graph_key)
+        if( foreign_key_graph is None ):
+          self.cursor_execute('SELECT table_name, column_name, '
+                              'referenced_table_name, referenced_column_name '
+                              'FROM information_schema.key_column_usage WHERE '
+                              'referenced_table_name IS NOT NULL AND '
+                              'referenced_table_schema="%s"' % self.db_name)
+          foreign_key_graph = ForeignKeyGraph(self.cursor.fetchall())
+          foreign_key_graphs[graph_key] = foreign_key_graph
+      finally:
+        foreign_key_graphs_lock.release()
+    return foreign_key_graph
 
   def GetEmptyRowDict(self, table_name):
     """Gives a dict that has all the members needed to interact with the
@@ -775,8 +2131,7 @@ class dbAccess(object):
       raise errors.InvalidInputError('dict for record type %s should have '
                                      'these keys: %s' % (record_type,
                                      record_type_dict))
-    if( self.data_validation_instance is None ):
-      self.InitDataValidation()
+    self.CheckDataValidation()
     
     data_validation_methods = dir(data_validation.DataValidation([], []))
     for record_arg_name in record_args_dict.keys():
@@ -828,11 +2183,128 @@ class dbAccess(object):
     work around is splitting the whole thing up and commiting each piece
     separately.
 
+    The foreign key graph and ListRow plans of the database are dropped so
+    they are made again from the new schema.
+
+    Inputs:
+      schema: string of sql schema
+    """
+    self.ClearSchemaCaches()
+    self.BumpDataValidationGeneration()
+    self.BumpAuthorizationGeneration()
+    self.BumpViewDependencyGeneration()
+    self.ClearMaintenanceFlagCache()
+    if( schema is None ):
+      schema = embedded_files.SCHEMA_FILE
+    execute_lines = self._SplitSchema(schema)
+
+    warnings.filterwarnings('ignore', 'Unknown table.*')
+    for line in execute_lines:
+      self.StartTransaction()
+      try:
+        self.cursor_execute(line)
+      finally:
+        self.EndTransaction()
+
+  def UpgradeRosterDatabase(self, schema=None):
+    """Brings a database made by an older release up to the schema that is
+    passed in(or default schema) without touching existing data.
+
+    Tables that are missing are created and records that do not have a
+    fingerprint yet are fingerprinted. Records that duplicate an earlier
+    record in the same zone and view dependency can not be fingerprinted as
+    fingerprints are unique, they are left alone and returned. The
+    db_lock_lock row older releases kept in the locks table is removed, the
+    big lock is a MySQL named lock.
+
     Inputs:
       schema: string of sql schema
+
+    Outputs:
+      list: ids of records left without a fingerprint
     """
     if( schema is None ):
       schema = embedded_files.SCHEMA_FILE
+    self.StartTransaction()
+    try:
+      table_names = self.ListTableNames()
+    finally:
+      self.EndTransaction()
+    tables_created = False
+    for line in self._SplitSchema(schema):
+      if( not line.strip().startswith('CREATE TABLE') or
+          line.split('`')[1] in table_names ):
+        continue
+      self.StartTransaction()
+      try:
+        self.cursor_execute(line)
+      finally:
+        self.EndTransaction()
+      tables_created = True
+    if( tables_created ):
+      self.ClearSchemaCaches()
+
+    duplicate_record_ids = []
+    self.StartTransaction()
+    try:
+      self.cursor_execute('DELETE FROM locks WHERE lock_name="db_lock_lock"')
+      self.cursor_execute(
+          'SELECT record_fingerprint, record_fingerprints_zone_name, '
+          'record_fingerprints_view_dependency FROM record_fingerprints')
+      fingerprints = set()
+      for row in self.cursor.fetchall():
+        fingerprints.add((row['record_fingerprint'],
+                          row['record_fingerprints_zone_name'],
+                          row['record_fingerprints_view_dependency']))
+      self.cursor_execute(
+          'SELECT records_id, record_type, record_target, record_zone_name, '
+          'record_view_dependency, '
+          'record_arguments_records_assignments_argument_name, '
+          'argument_value FROM records LEFT JOIN record_fingerprints ON '
+          'record_fingerprints_record_id=records_id LEFT JOIN '
+          'record_arguments_records_assignments ON '
+          'record_arguments_records_assignments_record_id=records_id WHERE '
+          'record_fingerprints_record_id IS NULL ORDER BY records_id')
+      records = collections.OrderedDict()
+      for row in self.cursor.fetchall():
+        if( row['records_id'] not in records ):
+          records[row['records_id']] = (row, {})
+        if( row['record_arguments_records_assignments_argument_name'] ):
+          records[row['records_id']][1][row[
+              'record_arguments_records_assignments_argument_name']] = (
+                  row['argument_value'])
+      record_fingerprint_rows = []
+      for record_id, (row, record_args_dict) in records.iteritems():
+        fingerprint = (
+            helpers_lib.GetRecordFingerprint(
+                row['record_type'], row['record_target'], record_args_dict),
+            row['record_zone_name'], row['record_view_dependency'])
+        if( fingerprint in fingerprints ):
+          duplicate_record_ids.append(record_id)
+          continue
+        fingerprints.add(fingerprint)
+        record_fingerprint_rows.append(
+            {'record_fingerprint': fingerprint[0],
+             'record_fingerprints_zone_name': fingerprint[1],
+             'record_fingerprints_view_dependency': fingerprint[2],
+             'record_fingerprints_record_id': record_id})
+      self.MakeRows('record_fingerprints', record_fingerprint_rows)
+    except:
+      self.EndTransaction(rollback=True)
+      raise
+    self.EndTransaction()
+    return duplicate_record_ids
+
+  def _SplitSchema(self, schema):
+    """Splits a schema into statements that can be executed one at a time,
+    leaving out comments.
+
+    Inputs:
+      schema: string of sql schema
+
+    Outputs:
+      list: strings of sql statements
+    """
     schema_lines = schema.split('\n')
     execute_lines = []
     continued_line = []
@@ -845,20 +2317,14 @@ class dbAccess(object):
         continued_line = []
       else:
         continued_line.append(line)
-      
-    warnings.filterwarnings('ignore', 'Unknown table.*')
-    for line in execute_lines:
-      self.StartTransaction()
-      try:
-        self.cursor_execute(line)
-      finally:
-        self.EndTransaction()
+    return execute_lines
 
   def DumpDatabase(self):
     """This will dump the entire database to memory.
 
     This would be done by mysqldump but it needs to be done in the same lock
-    as other processes. So this is a simple mysqldump function.
+    as other processes. So this is a simple mysqldump function. Table rows
+    are streamed so only their escaped values are kept in memory.
 
     Outputs:
       Dictionary: Dictionary with keys of table name and schema/data for each
@@ -878,23 +2344,94 @@ class dbAccess(object):
       table_descriptions = self.cursor.fetchall()
       for table_description in table_descriptions:
         table_data[table_name]['columns'].append(table_description['Field'])
-      self.cursor_execute('SELECT %s FROM %s' % 
-                          (','.join(table_data[table_name]['columns']),
-                           table_name))
-      table_rows = self.cursor.fetchall()
+      table_rows = self.StreamRows(
+          'SELECT %s FROM %s' % (','.join(table_data[table_name]['columns']),
+                                 table_name))
       table_data[table_name]['rows'] = []
       for row in table_rows:
         row_dict = {}
         for key, value in row.iteritems():
-          row_dict[key] = self.connection.literal(value)
-          if( isinstance(row_dict[key], str) ):
-            row_dict[key] = unicode(row_dict[key], 'utf-8')
-            
+          row_dict[key] = self.GetLiteral(value)
 
         table_data[table_name]['rows'].append(row_dict)
 
     return table_data
 
+  def IterDumpDatabase(self):
+    """Dumps the entire database as mysqldump-like statements without
+    holding it in memory.
+
+    Each table is read in primary key order from a server side cursor and
+    every constants.BULK_ROW_CHUNK_SIZE rows become one multi-row INSERT.
+    No other query can be run in the transaction until every statement has
+    been read. The generations table is only created if it is missing and
+    its rows are counted up past the ones in the database they are loaded
+    into.
+
+    Outputs:
+      generator of tuples of table name and unicode string of statement
+        example: (u'zones', u'DROP TABLE IF EXISTS `zones`;\n')
+    """
+    self.cursor_execute('SHOW TABLES')
+    table_names = [row.values()[0] for row in self.cursor.fetchall()]
+    self.cursor_execute('SET OPTION SQL_QUOTE_SHOW_CREATE=1')
+    for table_name in table_names:
+      self.cursor_execute('SHOW CREATE TABLE %s' % table_name)
+      schema = self.cursor.fetchone()['Create Table']
+      self.cursor_execute('DESCRIBE %s' % table_name)
+      columns = []
+      primary_key = []
+      for table_description in self.cursor.fetchall():
+        columns.append(table_description['Field'])
+        if( table_description['Key'] == 'PRI' ):
+          primary_key.append(table_description['Field'])
+
+      insert_end = u''
+      if( table_name == 'generations' ):
+        # Restoring a dump must never take a generation back to a value that
+        # may have been seen with other data, dumped generations are counted
+        # up past the current ones instead.
+        yield (table_name, u'%s;\n' % schema.replace(
+            u'CREATE TABLE', u'CREATE TABLE IF NOT EXISTS', 1))
+        insert_end = (u' ON DUPLICATE KEY UPDATE '
+                      u'generation=GREATEST(generation,VALUES(generation))+1')
+      else:
+        yield (table_name, u'DROP TABLE IF EXISTS `%s`;\n' % table_name)
+        yield (table_name, u'%s;\n' % schema)
+
+      query = 'SELECT %s FROM %s' % (','.join(columns), table_name)
+      if( primary_key ):
+        query = '%s ORDER BY %s' % (query, ','.join(primary_key))
+      insert_start = u'INSERT INTO %s (%s) VALUES\n' % (table_name,
+                                                        ','.join(columns))
+      row_values = []
+      for row in self.StreamRows(query):
+        row_values.append(u'(%s)' % u','.join(
+            [self.GetLiteral(row[column]) for column in columns]))
+        if( len(row_values) == constants.BULK_ROW_CHUNK_SIZE ):
+          yield (table_name, u'%s%s%s;\n' % (insert_start,
+                                             u',\n'.join(row_values),
+                                             insert_end))
+          row_values = []
+      if( row_values ):
+        yield (table_name, u'%s%s%s;\n' % (insert_start,
+                                           u',\n'.join(row_values),
+                                           insert_end))
+
+  def GetLiteral(self, value):
+    """Escapes a value to be written into a query.
+
+    Inputs:
+      value: value from a database row
+
+    Outputs:
+      unicode: escaped value
+    """
+    literal = self.connection.literal(value)
+    if( isinstance(literal, str) ):
+      literal = unicode(literal, 'utf-8')
+    return literal
+
   ### These functions are for the user class
   def GetUserAuthorizationInfo(self, user):
     """Grabs authorization data from the db and returns a dict.
@@ -1071,5 +2608,141 @@ class dbAccess(object):
       return None
     return origins
 
+  def GetZoneOriginsByView(self, zone_names):
+    """Returns the zone origins of every view of a list of zones, with one
+    query for every constants.BULK_ROW_CHUNK_SIZE zones.
+
+    Inputs:
+      zone_names: list of zone names
+
+    Raises:
+      TransactionError: Must run StartTansaction before getting zone origins.
+
+    Outputs:
+      a dictionary keyed by zone name and view dependency with values of
+      lists of origins, zones without origins are left out
+      Example:
+        {u'test_zone': {u'test_view_dep': [u'192.168.0.in-addr.arpa.'],
+                        u'any': [u'192.168.0.in-addr.arpa.']}}
+    """
+    if( not self.transaction_init ):
+      raise errors.TransactionError('Must run StartTansaction before getting '
+                                    'zone origins.')
+    origins = {}
+    zone_names = sorted(set(zone_names))
+    for chunk_start in range(0, len(zone_names),
+                             constants.BULK_ROW_CHUNK_SIZE):
+      values_dict = {}
+      value_assignments = []
+      for index, zone_name in enumerate(
+          zone_names[chunk_start:chunk_start + constants.BULK_ROW_CHUNK_SIZE]):
+        value_assignments.append('%%(zone_name_%s)s' % index)
+        values_dict['zone_name_%s' % index] = zone_name
+      self.cursor_execute(
+          'SELECT zone_view_assignments_zone_name, '
+          'zone_view_assignments_view_dependency, zone_origin '
+          'FROM zone_view_assignments WHERE zone_view_assignments_zone_name '
+          'IN (%s)' % ','.join(value_assignments), values_dict)
+      for row in self.cursor.fetchall():
+        view_origins = origins.setdefault(
+            row['zone_view_assignments_zone_name'], {}).setdefault(
+                row['zone_view_assignments_view_dependency'], [])
+        if( row['zone_origin'] not in view_origins ):
+          view_origins.append(row['zone_origin'])
+    return origins
+
+  def GetRecordTypesByTarget(self, target_keys):
+    """Returns the types of the records with each of a list of zone, view
+    dependency and target keys, with one query for every
+    constants.BULK_ROW_CHUNK_SIZE targets.
+
+    Inputs:
+      target_keys: list of tuples of zone name, view dependency and target
+
+    Raises:
+      TransactionError: Must run StartTansaction before listing records.
+
+    Outputs:
+      a dictionary keyed by the tuples of the keys that have records with
+      values of sets of record types
+      Example:
+        {(u'university.edu', u'any', u'@'): set([u'mx', u'ns']),
+         (u'university.edu', u'internal_dep', u'www'): set([u'cname'])}
+    """
+    if( not self.transaction_init ):
+      raise errors.TransactionError('Must run StartTansaction before listing '
+                                    'records.')
+    target_keys = set(target_keys)
+    zone_names = sorted(set([target_key[0] for target_key in target_keys]))
+    targets = sorted(set([target_key[2] for target_key in target_keys]))
+    values_dict = {}
+    zone_assignments = []
+    for index, zone_name in enumerate(zone_names):
+      zone_assignments.append('%%(zone_name_%s)s' % index)
+      values_dict['zone_name_%s' % index] = zone_name
+    record_types = {}
+    for chunk_start in range(0, len(targets), constants.BULK_ROW_CHUNK_SIZE):
+      target_assignments = []
+      for index, target in enumerate(
+          targets[chunk_start:chunk_start + constants.BULK_ROW_CHUNK_SIZE]):
+        target_assignments.append('%%(target_%s)s' % index)
+        values_dict['target_%s' % index] = target
+      self.cursor_execute(
+          'SELECT record_zone_name, record_view_dependency, record_target, '
+          'record_type FROM records WHERE record_target IN (%s) AND '
+          'record_zone_name IN (%s)' % (','.join(target_assignments),
+                                        ','.join(zone_assignments)),
+          values_dict)
+      for row in self.cursor.fetchall():
+        target_key = (row['record_zone_name'], row['record_view_dependency'],
+                      row['record_target'])
+        if( target_key in target_keys ):
+          record_types.setdefault(target_key, set()).add(row['record_type'])
+    return record_types
+
+  def GetRecordFingerprints(self, fingerprint_keys):
+    """Returns which of a list of fingerprint, zone and view dependency keys
+    belong to records, with one query for every constants.BULK_ROW_CHUNK_SIZE
+    fingerprints.
+
+    Inputs:
+      fingerprint_keys: list of tuples of record fingerprint, zone name and
+                        view dependency
+
+    Raises:
+      TransactionError: Must run StartTansaction before listing records.
+
+    Outputs:
+      set: tuples of the keys that belong to records
+    """
+    if( not self.transaction_init ):
+      raise errors.TransactionError('Must run StartTansaction before listing '
+                                    'records.')
+    fingerprint_keys = set(fingerprint_keys)
+    fingerprints = sorted(set([fingerprint_key[0] for fingerprint_key in
+                               fingerprint_keys]))
+    found_keys = set()
+    for chunk_start in range(0, len(fingerprints),
+                             constants.BULK_ROW_CHUNK_SIZE):
+      values_dict = {}
+      value_assignments = []
+      for index, fingerprint in enumerate(
+          fingerprints[chunk_start:
+                       chunk_start + constants.BULK_ROW_CHUNK_SIZE]):
+        value_assignments.append('%%(fingerprint_%s)s' % index)
+        values_dict['fingerprint_%s' % index] = fingerprint
+      self.cursor_execute(
+          'SELECT record_fingerprint, record_fingerprints_zone_name, '
+          'record_fingerprints_view_dependency FROM record_fingerprints '
+          'WHERE record_fingerprint IN (%s)' % ','.join(value_assignments),
+          values_dict)
+      for row in self.cursor.fetchall():
+        fingerprint_key = (row['record_fingerprint'],
+                           row['record_fingerprints_zone_name'],
+                           row['record_fingerprints_view_dependency'])
+        if( fingerprint_key in fingerprint_keys ):
+          found_keys.add(fingerprint_key)
+    return found_keys
+
 
 # vi: set ai aw sw=2:
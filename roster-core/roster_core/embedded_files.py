@@ -124,6 +124,7 @@ SCHEMA_FILE = """# Copyright (c) 2009, Purdue University
 
 ########### These are commands prepare the database for our tables ###########
 
+DROP TABLE IF EXISTS `record_fingerprints`;
 DROP TABLE IF EXISTS `ipv6_index`;
 DROP TABLE IF EXISTS `ipv4_index`;
 DROP TABLE IF EXISTS `audit_log`;
@@ -156,6 +157,7 @@ DROP TABLE IF EXISTS `users`;
 DROP TABLE IF EXISTS `record_arguments`;
 DROP TABLE IF EXISTS `data_types`;
 DROP TABLE IF EXISTS `record_types`;
+DROP TABLE IF EXISTS `generations`;
 DROP TABLE IF EXISTS `locks`;
 
 ########## Below is the database schema ##########
@@ -172,6 +174,20 @@ CREATE TABLE `locks` (
 
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
 
+# Generations are only counted up. Record generations are kept per zone and
+# view dependency, other generations leave those columns empty.
+CREATE TABLE `generations` (
+
+  `generation_name` varchar(31) NOT NULL,
+  `generation_zone_name` varchar(255) NOT NULL default '',
+  `generation_view_dependency` varchar(255) NOT NULL default '',
+  `generation` bigint unsigned NOT NULL default '0',
+
+  PRIMARY KEY (`generation_name`, `generation_zone_name`,
+               `generation_view_dependency`)
+
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
 CREATE TABLE `record_types` (
 
   `record_types_id` smallint unsigned NOT NULL auto_increment,
@@ -741,11 +757,34 @@ CREATE TABLE `ipv6_index` (
 
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
 
+# The fingerprint covers the type, target and arguments of a record, the zone
+# and view dependency are kept beside it so they follow renames.
+CREATE TABLE `record_fingerprints` (
+  `record_fingerprints_id` mediumint unsigned NOT NULL auto_increment,
+  `record_fingerprint` char(40) NOT NULL,
+  `record_fingerprints_zone_name` varchar(255) NOT NULL,
+  `record_fingerprints_view_dependency` varchar(255) NOT NULL,
+  `record_fingerprints_record_id` mediumint unsigned NOT NULL UNIQUE,
+
+  PRIMARY KEY (`record_fingerprints_id`),
+  UNIQUE KEY `record_fingerprint_1` (`record_fingerprint`,
+    `record_fingerprints_zone_name`, `record_fingerprints_view_dependency`),
+
+  CONSTRAINT `record_fingerprints_record_id_1` FOREIGN KEY
+    (`record_fingerprints_record_id`) REFERENCES `records` (`records_id`)
+    ON DELETE CASCADE ON UPDATE CASCADE,
+  CONSTRAINT `zone_name_view_dependency_2` FOREIGN KEY
+    (`record_fingerprints_zone_name`, `record_fingerprints_view_dependency`)
+    REFERENCES `zone_view_assignments` (`zone_view_assignments_zone_name`,
+    `zone_view_assignments_view_dependency`)
+    ON DELETE CASCADE ON UPDATE CASCADE
+
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
 ##########
 # Things that are expected in the db that are not schema.
 ##########
 
-INSERT INTO locks (lock_name) VALUES ('db_lock_lock');
 INSERT INTO locks (lock_name) VALUES ('maintenance');
 
 INSERT INTO view_dependencies (view_dependency) VALUES ('any');
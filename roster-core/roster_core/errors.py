@@ -35,6 +35,8 @@ __license__ = 'BSD'
 __version__ = '#TRUNK#'
 
 PARSABLE_MYSQL_ERRORS = [1452]
+# MySQL server has gone away, Lost connection to MySQL server during query
+LOST_CONNECTION_MYSQL_ERRORS = [2006, 2013]
 
 class CoreError(Exception):
   """Error class that all Roster errors are 
@@ -35,19 +35,50 @@ __license__ = 'BSD'
 __version__ = '#TRUNK#'
 
 
-import inspect
+import hashlib
 import IPy
 import math
+import sys
 import dns.zone
 
 import constants
 import copy
 import errors
+import ip_lib
+
+
+# Function name and argument names of the functions that called
+# GetFunctionNameAndArgs, keyed by code object
+audited_functions = {}
+
+
+def _GetAuditedFunction(code):
+  """Finds the name and argument names of a function from its code object
+  and remembers them in audited_functions.
+
+  Inputs:
+    code: code object of a function
+
+  Outputs:
+    tuple: function name and tuple of argument names without self
+  """
+  arg_names = []
+  for arg_name in code.co_varnames[:code.co_argcount]:
+    if( arg_name == 'self' ):
+      continue
+    arg_names.append(arg_name)
+  audited_functions[code] = (unicode(code.co_name), tuple(arg_names))
+  return audited_functions[code]
 
 
 def GetFunctionNameAndArgs():
-  """Grabs the current frame and adjacent frames then finds the calling
-  function name and arguments and returns them.
+  """Grabs the calling frame then finds the calling function name and
+  arguments and returns them.
+
+  The name and argument names of a function are read from its code object
+  the first time it calls this and looked up by code object after that.
+  Argument values are read from the calling frame when this is called, so
+  arguments changed before the call are logged as changed.
 
   Outputs:
     tuple: function name and current args
@@ -55,27 +86,21 @@ def GetFunctionNameAndArgs():
                         'audit_args': {'access_level': 64,
                                        'user_name': u'ahoward'}}
   """
-  current_frame = inspect.currentframe()
+  calling_frame = sys._getframe(1)
   try:
-    outer_frames = inspect.getouterframes(current_frame)
-    try:
-      function_name = unicode(outer_frames[1][3])
-      calling_frame = outer_frames[1][0]
-      try:
-        arg_values = inspect.getargvalues(calling_frame)
-      finally:
-        del calling_frame
-    finally:
-      del outer_frames
+    code = calling_frame.f_code
+    if( code in audited_functions ):
+      function_name, arg_names = audited_functions[code]
+    else:
+      function_name, arg_names = _GetAuditedFunction(code)
+    local_variables = calling_frame.f_locals
   finally:
-    del current_frame
+    del calling_frame
   replay_args = []
   audit_args = {}
-  for arg in arg_values[0]:
-    if( arg == 'self' ):
-      continue
-    audit_args[arg] = arg_values[3][arg]
-    replay_args.append(arg_values[3][arg])
+  for arg_name in arg_names:
+    audit_args[arg_name] = local_variables[arg_name]
+    replay_args.append(local_variables[arg_name])
   current_args = {'audit_args': audit_args, 'replay_args': replay_args}
   return (function_name, current_args)
 
@@ -207,22 +232,23 @@ def CIDRExpand(cidr_block, begin=None, end=None):
     list: list of ip addresses in strings
   """
   try:
-    cidr_block = IPy.IP(cidr_block)
+    network = ip_lib.ParseIP(cidr_block)
   except ValueError:
     raise errors.InvalidInputError('%s is not a valid cidr block' % cidr_block)
   ip_address_list = []
   end_count = -1
-  length = cidr_block.len()
+  length = ip_lib.GetNetworkSize(network[0], network[2])
   count = 0
-  start_ip = cidr_block.int()
+  start_ip = network[1]
   if( begin ):
-    start_ip = cidr_block.int() + begin
+    start_ip = network[1] + begin
   if( begin and end ):
     end_count = end - begin
   elif( end ):
     end_count = end
-  while( count != end_count and count != length and IPy.IP(start_ip + count) in cidr_block ):
-    ip_address_list.append(unicode(IPy.IP(start_ip + count).strFullsize()))
+  while( count != end_count and count != length and
+         ip_lib.Contains(network, ip_lib.ParseInt(start_ip + count)) ):
+    ip_address_list.append(unicode(ip_lib.FormatIP(start_ip + count)))
     count += 1
 
   return ip_address_list
@@ -242,14 +268,14 @@ def ExpandIPV6(ip_address):
     string: string of long ipv6 address
   """
   try:
-    ipv6_address = IPy.IP(ip_address)
+    version, ip, prefix_length = ip_lib.ParseIP(ip_address)
   except ValueError:
     raise errors.InvalidInputError('%s is not a valid IP address' % ip_address)
-  if( ipv6_address.version() != 6 ):
+  if( version != 6 ):
     raise errors.InvalidInputError('"%s" is not a valid IPV6 address.' % (
-        ipv6_address))
+        ip_lib.FormatIP(ip, version, prefix_length)))
 
-  return ipv6_address.strFullsize()
+  return ip_lib.FormatIP(ip, version, prefix_length)
 
 def UnExpandIPV6(ip_address):
   """Unexpands a full ipv6 address to a shorthand ipv6 address
@@ -424,7 +450,8 @@ def GetRecordsFromRecordRowsAndArgumentRows(record_data, record_args_dict):
 
   Inputs:
     record_data: List of rows from ListRow with records and
-                 records_arguments_record_assignments joined.
+                 records_arguments_record_assignments joined, the rows can
+                 be dicts or CompactRows.
 
   Outputs:
     list of record dictionaries
@@ -500,6 +527,39 @@ def GetRecordsFromRecordRowsAndArgumentRows(record_data, record_args_dict):
 
   return full_record_dicts.values()
 
+def GetRecordFingerprint(record_type, target, record_args_dict):
+  """Gets the fingerprint of a record from its type, target and arguments.
+  Two records in the same zone and view dependency are duplicates when their
+  fingerprints are the same.
+
+  Inputs:
+    record_type: string of record type
+    target: string of record target
+    record_args_dict: dictionary of record arguments, values are compared as
+                      they are stored so 10 and u'10' are the same
+
+  Outputs:
+    unicode: hex SHA-1 digest of the record
+      example: u'2f8d26f5a4fe3f27ccb30a90288a871e38f1d6b4'
+  """
+  excluded_arguments = constants.RECORD_FINGERPRINT_EXCLUDED_ARGUMENTS.get(
+      record_type, [])
+  fingerprint_fields = [record_type, target]
+  for argument_name in sorted(record_args_dict):
+    if( argument_name in excluded_arguments ):
+      continue
+    fingerprint_fields.append(argument_name)
+    fingerprint_fields.append(record_args_dict[argument_name])
+  # Each field is length prefixed so separators inside a value can not make
+  # two different records hash the same.
+  prefixed_fields = []
+  for field in fingerprint_fields:
+    field = unicode(field)
+    prefixed_fields.append(u'%d:%s' % (len(field), field))
+  fingerprint_string = u''.join(prefixed_fields)
+  return unicode(hashlib.sha1(
+      fingerprint_string.encode('utf-8')).hexdigest())
+
 def UnicodeString(string):
   """Returns unicode string if object is a string
 
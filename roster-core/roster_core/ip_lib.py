@@ -0,0 +1,399 @@
+#!/usr/bin/python
+
+# Copyright (c) 2009, Purdue University
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+# 
+# Neither the name of the Purdue University nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Integer based IP address library for Roster.
+
+IP addresses and networks are handled as tuples of
+(version, integer ip address, prefix length), which is the same information
+an IPy.IP object holds, without building an object for every address.
+Strings are parsed and formatted the same way IPy does it, so results can be
+swapped in for IPy in hot paths.
+"""
+
+__copyright__ = 'Copyright (C) 2009, Purdue University'
+__license__ = 'BSD'
+__version__ = '#TRUNK#'
+
+
+import collections
+import re
+import threading
+
+import IPy
+
+import constants
+
+
+MAX_IPV4_ADDRESS = 0xffffffff
+MAX_IPV6_ADDRESS = 0xffffffffffffffffffffffffffffffff
+IP_VERSION_BITS = {4: 32, 6: 128}
+
+IPV4_NETWORK_REGEX = re.compile(r'^(\d{1,3}(?:\.\d{1,3}){1,3})(?:/(\d{1,3}))?$')
+IPV6_NETWORK_REGEX = re.compile(r'^([0-9a-fA-F:]+)(?:/(\d{1,3}))?$')
+
+parse_cache = collections.OrderedDict()
+parse_cache_lock = threading.Lock()
+
+
+def ParseIP(ip_string):
+  """Parses an IP address or network string the same way IPy.IP does.
+
+  Results are kept in a least recently used cache, since the same few
+  addresses and cidr blocks are parsed over and over.
+
+  Inputs:
+    ip_string: string of ip address or cidr block
+
+  Raises:
+    ValueError: Not a valid IP address or cidr block.
+
+  Outputs:
+    tuple: (version, integer ip address, prefix length)
+      example: (4, 3232235776, 24)
+  """
+  parse_cache_lock.acquire()
+  try:
+    ip_tuple = parse_cache.pop(ip_string, None)
+    if( ip_tuple is not None ):
+      parse_cache[ip_string] = ip_tuple
+      return ip_tuple
+  finally:
+    parse_cache_lock.release()
+
+  ip_tuple = _ParseIPString(ip_string)
+
+  parse_cache_lock.acquire()
+  try:
+    parse_cache[ip_string] = ip_tuple
+    while( len(parse_cache) > constants.IP_PARSE_CACHE_SIZE ):
+      parse_cache.popitem(last=False)
+  finally:
+    parse_cache_lock.release()
+  return ip_tuple
+
+def _ParseIPString(ip_string):
+  """Parses an IP address or network string without the cache.
+
+  The common dotted quad and hex group notations are parsed directly,
+  everything else (ranges, netmasks, hex and decimal integers, ipv4 inside
+  of ipv6) is handed to IPy so that what is accepted does not change.
+
+  Inputs:
+    ip_string: string of ip address or cidr block
+
+  Raises:
+    ValueError: Not a valid IP address or cidr block.
+
+  Outputs:
+    tuple: (version, integer ip address, prefix length)
+  """
+  ip_tuple = None
+  if( isinstance(ip_string, basestring) ):
+    ipv4_match = IPV4_NETWORK_REGEX.match(ip_string)
+    if( ipv4_match ):
+      ip_tuple = _ParseIPv4(*ipv4_match.groups())
+    else:
+      ipv6_match = IPV6_NETWORK_REGEX.match(ip_string)
+      if( ipv6_match and ':' in ip_string ):
+        ip_tuple = _ParseIPv6(*ipv6_match.groups())
+  if( ip_tuple is None ):
+    ip_object = IPy.IP(ip_string)
+    ip_tuple = (ip_object.version(), ip_object.int(), ip_object.prefixlen())
+  return ip_tuple
+
+def _ParseIPv4(address, prefix_length):
+  """Parses a dotted ipv4 address, padding missing octets with zeros.
+
+  Inputs:
+    address: string of one to four dotted decimal octets
+    prefix_length: string of prefix length or None
+
+  Outputs:
+    tuple: (4, integer ip address, prefix length) or None if IPy should
+           decide what is wrong with the address
+  """
+  ip = 0
+  octets = address.split('.')
+  octets += ['0'] * (4 - len(octets))
+  for octet in octets:
+    octet = int(octet)
+    if( octet > 255 ):
+      return None
+    ip = (ip << 8) + octet
+  return _CheckNetwork(4, ip, prefix_length)
+
+def _ParseIPv6(address, prefix_length):
+  """Parses a colon separated ipv6 address with at most one '::'.
+
+  Inputs:
+    address: string of hex groups
+    prefix_length: string of prefix length or None
+
+  Outputs:
+    tuple: (6, integer ip address, prefix length) or None if IPy should
+           decide what is wrong with the address
+  """
+  if( address.count('::') > 1 ):
+    return None
+  if( '::' in address ):
+    head, tail = address.split('::')
+    head_groups = head and head.split(':') or []
+    tail_groups = tail and tail.split(':') or []
+    if( len(head_groups) + len(tail_groups) > 7 ):
+      return None
+    groups = head_groups + ['0'] * (
+        8 - len(head_groups) - len(tail_groups)) + tail_groups
+  else:
+    groups = address.split(':')
+    if( len(groups) != 8 ):
+      return None
+  ip = 0
+  for group in groups:
+    if( not group or len(group) > 4 ):
+      return None
+    ip = (ip << 16) + int(group, 16)
+  return _CheckNetwork(6, ip, prefix_length)
+
+def _CheckNetwork(version, ip, prefix_length):
+  """Checks a prefix length against the network address it belongs to.
+
+  Inputs:
+    version: integer of ip version
+    ip: integer of network address
+    prefix_length: string of prefix length or None
+
+  Outputs:
+    tuple: (version, integer ip address, prefix length) or None if IPy should
+           decide what is wrong with the network
+  """
+  if( prefix_length is None ):
+    return (version, ip, IP_VERSION_BITS[version])
+  prefix_length = int(prefix_length)
+  if( prefix_length > IP_VERSION_BITS[version] or
+      ip & ~GetNetmask(version, prefix_length) ):
+    return None
+  return (version, ip, prefix_length)
+
+def ParseInt(ip):
+  """Makes a single address tuple out of an integer the same way IPy.IP does,
+  integers that fit in 32 bits are ipv4 and larger integers are ipv6.
+
+  Inputs:
+    ip: integer of ip address
+
+  Raises:
+    ValueError: Integer is larger than any ipv6 address.
+
+  Outputs:
+    tuple: (version, integer ip address, prefix length)
+  """
+  if( ip <= MAX_IPV4_ADDRESS ):
+    return (4, ip, 32)
+  if( ip <= MAX_IPV6_ADDRESS ):
+    return (6, ip, 128)
+  raise ValueError("IPv6 Address can't be larger than %x: %x" % (
+      MAX_IPV6_ADDRESS, ip))
+
+def GetNetmask(version, prefix_length):
+  """Gets the netmask of a prefix length.
+
+  Inputs:
+    version: integer of ip version
+    prefix_length: integer of prefix length
+
+  Outputs:
+    int: netmask
+  """
+  bits = IP_VERSION_BITS[version]
+  return ((1 << prefix_length) - 1) << (bits - prefix_length)
+
+def GetNetworkSize(version, prefix_length):
+  """Gets the number of addresses in a network.
+
+  Inputs:
+    version: integer of ip version
+    prefix_length: integer of prefix length
+
+  Outputs:
+    int: number of addresses
+  """
+  return 1 << (IP_VERSION_BITS[version] - prefix_length)
+
+def GetBroadcast(network):
+  """Gets the last address of a network.
+
+  Inputs:
+    network: tuple of (version, integer ip address, prefix length)
+
+  Outputs:
+    int: last ip address in the network
+  """
+  version, ip, prefix_length = network
+  return ip + GetNetworkSize(version, prefix_length) - 1
+
+def Contains(network, other_network):
+  """Checks if a network or address is inside of another network. This
+  matches "other in network" for two IPy.IP objects.
+
+  Inputs:
+    network: tuple of (version, integer ip address, prefix length)
+    other_network: tuple of (version, integer ip address, prefix length)
+
+  Outputs:
+    bool: if other_network is inside of network
+  """
+  if( network[0] != other_network[0] ):
+    return False
+  return (other_network[1] >= network[1] and
+          GetBroadcast(other_network) <= GetBroadcast(network))
+
+def Overlaps(network, other_network):
+  """Checks if two networks share any addresses. Like IPy.IP.overlaps only
+  the integers are compared, not the ip versions.
+
+  Inputs:
+    network: tuple of (version, integer ip address, prefix length)
+    other_network: tuple of (version, integer ip address, prefix length)
+
+  Outputs:
+    bool: if the networks overlap
+  """
+  return (network[1] <= GetBroadcast(other_network) and
+          other_network[1] <= GetBroadcast(network))
+
+def FormatIP(ip, version=None, prefix_length=None):
+  """Formats an integer ip address like IPy.IP.strFullsize, ipv6 addresses
+  are expanded to eight groups of four hex digits.
+
+  Inputs:
+    ip: integer of ip address
+    version: integer of ip version, guessed from the size of ip if None
+    prefix_length: integer of prefix length, only printed for networks
+
+  Raises:
+    ValueError: Integer is not a valid ip address.
+
+  Outputs:
+    string: ip address
+      example: '2001:0db8:0000:0000:0000:0000:0000:0001'
+  """
+  if( version is None ):
+    version = ParseInt(ip)[0]
+  if( ip < 0 or ip > (1 << IP_VERSION_BITS[version]) - 1 ):
+    raise ValueError('%s is not a valid IPv%s address' % (ip, version))
+  if( version == 4 ):
+    ip_string = '%d.%d.%d.%d' % (ip >> 24, (ip >> 16) & 0xff,
+                                 (ip >> 8) & 0xff, ip & 0xff)
+  else:
+    hex_string = '%032x' % ip
+    ip_string = ':'.join([hex_string[index:index + 4] for index in
+                          xrange(0, 32, 4)])
+  if( prefix_length is not None and
+      prefix_length != IP_VERSION_BITS[version] ):
+    ip_string = '%s/%s' % (ip_string, prefix_length)
+  return ip_string
+
+def ExpandIP(ip_string):
+  """Expands an IP address or network string, the same as
+  IPy.IP(ip_string).strFullsize().
+
+  Inputs:
+    ip_string: string of ip address or cidr block
+
+  Raises:
+    ValueError: Not a valid IP address or cidr block.
+
+  Outputs:
+    string: expanded ip address or cidr block
+  """
+  version, ip, prefix_length = ParseIP(ip_string)
+  return FormatIP(ip, version, prefix_length)
+
+class NetworkTrie(object):
+  """Binary prefix trie of networks, with a separate root for each ip
+  version. Finding every network that overlaps an address or network walks
+  one bit at a time down the trie instead of comparing against every network.
+
+  Nodes are lists of [zero child, one child, list of values].
+  """
+
+  def __init__(self):
+    self.roots = {}
+    for version in IP_VERSION_BITS:
+      self.roots[version] = [None, None, []]
+
+  def Insert(self, network, value):
+    """Adds a network to the trie.
+
+    Inputs:
+      network: tuple of (version, integer ip address, prefix length)
+      value: value stored for the network
+    """
+    version, ip, prefix_length = network
+    bits = IP_VERSION_BITS[version]
+    node = self.roots[version]
+    for bit_index in xrange(prefix_length):
+      bit = (ip >> (bits - 1 - bit_index)) & 1
+      if( node[bit] is None ):
+        node[bit] = [None, None, []]
+      node = node[bit]
+    node[2].append(value)
+
+  def FindOverlapping(self, network):
+    """Finds the values of every network overlapping a network or address of
+    the same ip version, both the networks containing it and the networks
+    inside of it.
+
+    Inputs:
+      network: tuple of (version, integer ip address, prefix length)
+
+    Outputs:
+      list: values of overlapping networks, the networks containing it first
+    """
+    version, ip, prefix_length = network
+    bits = IP_VERSION_BITS[version]
+    node = self.roots[version]
+    values = list(node[2])
+    for bit_index in xrange(prefix_length):
+      node = node[(ip >> (bits - 1 - bit_index)) & 1]
+      if( node is None ):
+        return values
+      values.extend(node[2])
+
+    children = [node[0], node[1]]
+    while( children ):
+      node = children.pop()
+      if( node is not None ):
+        values.extend(node[2])
+        children.extend((node[0], node[1]))
+    return values
+
+
+# vi: set ai aw sw=2:
@@ -39,11 +39,131 @@ __license__ = 'BSD'
 __version__ = '#TRUNK#'
 
 
-import IPy
+import threading
+import time
 
 import constants
 import errors
 import helpers_lib
+import ip_lib
+
+
+# Authorization snapshots keyed by database host, database name and user name.
+# A snapshot is only used while the authorization generation of its database
+# is still the one it was built at, and for up to authorization_ttl seconds
+# before its constants.AUTHORIZATION_GENERATIONS in the generations table are
+# read again to find changes made by other processes.
+authorization_snapshots = {}
+authorization_snapshots_lock = threading.Lock()
+
+
+def GetAuthorizationSnapshot(user_name, db_instance):
+  """Gets the authorization snapshot of a user, building it only if the
+  permission, group or zone tables changed since it was last built. Changes
+  committed by other processes are found in the generations table, which is
+  read when the snapshot is older than the authorization_ttl of db_instance.
+
+  Inputs:
+    user_name: string of user name
+    db_instance: dbAccess instance to build the snapshot with
+
+  Raises:
+    InvalidInputError: No such user.
+
+  Outputs:
+    dict: authorization snapshot, which must not be changed
+      example: {'user_perms': {'user_name': u'shuey', ...},
+                'zone_origins': {u'cs.university.edu':
+                                     [u'cs.university.edu.']},
+                'forward_zone_permissions': {u'cs.university.edu':
+                                                 [u'a', u'aaaa']},
+                'reverse_range_trie': ip_lib.NetworkTrie instance,
+                'abilities': {'ListUsers': {...}}}
+  """
+  snapshot_key = (db_instance.db_host, db_instance.db_name, user_name)
+  generation = db_instance.GetAuthorizationGeneration()
+  authorization_snapshots_lock.acquire()
+  try:
+    cached_snapshot = authorization_snapshots.get(snapshot_key)
+  finally:
+    authorization_snapshots_lock.release()
+  if( cached_snapshot is not None and cached_snapshot[0] == generation and
+      cached_snapshot[2] > time.time() ):
+    return cached_snapshot[3]
+
+  # The generations are read before building, so a change committed while
+  # the snapshot is built makes it stale straight away.
+  database_generations = db_instance.GetDatabaseGenerations(
+      constants.AUTHORIZATION_GENERATIONS)
+  expiry = time.time() + db_instance.authorization_ttl
+  if( cached_snapshot is not None and
+      cached_snapshot[:2] == (generation, database_generations) ):
+    snapshot = cached_snapshot[3]
+  else:
+    snapshot = _BuildAuthorizationSnapshot(user_name, db_instance)
+
+  authorization_snapshots_lock.acquire()
+  try:
+    authorization_snapshots[snapshot_key] = (generation, database_generations,
+                                             expiry, snapshot)
+  finally:
+    authorization_snapshots_lock.release()
+  return snapshot
+
+def _BuildAuthorizationSnapshot(user_name, db_instance):
+  """Builds the authorization snapshot of a user from the database.
+
+  Inputs:
+    user_name: string of user name
+    db_instance: dbAccess instance to build the snapshot with
+
+  Raises:
+    InvalidInputError: No such user.
+
+  Outputs:
+    dict: authorization snapshot, see GetAuthorizationSnapshot
+  """
+  # pull a pile of authentication info from the database here
+  user_perms = db_instance.GetUserAuthorizationInfo(user_name)
+  if( not user_perms.has_key('user_name') ):
+    raise errors.InvalidInputError("No such user: %s" % user_name)
+
+  # Pull zone origins for cache
+  zone_origins = {}
+  db_instance.StartTransaction()
+  try:
+    all_zone_origins = db_instance.GetZoneOrigins(None, None)
+    for zone in user_perms['forward_zones']:
+      if( zone['zone_name'] in all_zone_origins ):
+        zone_origins[zone['zone_name']] = all_zone_origins[zone['zone_name']]
+  finally:
+    db_instance.EndTransaction()
+
+  forward_zone_permissions = {}
+  for zone in user_perms['forward_zones']:
+    forward_zone_permissions.setdefault(zone['zone_name'], []).append(
+        zone['group_permission'])
+
+  # Reverse ranges are looked up by prefix, so users with thousands of them
+  # do not compare every one of them against every record.
+  reverse_range_trie = ip_lib.NetworkTrie()
+  for reverse_range in user_perms['reverse_ranges']:
+    reverse_range_trie.Insert(ip_lib.ParseIP(reverse_range['cidr_block']),
+                              reverse_range['group_permission'])
+
+  # Build a hash of methods, using the supported_method hash
+  abilities = {}
+  for method in constants.SUPPORTED_METHODS.keys():
+    if( constants.SUPPORTED_METHODS[method]['access_level'] <=
+        user_perms['user_access_level'] ):
+      abilities[method] = constants.SUPPORTED_METHODS[method]
+
+  return {'user_perms': user_perms,
+          'zone_origins': zone_origins,
+          'forward_zone_permissions': forward_zone_permissions,
+          'reverse_range_trie': reverse_range_trie,
+          'abilities': abilities}
+
 
 class User(object):
   """Representation of a user, with basic manipulation methods.
@@ -63,35 +183,23 @@ class User(object):
     self.user_name = user_name
     self.db_instance = db_instance
     self.log_instance = log_instance
-    self.zone_origin_cache = {}
-
-    # pull a pile of authentication info from the database here
-    self.user_perms = self.db_instance.GetUserAuthorizationInfo(user_name)
-    if( not self.user_perms.has_key('user_name') ):
-      raise errors.InvalidInputError("No such user: %s" % user_name)
 
-    # More DB crud
+    # Authorization info is shared by every User of the same user name until
+    # permissions, groups or zones change.
+    snapshot = GetAuthorizationSnapshot(user_name, db_instance)
+    self.user_perms = snapshot['user_perms']
     self.groups = self.user_perms['groups']
     self.forward_zones = self.user_perms['forward_zones']
     self.reverse_ranges = self.user_perms['reverse_ranges']
-    self.user_access_level = ual = self.user_perms['user_access_level']
-
-    # Pull zone origins for cache
-    self.db_instance.StartTransaction()
-    try:
-      all_zone_origins = self.db_instance.GetZoneOrigins(None, None)
-      for zone in self.forward_zones:
-        if( zone['zone_name'] in all_zone_origins ):
-          self.zone_origin_cache[
-              zone['zone_name']] = all_zone_origins[zone['zone_name']]
-    finally:
-      self.db_instance.EndTransaction()
-
-    # Build a hash of methods, using the supported_method hash
-    self.abilities = {}
-    for method in constants.SUPPORTED_METHODS.keys():
-      if( constants.SUPPORTED_METHODS[method]['access_level'] <= ual ):
-        self.abilities[method] = constants.SUPPORTED_METHODS[method]
+    self.user_access_level = self.user_perms['user_access_level']
+    self.forward_zone_permissions = snapshot['forward_zone_permissions']
+    self.reverse_range_trie = snapshot['reverse_range_trie']
+    self.abilities = snapshot['abilities']
+    # Origins pulled by Authorize are added to this, so it is not shared.
+    self.zone_origin_cache = dict(snapshot['zone_origins'])
+    # Zone names keyed by origin, built the first time a hostname is looked
+    # up and kept current with zone_origin_cache after that.
+    self.origin_zones = None
 
   def Authorize(self, method, record_data=None, current_transaction=False):
     """Check to see if the user is authorized to run the given operation.
@@ -118,19 +226,24 @@ class User(object):
     """
     function_name, current_args = helpers_lib.GetFunctionNameAndArgs()
 
-    if( not current_transaction ):
-      self.db_instance.StartTransaction()
-    try:
-      maintenance_mode = self.db_instance.CheckMaintenanceFlag()
-      if( record_data and record_data.has_key('zone_name') ):
-        if( record_data['zone_name'] ):
+    # With the maintenance flag cached the database is only needed for
+    # zone origins.
+    maintenance_mode = self.db_instance.GetCachedMaintenanceFlag()
+    pull_zone_origins = bool(record_data and record_data.get('zone_name'))
+    if( maintenance_mode is None or pull_zone_origins ):
+      if( not current_transaction ):
+        self.db_instance.StartTransaction()
+      try:
+        if( maintenance_mode is None ):
+          maintenance_mode = self.db_instance.CheckMaintenanceFlag()
+        if( pull_zone_origins ):
           pulled_origin = self.db_instance.GetZoneOrigins(
               record_data['zone_name'], record_data['view_name'])
 
           #Making sure we pulled something that exists
           if( pulled_origin is not None ):
-            self.zone_origin_cache[record_data['zone_name']] = pulled_origin[
-                record_data['zone_name']]
+            self._CacheZoneOrigins(record_data['zone_name'],
+                                   pulled_origin[record_data['zone_name']])
           else:
             view_name = record_data['view_name']
             if( view_name.endswith('_dep') ):
@@ -139,14 +252,119 @@ class User(object):
             raise errors.UnexpectedDataError('Specified zone-view assignment '
                 'does not exist for zone %s view %s' % (
                     record_data['zone_name'], view_name))
-    finally:
+      finally:
+        if( not current_transaction ):
+          self.db_instance.EndTransaction()
+
+    self._CheckMaintenanceMode(maintenance_mode)
+    self._AuthorizeRecord(method, record_data, function_name, current_args,
+                          current_transaction)
+
+  def AuthorizeMany(self, method, records, current_transaction=False):
+    """Checks if the user is authorized to run the given operation on every
+    record of a list. The maintenance flag is checked once and the zone
+    origins of every zone in the list are pulled with one query, then every
+    record is checked, so all of the failures are found at once.
+
+    Inputs:
+      method: what the user's trying to do
+      records: list of record_data dictionaries, see Authorize
+      current_transaction: bool of if this function is run from inside a
+                           transaction in the db_access class
+
+    Raises:
+      MaintenanceError: Roster is currently under maintenance.
+
+    Outputs:
+      list: errors of the records that failed, in the order of records
+        example: [AuthorizationError('User jcollins is not allowed to use '
+                                     'MakeRecord with host1 on test_zone of '
+                                     'type a')]
+    """
+    zone_names = []
+    for record_data in records:
+      if( record_data and record_data.get('zone_name') ):
+        zone_names.append(record_data['zone_name'])
+
+    maintenance_mode = self.db_instance.GetCachedMaintenanceFlag()
+    zone_origins = {}
+    if( maintenance_mode is None or zone_names ):
       if( not current_transaction ):
-        self.db_instance.EndTransaction()
+        self.db_instance.StartTransaction()
+      try:
+        if( maintenance_mode is None ):
+          maintenance_mode = self.db_instance.CheckMaintenanceFlag()
+        if( zone_names ):
+          zone_origins = self.db_instance.GetZoneOriginsByView(zone_names)
+      finally:
+        if( not current_transaction ):
+          self.db_instance.EndTransaction()
+
+    self._CheckMaintenanceMode(maintenance_mode)
+
+    failures = []
+    for record_data in records:
+      # Failures are logged the same way as they are by Authorize
+      current_args = {
+          'audit_args': {'method': method, 'record_data': record_data,
+                         'current_transaction': current_transaction},
+          'replay_args': [method, record_data, current_transaction]}
+      try:
+        if( record_data and record_data.get('zone_name') ):
+          view_origins = zone_origins.get(record_data['zone_name'], {})
+          if( record_data['view_name'] is None ):
+            origins = []
+            for view_dependency in sorted(view_origins):
+              for origin in view_origins[view_dependency]:
+                if( origin not in origins ):
+                  origins.append(origin)
+          else:
+            origins = view_origins.get(record_data['view_name'])
+          if( not origins ):
+            view_name = record_data['view_name'] or u''
+            if( view_name.endswith('_dep') ):
+              view_name = view_name[:-4] #Strip off '_dep'
+            raise errors.UnexpectedDataError('Specified zone-view assignment '
+                'does not exist for zone %s view %s' % (
+                    record_data['zone_name'], view_name))
+          self._CacheZoneOrigins(record_data['zone_name'], origins)
+        self._AuthorizeRecord(method, record_data, u'Authorize', current_args,
+                              current_transaction)
+      except (errors.AuthorizationError, errors.UnexpectedDataError,
+              errors.MissingDataTypeError), error:
+        failures.append(error)
+    return failures
+
+  def _CheckMaintenanceMode(self, maintenance_mode):
+    """Checks that the user can make changes in maintenance mode.
 
+    Inputs:
+      maintenance_mode: bool of if Roster is under maintenance
+
+    Raises:
+      MaintenanceError: Roster is currently under maintenance.
+    """
     if( maintenance_mode and self.user_perms['user_access_level']
         != constants.ACCESS_LEVELS['dns_admin'] ):
       raise errors.MaintenanceError('Roster is currently under maintenance.')
 
+  def _AuthorizeRecord(self, method, record_data, function_name, current_args,
+                       current_transaction):
+    """Checks if the user is authorized to run the given operation on a
+    record, once the zone origins of the record are in the zone origin cache.
+
+    Inputs:
+      method: what the user's trying to do
+      record_data: dictionary of record data, see Authorize
+      function_name: string of function name failures are logged as
+      current_args: dictionary of arguments failures are logged with
+      current_transaction: bool of if this function is run from inside a
+                           transaction in the db_access class
+
+    Raises:
+      MissingDataTypeError: Incomplete record data provided for access method.
+      AuthorizationError: Authorization failure.
+    """
     if( record_data is not None and record_data.has_key('zone_name') ):
       target_string = ' with %s on %s of type %s' % (record_data['target'],
                                           record_data['zone_name'],
@@ -167,18 +385,17 @@ class User(object):
                 origin))
 
           #Looking for permissions in the forward zones
-          for zone in self.user_perms['forward_zones']:
-            if( zone['zone_name'] == record_data['zone_name'] ):
-              user_group_perms[origin].append(zone['group_permission'])
+          user_group_perms[origin].extend(self.forward_zone_permissions.get(
+              record_data['zone_name'], []))
 
           #If we haven't found any, look in the reverse ranges
           if( user_group_perms[origin] == [] ):
             validation_instance = self.db_instance.data_validation_instance
             if( validation_instance.isIPv4IPAddress(ip_address) or
                 validation_instance.isIPv6IPAddress(ip_address) ):
-              for cidr in self.user_perms['reverse_ranges']:
-                if( IPy.IP(cidr['cidr_block']).overlaps(ip_address) ):
-                  user_group_perms[origin].append(cidr['group_permission'])
+              ip = ip_lib.ParseIP(ip_address)
+              user_group_perms[origin].extend(
+                  self.reverse_range_trie.FindOverlapping(ip))
     else:
       target_string = ''
     auth_fail_string = ('User %s is not allowed to use %s%s' %
@@ -226,11 +443,9 @@ class User(object):
 
           # if a or aaaa
           if( record_data['record_args_dict'].has_key(u'assignment_ip') ):
-            ip = IPy.IP(record_data['record_args_dict'][u'assignment_ip'])
-            for reverse_range in self.reverse_ranges:
-              if( IPy.IP(reverse_range['cidr_block']).overlaps(ip) ):
-                break
-            else:
+            ip = ip_lib.ParseIP(
+                record_data['record_args_dict'][u'assignment_ip'])
+            if( not self.reverse_range_trie.FindOverlapping(ip) ):
               raise errors.AuthorizationError(auth_fail_string)
 
           # if cname, mx, ns, or ptr
@@ -244,48 +459,27 @@ class User(object):
               hostname = record_data['record_args_dict'][u'mail_server']
             elif( record_data['record_args_dict'].has_key(u'name_server') ):
               hostname = record_data['record_args_dict'][u'name_server']
-            smallest_zone = hostname
-
-            found = False
-            while( smallest_zone ):
-              for domain in self.zone_origin_cache:
-                for origin in self.zone_origin_cache[domain]:
-                  if( smallest_zone == origin ):
-                    found = True
-              if( not found ):
-                try:
-                  smallest_zone = smallest_zone.split('.', 1)[1]
-                except IndexError:
-                  break
-              else:
-                break
-            if( not found ):
+            smallest_zone = self._FindZoneOrigin(hostname)
+            if( smallest_zone is None ):
               raise errors.AuthorizationError(auth_fail_string)
 
-            for zone in self.forward_zones:
-              if( self.zone_origin_cache.has_key(zone['zone_name']) ):
-                found = False
-                for origin in self.zone_origin_cache[zone['zone_name']]:
-                  if( smallest_zone == origin ):
-                    found = True
-                    break
-                if( found ):
-                  break
+            # The zone the hostname is in has to be one of the user's
+            for zone_name in self.origin_zones[smallest_zone]:
+              if( zone_name in self.forward_zone_permissions ):
+                break
             else:
               raise errors.AuthorizationError(auth_fail_string)
 
-        for forward_zone in self.forward_zones:
-          if( record_data['zone_name'] == forward_zone['zone_name'] ):
-            return
+        if( record_data['zone_name'] in self.forward_zone_permissions ):
+          return
 
         # Can't find it in forward zones, maybe it's a reverse
         try:
-          ip = IPy.IP(ip_address)
+          ip = ip_lib.ParseIP(ip_address)
 
           # Good, we have an IP.  See if we hit any delegated ranges.
-          for reverse_range in self.reverse_ranges:
-            if( IPy.IP(reverse_range['cidr_block']).overlaps(ip) ):
-              return
+          if( self.reverse_range_trie.FindOverlapping(ip) ):
+            return
 
           # fail to find a matching IP range with appropriate perms
           self.log_instance.LogAction(self.user_name, function_name,
@@ -305,6 +499,54 @@ class User(object):
                                   current_args, False, current_transaction)
       raise errors.AuthorizationError(auth_fail_string)
 
+  def _CacheZoneOrigins(self, zone_name, origins):
+    """Sets the origins of a zone in the zone origin cache, keeping the
+    index of zones by origin current.
+
+    Inputs:
+      zone_name: string of zone name
+      origins: list of origins of the zone
+    """
+    old_origins = self.zone_origin_cache.get(zone_name)
+    if( old_origins == origins ):
+      return
+    if( self.origin_zones is not None ):
+      for origin in old_origins or []:
+        self.origin_zones[origin].discard(zone_name)
+        if( not self.origin_zones[origin] ):
+          del self.origin_zones[origin]
+      for origin in origins:
+        self.origin_zones.setdefault(origin, set()).add(zone_name)
+    self.zone_origin_cache[zone_name] = origins
+
+  def _FindZoneOrigin(self, hostname):
+    """Finds the origin of the zone a hostname is in. Labels are taken off
+    the front of the hostname until it is the origin of a zone in the zone
+    origin cache, so the longest matching origin is found.
+
+    Inputs:
+      hostname: string of hostname
+        example: u'host.cs.university.edu.'
+
+    Outputs:
+      string: origin, or None if the hostname is in none of the zones
+        example: u'cs.university.edu.'
+    """
+    if( self.origin_zones is None ):
+      self.origin_zones = {}
+      for zone_name, origins in self.zone_origin_cache.iteritems():
+        for origin in origins:
+          self.origin_zones.setdefault(origin, set()).add(zone_name)
+
+    while( hostname ):
+      if( hostname in self.origin_zones ):
+        return hostname
+      try:
+        hostname = hostname.split('.', 1)[1]
+      except IndexError:
+        return None
+    return None
+
   def GetUserName(self):
     """Return user name for current session.
 
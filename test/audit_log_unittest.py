@@ -43,6 +43,7 @@ __version__ = '#TRUNK#'
 import cPickle
 import datetime
 import os
+import threading
 import time
 import unicodedata
 import unittest
@@ -178,6 +179,98 @@ class TestAuditLog(unittest.TestCase):
     finally:
       os.remove(TEMP_LOG)
 
+  def testLogActionWriteBehind(self):
+    write_behind_instance = audit_log.AuditLog(
+        log_to_db=True, db_instance=self.db_instance, log_to_file=True,
+        log_file_name=TEMP_LOG, write_behind=True)
+    try:
+      for user_name in [u'ahoward', u'scook']:
+        self.assertEqual(write_behind_instance.LogAction(
+            u'sharrell', u'MakeUser',
+            {'audit_args': {'user_name': user_name, 'access_level': 64},
+             'replay_args': [user_name, 64]}, True), None)
+      # Rows queued before a synchronous action are written first.
+      self.assertEqual(write_behind_instance.LogAction(
+          u'tree_export_user', u'ExportAllBindTrees',
+          {'audit_args': {'force': False}, 'replay_args': [False]}, True,
+          synchronous=True), 3)
+      write_behind_instance.Flush()
+
+      self.db_instance.StartTransaction()
+      try:
+        audit_rows = self.db_instance.ListRow(
+            'audit_log', self.db_instance.GetEmptyRowDict('audit_log'))
+      finally:
+        self.db_instance.EndTransaction()
+      audit_rows = sorted(audit_rows, key=lambda row: row['audit_log_id'])
+      self.assertEqual([(row['audit_log_id'], row['action'])
+                        for row in audit_rows],
+                       [(1, u'MakeUser'), (2, u'MakeUser'),
+                        (3, u'ExportAllBindTrees')])
+      self.assertEqual(cPickle.loads(str(audit_rows[1]['data'])),
+                       {'audit_args': {'user_name': u'scook',
+                                       'access_level': 64},
+                        'replay_args': [u'scook', 64]})
+      self.assertEqual(audit_rows[1]['audit_log_user_name'], u'sharrell')
+      self.assertEqual(audit_rows[1]['success'], 1)
+      self.assertEqual(len(open(TEMP_LOG, 'r').readlines()), 3)
+    finally:
+      if( os.path.exists(TEMP_LOG) ):
+        os.remove(TEMP_LOG)
+
+  def testWriteBehindError(self):
+    write_behind_instance = audit_log.AuditLog(
+        log_to_db=True, db_instance=self.db_instance, write_behind=True)
+    writer = write_behind_instance.writer
+    def BadWriteActions(actions):
+      raise ValueError('bad action')
+    writer.WriteActions = BadWriteActions
+    try:
+      write_behind_instance.LogAction(
+          u'sharrell', u'MakeUser',
+          {'audit_args': {'user_name': u'ahoward', 'access_level': 64},
+           'replay_args': [u'ahoward', 64]}, True)
+      write_behind_instance.Flush()
+    finally:
+      del writer.WriteActions
+
+    # The action is dropped but the writer is still running.
+    write_behind_instance.LogAction(
+        u'sharrell', u'MakeUser',
+        {'audit_args': {'user_name': u'scook', 'access_level': 64},
+         'replay_args': [u'scook', 64]}, True)
+    write_behind_instance.Flush()
+    self.db_instance.StartTransaction()
+    try:
+      audit_rows = self.db_instance.ListRow(
+          'audit_log', self.db_instance.GetEmptyRowDict('audit_log'))
+    finally:
+      self.db_instance.EndTransaction()
+    self.assertEqual([cPickle.loads(str(row['data']))['replay_args']
+                      for row in audit_rows], [[u'scook', 64]])
+
+  def testWriteBehindFlushTimeout(self):
+    write_behind_instance = audit_log.AuditLog(
+        log_to_db=True, db_instance=self.db_instance, write_behind=True)
+    writer = write_behind_instance.writer
+    write_event = threading.Event()
+    def SlowWriteActions(actions):
+      write_event.wait()
+    writer.WriteActions = SlowWriteActions
+    try:
+      write_behind_instance.LogAction(
+          u'sharrell', u'MakeUser',
+          {'audit_args': {'user_name': u'ahoward', 'access_level': 64},
+           'replay_args': [u'ahoward', 64]}, True)
+      # The writer is stuck, Flush gives up instead of waiting forever.
+      start_time = time.time()
+      self.assertFalse(writer.Flush(0.1))
+      self.assertTrue(time.time() - start_time < 5)
+      write_event.set()
+      self.assertTrue(write_behind_instance.Flush())
+    finally:
+      write_event.set()
+      del writer.WriteActions
 
 if( __name__ == '__main__' ):
   unittest.main()
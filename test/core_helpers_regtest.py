@@ -49,6 +49,7 @@ import IPy
 
 import roster_core
 from roster_core import errors
+from roster_core import helpers_lib
 
 
 CONFIG_FILE = 'test_data/roster.conf' # Example in test_data
@@ -1706,6 +1707,41 @@ class TestCoreHelpers(unittest.TestCase):
              'record_zone_name': u'forward_zone',
              u'record_view_dependency': u'test_view', 'record_arguments':
                  {u'assignment_host': u'hostname.'}}])
+    # Records are also checked against the records before them in the batch
+    batch_record = {'record_type': u'a', 'record_target': u'batch_host',
+                    'record_zone_name': u'forward_zone',
+                    'record_arguments': {u'assignment_ip': u'192.168.1.91'},
+                    'record_view_dependency': u'test_view'}
+    batch_cname_record = {'record_type': u'cname',
+                          'record_target': u'batch_host',
+                          'record_zone_name': u'forward_zone',
+                          'record_arguments': {
+                              u'assignment_host': u'hostname.'},
+                          'record_view_dependency': u'test_view'}
+    for add_records in [[batch_record, dict(batch_record)],
+                        [batch_record, batch_cname_record],
+                        [batch_cname_record, batch_record]]:
+      self.assertRaises(errors.RecordsBatchError,
+          self.core_helper_instance.ProcessRecordsBatch,
+          add_records=add_records)
+    self.assertEqual(self.core_instance.ListRecords(target=u'batch_host'), [])
+    self.assertEqual(self.core_helper_instance.ProcessRecordsBatch(
+        add_records=[batch_record]), 1)
+    db_instance = self.core_instance.db_instance
+    db_instance.StartTransaction()
+    try:
+      self.assertEqual(db_instance.GetRecordTypesByTarget(
+          [(u'forward_zone', u'test_view_dep', u'batch_host'),
+           (u'forward_zone', u'any', u'batch_host')]),
+          {(u'forward_zone', u'test_view_dep', u'batch_host'): set([u'a'])})
+      fingerprint_key = (helpers_lib.GetRecordFingerprint(
+          u'a', u'batch_host', {u'assignment_ip': u'192.168.1.91'}),
+          u'forward_zone', u'test_view_dep')
+      self.assertEqual(db_instance.GetRecordFingerprints(
+          [fingerprint_key, (fingerprint_key[0], u'forward_zone', u'any')]),
+          set([fingerprint_key]))
+    finally:
+      db_instance.EndTransaction()
 
   def testListSortedHostsByZone(self):
     self.assertEqual( 
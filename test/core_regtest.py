@@ -51,6 +51,7 @@ import roster_core
 from roster_core import data_validation
 from roster_core import core
 from roster_core import errors
+from roster_core import helpers_lib
 
 
 CONFIG_FILE = 'test_data/roster.conf' # Example in test_data
@@ -1065,6 +1066,91 @@ class TestCore(unittest.TestCase):
                   'last_user': u'sharrell', 'zone_name': u'zone4',
                  u'admin_email': u'some_admin.', u'expiry_seconds': 1814400}]))
 
+  def testRecordFingerprints(self):
+    self.core_instance.MakeView(u'test_view')
+    self.core_instance.MakeZone(u'university.edu', u'master',
+                                u'university.edu.', view_name=u'test_view')
+    self.core_instance.MakeRecord(
+        u'soa', u'soa1', u'university.edu',
+        {u'name_server': u'ns1.university.edu.',
+         u'admin_email': u'admin.university.edu.',
+         u'serial_number': 1, u'refresh_seconds': 5,
+         u'retry_seconds': 5, u'expiry_seconds': 5,
+         u'minimum_seconds': 5}, view_name=u'test_view')
+    self.core_instance.MakeRecord(u'mx', u'@', u'university.edu',
+                                  {u'priority': 10,
+                                   u'mail_server': u'smtp.university.edu.'},
+                                  view_name=u'test_view')
+    db_instance = self.core_instance.db_instance
+    record_fingerprint_dict = db_instance.GetEmptyRowDict(
+        'record_fingerprints')
+
+    def ListFingerprints():
+      db_instance.StartTransaction()
+      try:
+        return sorted([(row['record_fingerprint'],
+                        row['record_fingerprints_zone_name'],
+                        row['record_fingerprints_view_dependency']) for row in
+                       db_instance.ListRow('record_fingerprints',
+                                           record_fingerprint_dict)])
+      finally:
+        db_instance.EndTransaction()
+
+    mx_fingerprint = helpers_lib.GetRecordFingerprint(
+        u'mx', u'@', {u'priority': 20,
+                      u'mail_server': u'smtp.university.edu.'})
+    soa_fingerprint = helpers_lib.GetRecordFingerprint(
+        u'soa', u'soa1', {u'name_server': u'ns1.university.edu.',
+                          u'admin_email': u'admin.university.edu.',
+                          u'refresh_seconds': 5, u'retry_seconds': 5,
+                          u'expiry_seconds': 5, u'minimum_seconds': 5})
+    self.core_instance.UpdateRecord(u'mx', u'@', u'university.edu',
+                                    {u'priority': 10,
+                                     u'mail_server': None}, u'test_view',
+                                    update_record_args_dict={u'priority': 20})
+    fingerprints = ListFingerprints()
+    self.assertEqual(fingerprints,
+                     sorted([(mx_fingerprint, u'university.edu',
+                              u'test_view_dep'),
+                             (soa_fingerprint, u'university.edu',
+                              u'test_view_dep')]))
+    self.assertRaises(errors.InvalidInputError, self.core_instance.MakeRecord,
+                      u'mx', u'@', u'university.edu',
+                      {u'priority': 20,
+                       u'mail_server': u'smtp.university.edu.'},
+                      view_name=u'test_view')
+    # A duplicate with a different ttl is not found by searching the records
+    self.core_instance.MakeRecord(u'mx', u'@', u'university.edu',
+                                  {u'priority': 10,
+                                   u'mail_server': u'smtp.university.edu.'},
+                                  view_name=u'test_view', ttl=300)
+    self.assertRaises(errors.InvalidInputError,
+                      self.core_instance.UpdateRecord, u'mx', u'@',
+                      u'university.edu', {u'priority': 10,
+                                          u'mail_server': None},
+                      u'test_view', 300,
+                      update_record_args_dict={u'priority': 20})
+    self.core_instance.RemoveRecord(u'mx', u'@', u'university.edu',
+                                    {u'priority': 10,
+                                     u'mail_server': u'smtp.university.edu.'},
+                                    view_name=u'test_view', ttl=300)
+    self.assertEqual(ListFingerprints(), fingerprints)
+
+    # Records made before fingerprints are fingerprinted by an upgrade
+    db_instance.StartTransaction()
+    db_instance.cursor.execute('DELETE FROM record_fingerprints')
+    db_instance.EndTransaction()
+    self.assertEqual(ListFingerprints(), [])
+    self.assertEqual(db_instance.UpgradeRosterDatabase(), [])
+    self.assertEqual(ListFingerprints(), fingerprints)
+
+    self.core_instance.RemoveRecord(u'mx', u'@', u'university.edu',
+                                    {u'priority': 20,
+                                     u'mail_server': u'smtp.university.edu.'},
+                                    view_name=u'test_view')
+    self.assertEqual(ListFingerprints(), [(soa_fingerprint, u'university.edu',
+                                           u'test_view_dep')])
+
   def testSOA(self):
     self.core_instance.MakeView(u'test_view')
     self.core_instance.MakeZone(u'university.edu', u'master',
@@ -1114,6 +1200,71 @@ class TestCore(unittest.TestCase):
                        'last_user': u'sharrell', 'zone_name': u'university.edu',
                        u'admin_email': u'test.', u'expiry_seconds': 4}])
 
+    # Serials are counted up once per transaction when it commits
+    self.core_instance.db_instance.StartTransaction()
+    self.core_instance._IncrementSoa(u'test_view', u'university.edu')
+    self.core_instance._IncrementSoa(u'test_view_dep', u'university.edu')
+    self.assertEqual(self.core_instance.db_instance.changed_soa_serials,
+                     {(u'university.edu', u'test_view_dep'): False})
+    self.core_instance.db_instance.EndTransaction()
+    self.assertEqual(self.core_instance.ListRecords()[0][u'serial_number'], 3)
+
+    self.core_instance.db_instance.StartTransaction()
+    self.core_instance._IncrementSoa(u'test_view', u'university.edu')
+    self.core_instance._IncrementSoa(u'test_view', u'other.edu',
+                                     missing_ok=True)
+    self.core_instance.db_instance.EndTransaction()
+    self.assertEqual(self.core_instance.ListRecords()[0][u'serial_number'], 4)
+
+    self.core_instance.db_instance.StartTransaction()
+    self.core_instance._IncrementSoa(u'test_view', u'university.edu')
+    self.core_instance._IncrementSoa(u'test_view', u'other.edu')
+    self.assertRaises(errors.RecordError,
+                      self.core_instance.db_instance.EndTransaction)
+    self.assertEqual(self.core_instance.ListRecords()[0][u'serial_number'], 4)
+
+    # Zones changed in any are looked up in every view when it commits
+    self.core_instance.db_instance.StartTransaction()
+    self.core_instance._IncrementSoa(u'any', u'university.edu')
+    self.assertEqual(self.core_instance.db_instance.changed_zone_soa_serials,
+                     {u'university.edu': False})
+    self.assertEqual(self.core_instance.db_instance.changed_soa_serials, {})
+    self.core_instance.db_instance.EndTransaction()
+    self.assertEqual(self.core_instance.ListRecords()[0][u'serial_number'], 5)
+
+    # A zone with two SOA records and another with none are both found
+    db_instance = self.core_instance.db_instance
+    db_instance.StartTransaction()
+    record_id = db_instance.MakeRow('records', {
+        'records_id': None,
+        'record_type': u'soa', 'record_target': u'university_edu2',
+        'record_ttl': 10, 'record_zone_name': u'university.edu',
+        'record_view_dependency': u'test_view_dep',
+        'record_last_user': u'sharrell'})
+    db_instance.MakeRow('record_arguments_records_assignments', {
+        'record_arguments_records_assignments_record_id': record_id,
+        'record_arguments_records_assignments_type': u'soa',
+        'record_arguments_records_assignments_argument_name':
+            u'serial_number',
+        'argument_value': u'1'})
+    self.core_instance._IncrementSoa(u'test_view', u'university.edu')
+    self.core_instance._IncrementSoa(u'test_view', u'other.edu')
+    self.assertRaises(errors.InvalidInputError, db_instance.EndTransaction)
+    self.assertEqual(len(self.core_instance.ListRecords(record_type=u'soa')),
+                     1)
+    self.assertEqual(self.core_instance.ListRecords()[0][u'serial_number'], 5)
+
+    # Core methods end their own transactions, so they still raise SOA
+    # errors themselves and nothing they changed is kept.
+    self.core_instance.MakeZone(u'nosoa.edu', u'master', u'nosoa.edu.',
+                                view_name=u'test_view')
+    self.assertRaises(errors.RecordError, self.core_instance.MakeRecord,
+                      u'a', u'host', u'nosoa.edu',
+                      {u'assignment_ip': u'192.168.1.5'},
+                      view_name=u'test_view')
+    self.assertEqual(self.core_instance.ListRecords(zone_name=u'nosoa.edu'),
+                     [])
+
   def testListRecordArgumentDefinitions(self):
     self.assertEqual(self.core_instance.ListRecordArgumentDefinitions(),
         {u'a': [{'argument_name': u'assignment_ip',
@@ -1217,6 +1368,38 @@ class TestCore(unittest.TestCase):
     self.assertEqual(len(self.core_instance.ListAuditLog(
         user_name=u'sharrell')), 3)
 
+  def testListGenerations(self):
+    self.assertEqual(self.core_instance.ListGenerations(),
+                     {u'views': 0, u'acls': 0, u'zones': 0, u'users': 0,
+                      u'named_conf': 0, u'reserved_words': 0,
+                      u'records': {}})
+    self.core_instance.MakeView(u'test_view')
+    self.core_instance.MakeZone(u'university.edu', u'master',
+                                u'university.edu.', view_name=u'test_view')
+    self.core_instance.MakeRecord(
+        u'soa', u'university_edu', u'university.edu',
+        {u'name_server': u'test.', u'admin_email': u'test.',
+         u'serial_number': 1, u'refresh_seconds': 4,
+         u'retry_seconds': 4, u'expiry_seconds': 4, u'minimum_seconds': 4},
+        ttl=10, view_name=u'test_view')
+    generations = self.core_instance.ListGenerations()
+    self.assertEqual(generations[u'views'], 1)
+    self.assertEqual(generations[u'acls'], 0)
+    self.assertEqual(generations[u'records'].keys(), [u'university.edu'])
+    self.assertEqual(generations[u'records'][u'university.edu'].keys(),
+                     [u'test_view_dep'])
+
+    self.core_instance.MakeRecord(u'a', u'host1', u'university.edu',
+                                  {u'assignment_ip': u'192.168.0.1'},
+                                  view_name=u'test_view')
+    new_generations = self.core_instance.ListGenerations()
+    self.assertEqual(
+        new_generations[u'records'][u'university.edu'][u'test_view_dep'],
+        generations[u'records'][u'university.edu'][u'test_view_dep'] + 1)
+    del generations[u'records']
+    del new_generations[u'records']
+    self.assertEqual(new_generations, generations)
+
   def testSetCheckMaintenanceFlag(self):
     self.assertFalse(self.core_instance.CheckMaintenanceFlag())
 
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+# Copyright (c) 2009, Purdue University
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+# 
+# Neither the name of the Purdue University nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Benchmark for data_validation.py
+
+Times DataValidation.ValidateRowDict on the empty row dict of every table in
+constants.TABLES, the way ListRow validates its search rows, against the
+validation by data type name it replaced.
+"""
+
+__copyright__ = 'Copyright (C) 2009, Purdue University'
+__license__ = 'BSD'
+__version__ = '#TRUNK#'
+
+
+import time
+
+from roster_core import constants
+from roster_core import data_validation
+from roster_core import errors
+from roster_core import helpers_lib
+
+
+ROUNDS = 2000
+
+
+def ValidateRowDictByName(data_validation_instance, table_name, row_dict,
+                          none_ok=False, all_none_ok=False):
+  """ValidateRowDict as it was before the checks were compiled per table.
+
+  Inputs:
+    data_validation_instance: data_validation.DataValidation instance
+    table_name: string of table name
+    row_dict: dict of row
+    none_ok: bool of allowance of None as a value in the dict
+    all_none_ok: bool of allowance of None as every value in the dict
+  """
+  main_dict = helpers_lib.GetRowDict(table_name)
+  for key in main_dict.iterkeys():
+    if( key not in row_dict ):
+      raise errors.UnexpectedDataError('Missing key %s in dictionary' % key)
+
+  for key, value in row_dict.iteritems():
+    if( key not in main_dict ):
+      raise errors.UnexpectedDataError('Dictionary has extra key that is not '
+                                       'used: %s' % key)
+
+    if( not 'is%s' % main_dict[key] in dir(data_validation_instance) ):
+      raise errors.FunctionError('No function to check data '
+                                 'type: %s' % main_dict[key])
+    if( not getattr(data_validation_instance,
+                    'is%s' % main_dict[key])(value) ):
+      if( (not none_ok and not key.endswith('_id')) or
+          (none_ok and value is not None) ):
+        raise errors.UnexpectedDataError('Invalid data type %s for %s: %s' % (
+            main_dict[key], key, value))
+
+  if( none_ok and not all_none_ok ):
+    for value in row_dict.values():
+      if( value is not None ):
+        return
+    raise errors.UnexpectedDataError('Need to fill out at least one value '
+                                     'in dict')
+
+
+def TimeValidation(validate_function, data_validation_instance, row_dicts):
+  """Validates the row dict of every table ROUNDS times.
+
+  Inputs:
+    validate_function: function taking a table name and row dict
+    data_validation_instance: data_validation.DataValidation instance
+    row_dicts: dictionary of row dicts keyed by table name
+
+  Outputs:
+    float: microseconds per row dict
+  """
+  start_time = time.time()
+  for round_number in range(ROUNDS):
+    for table_name, row_dict in row_dicts.iteritems():
+      validate_function(table_name, row_dict, none_ok=True, all_none_ok=True)
+  seconds = time.time() - start_time
+  return seconds * 1000000 / (ROUNDS * len(row_dicts))
+
+
+def main():
+  data_validation_instance = data_validation.DataValidation(
+      [u'reserved'], [u'a', u'aaaa', u'cname', u'ns', u'ptr', u'soa'])
+  row_dicts = {}
+  for table_name in constants.TABLES:
+    row_dicts[table_name] = dict.fromkeys(constants.TABLES[table_name])
+
+  by_name = TimeValidation(
+      lambda *args, **kwargs: ValidateRowDictByName(
+          data_validation_instance, *args, **kwargs),
+      data_validation_instance, row_dicts)
+  compiled = TimeValidation(data_validation_instance.ValidateRowDict,
+                            data_validation_instance, row_dicts)
+  print '%d tables, %d rounds' % (len(row_dicts), ROUNDS)
+  print '%-25s %8.2f us/row' % ('by data type name', by_name)
+  print '%-25s %8.2f us/row' % ('compiled per table', compiled)
+  print '%-25s %8.2fx' % ('speedup', by_name / compiled)
+
+
+if( __name__ == '__main__' ):
+  main()
@@ -82,6 +82,18 @@ class TestDataValidation(unittest.TestCase):
     self.assertRaises(errors.ReservedWordError, 
         self.data_validation_instance.isUnicodeString,
         u'thisincludesthewordBluEeandotherwordstoo')
+    validation_instance = data_validation.DataValidation(
+        [u'red', u'Bl.e'], [])
+    self.assertTrue(validation_instance.isUnicodeString(u'bluebell'))
+    try:
+      validation_instance.isUnicodeString(u'Bl.e-RED')
+    except errors.ReservedWordError, error:
+      self.assertEqual(str(error), 'Reserved word red found, unable '
+                                   'to complete request')
+    else:
+      self.fail('ReservedWordError not raised')
+    self.assertRaises(errors.ReservedWordError,
+        validation_instance.isUnicodeString, u'bl.eberry')
 
   def testisIPv4IPAddress(self):
     self.assertTrue(self.data_validation_instance.isIPv4IPAddress(
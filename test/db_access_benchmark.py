@@ -0,0 +1,114 @@
+#!/usr/bin/python
+
+# Copyright (c) 2009, Purdue University
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+# 
+# Neither the name of the Purdue University nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Benchmark for db_access.py
+
+Counts the queries sent to the database per Core.ListRecords call with the
+connection probe run before every transaction and with the probe only run
+on idle connections.
+
+Make sure you are running this against a database that can be destroyed.
+
+DO NOT EVER RUN THIS BENCHMARK AGAINST A PRODUCTION DATABASE.
+"""
+
+__copyright__ = 'Copyright (C) 2009, Purdue University'
+__license__ = 'BSD'
+__version__ = '#TRUNK#'
+
+
+import os
+import time
+
+import roster_core
+
+
+CONFIG_FILE = 'test_data/roster.conf' # Example in test_data
+DATA_FILE = 'test_data/test_data.sql'
+DEBUG_LOG_FILE = 'test_data/db_access_benchmark_logfile.txt'
+CALLS = 200
+
+
+def CountListRecordsQueries(core_instance, connection_probe_idle):
+  """Runs Core.ListRecords and counts the queries it sends.
+
+  Inputs:
+    core_instance: roster_core.Core instance
+    connection_probe_idle: integer of connection_probe_idle to use
+
+  Outputs:
+    tuple of queries per call and seconds per call
+  """
+  db_instance = core_instance.db_instance
+  db_instance.connection_probe_idle = connection_probe_idle
+  # Warm up caches so only the steady state is counted.
+  core_instance.ListRecords(zone_name=u'cs.university.edu')
+  if( os.path.exists(DEBUG_LOG_FILE) ):
+    os.remove(DEBUG_LOG_FILE)
+  db_instance.db_debug = True
+  db_instance.db_debug_log = DEBUG_LOG_FILE
+  start_time = time.time()
+  try:
+    for call in range(CALLS):
+      core_instance.ListRecords(zone_name=u'cs.university.edu')
+  finally:
+    db_instance.db_debug = False
+  seconds = time.time() - start_time
+  log_file_handle = open(DEBUG_LOG_FILE, 'r')
+  try:
+    queries = len(log_file_handle.readlines())
+  finally:
+    log_file_handle.close()
+  os.remove(DEBUG_LOG_FILE)
+  return float(queries) / CALLS, seconds / CALLS
+
+
+def main():
+  config_instance = roster_core.Config(file_name=CONFIG_FILE)
+  db_instance = config_instance.GetDb()
+  db_instance.CreateRosterDatabase()
+  data = open(DATA_FILE, 'r').read()
+  db_instance.StartTransaction()
+  db_instance.cursor.execute(data)
+  db_instance.EndTransaction()
+  db_instance.close()
+
+  core_instance = roster_core.Core(u'sharrell', config_instance)
+  for description, connection_probe_idle in (
+      ('probe every transaction', 0),
+      ('probe idle connections', 3600)):
+    queries, seconds = CountListRecordsQueries(core_instance,
+                                               connection_probe_idle)
+    print '%-25s %6.2f queries/call %8.3f ms/call' % (
+        description, queries, seconds * 1000)
+
+
+if( __name__ == '__main__' ):
+  main()
@@ -40,6 +40,7 @@ __license__ = 'BSD'
 __version__ = '#TRUNK#'
 
 
+import collections
 import cPickle
 import codecs
 import datetime
@@ -50,6 +51,7 @@ import os
 import threading
 
 import roster_core
+from roster_core import constants
 from roster_core import data_validation
 from roster_core import db_access
 from roster_core import helpers_lib
@@ -151,6 +153,27 @@ class DbLockThread(threading.Thread):
     self.db_instance.UnlockDb()
     self.db_instance.EndTransaction()
 
+class DbWriteThread(threading.Thread):
+  def __init__(self, db_instance):
+    self.db_instance = db_instance
+    self.finish_time = None
+    threading.Thread.__init__(self)
+  def run(self):
+    self.db_instance.StartTransaction()
+    self.db_instance.MakeRow('views', {'view_name': u'test_view'})
+    self.db_instance.EndTransaction()
+    self.finish_time = time.time()
+
+class DbConnectionThread(threading.Thread):
+  def __init__(self, db_instance):
+    self.db_instance = db_instance
+    self.connection = None
+    threading.Thread.__init__(self)
+  def run(self):
+    self.db_instance.StartTransaction()
+    self.connection = self.db_instance.connection
+    self.db_instance.EndTransaction()
+
 
 class TestdbAccess(unittest.TestCase):
 
@@ -190,6 +213,64 @@ class TestdbAccess(unittest.TestCase):
                       self.db_instance.StartTransaction)
     self.db_instance.EndTransaction()
 
+  def testConnectionPool(self):
+    pool = db_access.ConnectionPool(2, 1)
+    self.assertEqual(pool.CheckOut(), (None, None))
+    self.assertEqual(pool.CheckOut(), (None, None))
+    self.assertRaises(errors.TransactionError, pool.CheckOut, blocking=False)
+    connection = self.db_instance.Connect()
+    pool.CheckIn(connection)
+    self.assertEqual(pool.CheckOut()[0], connection)
+    pool.CheckIn(connection)
+    pool.CheckIn(None)
+    time.sleep(2)
+    self.assertEqual(pool.CheckOut(), (None, None))
+    self.assertFalse(connection.open)
+    pool.CheckIn(None)
+
+  def testConnectionPoolWaiting(self):
+    pool = db_access.ConnectionPool(1, 0, 1)
+    self.assertEqual(pool.CheckOut(), (None, None))
+    self.assertRaises(errors.TransactionError, pool.CheckOut)
+    self.assertEqual(pool.waiters, collections.deque())
+    wait_statistics = pool.GetWaitStatistics()
+    self.assertEqual(wait_statistics['wait_count'], 1)
+    self.assertEqual(wait_statistics['waiting'], 0)
+    self.assertTrue(wait_statistics['max_wait_time'] >= 1)
+
+    check_out_order = []
+    def CheckOutAndReturn(thread_number):
+      pool.CheckOut()
+      check_out_order.append(thread_number)
+      pool.CheckIn(None)
+    pool.wait_timeout = 0
+    threads = []
+    for thread_number in range(5):
+      thread = threading.Thread(target=CheckOutAndReturn,
+                                args=(thread_number,))
+      thread.start()
+      threads.append(thread)
+      while( pool.GetWaitStatistics()['waiting'] != thread_number + 1 ):
+        time.sleep(0.01)
+    pool.CheckIn(None)
+    for thread in threads:
+      thread.join()
+    self.assertEqual(check_out_order, range(5))
+
+  def testConcurrentTransactions(self):
+    self.db_instance.StartTransaction()
+    try:
+      connection_thread = DbConnectionThread(self.db_instance)
+      connection_thread.start()
+      connection_thread.join(10)
+      self.assertFalse(connection_thread.isAlive())
+      self.assertNotEqual(connection_thread.connection,
+                          self.db_instance.connection)
+      self.assertTrue(self.db_instance.transaction_init)
+    finally:
+      self.db_instance.EndTransaction()
+    self.assertEqual(self.db_instance.connection, None)
+
   def testDbLocking(self):
     self.db_instance.StartTransaction()
     self.assertRaises(errors.TransactionError, self.db_instance.UnlockDb)
@@ -204,11 +285,258 @@ class TestdbAccess(unittest.TestCase):
     self.db_instance.MakeRow('users', users_dict)
     self.db_instance.EndTransaction()
 
+  def testBigLockWait(self):
+    self.db_instance.StartTransaction()
+    try:
+      self.db_instance.LockDb()
+      write_thread = DbWriteThread(self.db_instance)
+      write_thread.start()
+      time.sleep(1)
+      self.assertTrue(write_thread.isAlive())
+      unlock_time = time.time()
+      self.db_instance.UnlockDb()
+    finally:
+      self.db_instance.EndTransaction()
+    write_thread.join(10)
+    self.assertFalse(write_thread.isAlive())
+    self.assertTrue(write_thread.finish_time - unlock_time < 1)
+    self.db_instance.StartTransaction()
+    try:
+      self.assertEqual(self.db_instance.ListRow(
+          'views', self.db_instance.GetEmptyRowDict('views')),
+          ({'view_name': u'test_view'},))
+    finally:
+      self.db_instance.EndTransaction()
+
+  def testBigLockTimeout(self):
+    other_db_instance = self.config_instance.GetDb()
+    other_db_instance.StartTransaction()
+    try:
+      other_db_instance.LockDb()
+      big_lock_get_timeout = constants.BIG_LOCK_GET_TIMEOUT
+      constants.BIG_LOCK_GET_TIMEOUT = 1
+      self.db_instance.StartTransaction()
+      try:
+        self.assertRaises(errors.TransactionError, self.db_instance.LockDb)
+        self.assertFalse(self.db_instance.locked_db)
+      finally:
+        constants.BIG_LOCK_GET_TIMEOUT = big_lock_get_timeout
+        self.db_instance.EndTransaction()
+      other_db_instance.UnlockDb()
+    finally:
+      other_db_instance.EndTransaction()
+      other_db_instance.close()
+
   def testInitDataValidation(self):
     self.db_instance.InitDataValidation()
     self.assertEqual(self.db_instance.data_validation_instance.reserved_words,
                      [])
 
+  def testMaintenanceFlagCache(self):
+    self.db_instance.maintenance_flag_ttl = 3600
+    self.db_instance.ClearMaintenanceFlagCache()
+    self.assertEqual(self.db_instance.GetCachedMaintenanceFlag(), None)
+    self.db_instance.StartTransaction()
+    self.assertFalse(self.db_instance.CheckMaintenanceFlag())
+    self.db_instance.EndTransaction()
+    self.assertEqual(self.db_instance.GetCachedMaintenanceFlag(), False)
+
+    # Changing the flag in this process clears it right away
+    self.db_instance.StartTransaction()
+    self.db_instance.UpdateRow('locks',
+                               {'lock_name': u'maintenance', 'locked': None},
+                               {'lock_name': None, 'locked': 1})
+    self.db_instance.EndTransaction()
+    self.assertEqual(self.db_instance.GetCachedMaintenanceFlag(), None)
+    self.db_instance.StartTransaction()
+    self.assertTrue(self.db_instance.CheckMaintenanceFlag())
+    self.db_instance.EndTransaction()
+    self.assertEqual(self.db_instance.GetCachedMaintenanceFlag(), True)
+
+    # A flag read after it changed in another thread is not cached
+    self.db_instance.StartTransaction()
+    self.db_instance.ClearMaintenanceFlagCache()
+    self.assertTrue(self.db_instance.CheckMaintenanceFlag())
+    self.db_instance.EndTransaction()
+    self.assertEqual(self.db_instance.GetCachedMaintenanceFlag(), None)
+
+    # Changes made outside of this process are seen once the flag expires
+    self.db_instance.maintenance_flag_ttl = 1
+    self.db_instance.StartTransaction()
+    self.assertTrue(self.db_instance.CheckMaintenanceFlag())
+    self.db_instance.cursor.execute('UPDATE locks SET locked=0 '
+                                    'WHERE lock_name="maintenance"')
+    self.db_instance.EndTransaction()
+    self.assertEqual(self.db_instance.GetCachedMaintenanceFlag(), True)
+    time.sleep(1)
+    self.assertEqual(self.db_instance.GetCachedMaintenanceFlag(), None)
+    self.db_instance.StartTransaction()
+    self.assertFalse(self.db_instance.CheckMaintenanceFlag())
+    self.db_instance.EndTransaction()
+
+    self.db_instance.maintenance_flag_ttl = 0
+    self.db_instance.ClearMaintenanceFlagCache()
+    self.db_instance.StartTransaction()
+    self.assertFalse(self.db_instance.CheckMaintenanceFlag())
+    self.db_instance.EndTransaction()
+    self.assertEqual(self.db_instance.GetCachedMaintenanceFlag(), None)
+
+  def testViewDependencyGraph(self):
+    self.assertRaises(errors.TransactionError,
+                      self.db_instance.GetViewDependencyGraph)
+    self.db_instance.StartTransaction()
+    self.assertEqual(self.db_instance.GetViewDependencyGraph(), {})
+    for view_name in [u'internal', u'external']:
+      self.db_instance.MakeRow('views', {'view_name': view_name})
+      self.db_instance.MakeRow('view_dependencies',
+                               {'view_dependency': u'%s_dep' % view_name})
+      for view_dependency in [u'%s_dep' % view_name, u'any']:
+        self.db_instance.MakeRow(
+            'view_dependency_assignments',
+            {'view_dependency_assignments_view_name': view_name,
+             'view_dependency_assignments_view_dependency': view_dependency})
+    # Changed in this transaction so built again and not cached
+    graph = self.db_instance.GetViewDependencyGraph()
+    self.db_instance.EndTransaction()
+    self.assertEqual(sorted(graph), [u'any', u'external_dep', u'internal_dep'])
+    self.assertEqual(sorted(graph[u'any'][0]), [u'external', u'internal'])
+    self.assertEqual(sorted(graph[u'any'][1]),
+                     [u'any', u'external_dep', u'internal_dep'])
+    self.assertEqual(graph[u'internal_dep'][0], [u'internal'])
+    self.assertEqual(sorted(graph[u'internal_dep'][1]),
+                     [u'any', u'internal_dep'])
+
+    self.db_instance.StartTransaction()
+    cached_graph = self.db_instance.GetViewDependencyGraph()
+    self.assertEqual(cached_graph, graph)
+    self.db_instance.EndTransaction()
+    other_db_instance = self.config_instance.GetDb()
+    other_db_instance.StartTransaction()
+    self.assertTrue(other_db_instance.GetViewDependencyGraph() is
+                    cached_graph)
+    other_db_instance.EndTransaction()
+
+    self.db_instance.StartTransaction()
+    self.db_instance.RemoveRow('views', {'view_name': u'external'})
+    self.db_instance.EndTransaction()
+    other_db_instance.StartTransaction()
+    graph = other_db_instance.GetViewDependencyGraph()
+    other_db_instance.EndTransaction()
+    self.assertEqual(sorted(graph), [u'any', u'internal_dep'])
+    for view_dependency in graph:
+      self.assertEqual(graph[view_dependency][0], [u'internal'])
+      self.assertEqual(sorted(graph[view_dependency][1]),
+                       [u'any', u'internal_dep'])
+
+    # Views changed by another process
+    connection = MySQLdb.connect(
+        host=self.db_instance.db_host, user=self.db_instance.db_user,
+        passwd=self.db_instance.db_passwd, db=self.db_instance.db_name,
+        use_unicode=True, charset='utf8')
+    try:
+      cursor = connection.cursor()
+      cursor.execute('INSERT INTO views (view_name) VALUES ("dmz")')
+      cursor.execute('INSERT INTO view_dependencies (view_dependency) VALUES '
+                     '("dmz_dep")')
+      cursor.execute('INSERT INTO view_dependency_assignments '
+                     '(view_dependency_assignments_view_name, '
+                     'view_dependency_assignments_view_dependency) VALUES '
+                     '("dmz", "dmz_dep")')
+      connection.commit()
+      # Not counted, so only built again when dmz_dep is needed
+      self.db_instance.StartTransaction()
+      self.assertFalse(u'dmz_dep' in self.db_instance.GetViewDependencyGraph())
+      self.assertEqual(
+          self.db_instance.GetViewDependencyGraph(u'dmz_dep')[u'dmz_dep'],
+          ([u'dmz'], [u'dmz_dep']))
+      self.db_instance.EndTransaction()
+
+      cursor.execute('DELETE FROM views WHERE view_name="dmz"')
+      cursor.execute('INSERT INTO generations (generation_name, generation) '
+                     'VALUES ("views", 1) ON DUPLICATE KEY UPDATE '
+                     'generation=generation+1')
+      connection.commit()
+    finally:
+      connection.close()
+    self.db_instance.StartTransaction()
+    self.assertEqual(sorted(self.db_instance.GetViewDependencyGraph()),
+                     [u'any', u'internal_dep'])
+    self.db_instance.EndTransaction()
+
+  def testSharedDataValidation(self):
+    self.db_instance.InitDataValidation()
+    other_db_instance = self.config_instance.GetDb()
+    other_db_instance.InitDataValidation()
+    self.assertTrue(other_db_instance.data_validation_instance is
+                    self.db_instance.data_validation_instance)
+    generation = self.db_instance.GetDataValidationGeneration()
+
+    self.db_instance.StartTransaction()
+    try:
+      self.db_instance.MakeRow('reserved_words', {'reserved_word': u'blue'})
+    finally:
+      self.db_instance.EndTransaction(rollback=True)
+    self.assertEqual(self.db_instance.GetDataValidationGeneration(),
+                     generation)
+
+    self.db_instance.StartTransaction()
+    try:
+      self.db_instance.MakeRow('reserved_words', {'reserved_word': u'blue'})
+    finally:
+      self.db_instance.EndTransaction()
+    self.assertEqual(self.db_instance.GetDataValidationGeneration(),
+                     generation + 1)
+
+    other_db_instance.StartTransaction()
+    other_db_instance.EndTransaction()
+    self.assertEqual(other_db_instance.data_validation_instance.reserved_words,
+                     [u'blue'])
+    self.assertRaises(errors.ReservedWordError,
+                      other_db_instance.data_validation_instance.
+                      isUnicodeString, u'theBlueone')
+    self.db_instance.StartTransaction()
+    self.db_instance.EndTransaction()
+    self.assertTrue(other_db_instance.data_validation_instance is
+                    self.db_instance.data_validation_instance)
+    other_db_instance.close()
+
+    # Another process commits a reserved word, which only shows in the
+    # generations table.
+    connection = MySQLdb.connect(
+        host=self.db_instance.db_host, user=self.db_instance.db_user,
+        passwd=self.db_instance.db_passwd, db=self.db_instance.db_name,
+        use_unicode=True, charset='utf8')
+    try:
+      cursor = connection.cursor()
+      cursor.execute('INSERT INTO reserved_words (reserved_word) VALUES '
+                     '("green")')
+      cursor.execute('INSERT INTO generations (generation_name, generation) '
+                     'VALUES ("reserved_words", 1) ON DUPLICATE KEY UPDATE '
+                     'generation=generation+1')
+      connection.commit()
+    finally:
+      connection.close()
+    self.assertEqual(self.db_instance.GetDataValidationGeneration(),
+                     generation + 1)
+    # Only changes look at the generations table
+    self.db_instance.StartTransaction()
+    try:
+      self.db_instance.ListRow('acls', self.db_instance.GetEmptyRowDict('acls'))
+      self.assertEqual(self.db_instance.database_generations, None)
+    finally:
+      self.db_instance.EndTransaction()
+    self.assertEqual(self.db_instance.data_validation_instance.reserved_words,
+                     [u'blue'])
+    self.db_instance.StartTransaction()
+    try:
+      self.assertRaises(errors.ReservedWordError, self.db_instance.MakeRow,
+                        'acls', {'acl_name': u'greenacl'})
+    finally:
+      self.db_instance.EndTransaction(rollback=True)
+    self.assertEqual(
+        sorted(self.db_instance.data_validation_instance.reserved_words),
+        [u'blue', u'green'])
+
   def testGetUserAuthorizationInfo(self):
     self.assertEquals(self.db_instance.GetUserAuthorizationInfo(u'notindb'), {})
 
@@ -493,6 +821,181 @@ class TestdbAccess(unittest.TestCase):
                  'forward_zone_permissions_zone_name': u'eas.university.edu'}])) 
     self.db_instance.EndTransaction()
 
+  def testBulkRowFuncs(self):
+    self.assertRaises(errors.InvalidInputError, self.db_instance.MakeRows,
+                      'notinlist', [])
+    self.assertRaises(errors.TransactionError, self.db_instance.MakeRows,
+                      'acls', [])
+    self.assertRaises(errors.TransactionError, self.db_instance.RemoveRows,
+                      'acls', 'acl_name', [u'public'])
+    self.assertRaises(errors.TransactionError, self.db_instance.UpdateRows,
+                      'acls', 'acl_name', [u'public'], {'acl_name': u'new'})
+
+    self.db_instance.StartTransaction()
+    try:
+      self.assertEqual(self.db_instance.MakeRows('audit_log', []), 0)
+      self.assertRaises(errors.InvalidInputError, self.db_instance.RemoveRows,
+                        'audit_log', 'notacolumn', [1])
+      audit_log_dicts = []
+      for hour in range(4):
+        audit_log_dicts.append(
+            {'audit_log_id': None,
+             'audit_log_user_name': u'sharrell',
+             'action': u'DoThis',
+             'data': cPickle.dumps('I did it'),
+             'success': 1,
+             'audit_log_timestamp': datetime.datetime(2001, 1, 1, hour)})
+      self.assertEqual(
+          self.db_instance.MakeRows('audit_log', audit_log_dicts), 4)
+      search_dict = self.db_instance.GetEmptyRowDict('audit_log')
+      search_dict['action'] = u'DoThis'
+      audit_log_rows = sorted(
+          self.db_instance.ListRow('audit_log', search_dict),
+          key=lambda row: row['audit_log_timestamp'])
+      self.assertEqual([row['audit_log_timestamp'] for row in audit_log_rows],
+                       [audit_log_dict['audit_log_timestamp']
+                        for audit_log_dict in audit_log_dicts])
+      audit_log_ids = [row['audit_log_id'] for row in audit_log_rows]
+
+      update_dict = self.db_instance.GetEmptyRowDict('audit_log')
+      update_dict['action'] = u'DidThat'
+      self.assertEqual(self.db_instance.UpdateRows(
+          'audit_log', 'audit_log_id', audit_log_ids[:2], update_dict), 2)
+      search_dict = self.db_instance.GetEmptyRowDict('audit_log')
+      search_dict['action'] = u'DidThat'
+      self.assertEqual(
+          len(self.db_instance.ListRow('audit_log', search_dict)), 2)
+
+      self.assertEqual(self.db_instance.RemoveRows(
+          'audit_log', 'audit_log_id', audit_log_ids[1:]), 3)
+      self.assertEqual(self.db_instance.RemoveRows(
+          'audit_log', 'audit_log_id', audit_log_ids[1:]), 0)
+      self.assertEqual(self.db_instance.RemoveRows(
+          'audit_log', 'audit_log_id', []), 0)
+      search_dict['action'] = None
+      for audit_log_id in audit_log_ids:
+        search_dict['audit_log_id'] = audit_log_id
+        self.assertEqual(
+            len(self.db_instance.ListRow('audit_log', search_dict)),
+            int(audit_log_id == audit_log_ids[0]))
+    finally:
+      self.db_instance.EndTransaction(rollback=True)
+
+  def testListRowPlanCache(self):
+    self.db_instance.StartTransaction()
+    try:
+      users_dict = self.db_instance.GetEmptyRowDict('users')
+      users_dict['user_name'] = u'sharrell'
+      self.db_instance.ListRow('users', users_dict)
+      self.assertEqual(self.db_instance.GetListRowPlanCache().GetStatistics(),
+                       {'hits': 0, 'misses': 1, 'size': 1})
+      users_dict['user_name'] = u'shuey'
+      self.assertEqual(self.db_instance.ListRow('users', users_dict)[0][
+          'user_name'], u'shuey')
+      self.assertEqual(self.db_instance.GetListRowPlanCache().GetStatistics(),
+                       {'hits': 1, 'misses': 1, 'size': 1})
+      users_dict['user_name'] = None
+      self.db_instance.ListRow('users', users_dict)
+      self.db_instance.ListRow('users', users_dict, lock_rows=True)
+      self.assertEqual(self.db_instance.GetListRowPlanCache().GetStatistics(),
+                       {'hits': 1, 'misses': 3, 'size': 3})
+    finally:
+      self.db_instance.EndTransaction()
+    # Plans are shared by every instance using the database
+    other_db_instance = self.config_instance.GetDb()
+    self.assertTrue(other_db_instance.GetListRowPlanCache() is
+                    self.db_instance.GetListRowPlanCache())
+
+    plan_cache = db_access.QueryPlanCache(2)
+    plan_cache.AddPlan('a', 1)
+    plan_cache.AddPlan('b', 2)
+    self.assertEqual(plan_cache.GetPlan('a'), 1)
+    plan_cache.AddPlan('c', 3)
+    self.assertEqual(plan_cache.GetPlan('b'), None)
+    self.assertEqual(plan_cache.GetPlan('a'), 1)
+    self.assertEqual(plan_cache.GetPlan('c'), 3)
+
+  def testIterRow(self):
+    self.db_instance.StartTransaction()
+    try:
+      users_dict = self.db_instance.GetEmptyRowDict('users')
+      user_rows = self.db_instance.ListRow('users', users_dict)
+      self.assertEqual(tuple(self.db_instance.IterRow('users', users_dict)),
+                       user_rows)
+      self.assertRaises(errors.InvalidInputError, self.db_instance.IterRow,
+                        'fake_table', users_dict)
+      # Rows that are not read are dropped when the iterator is closed.
+      user_iterator = self.db_instance.IterRow('users', users_dict)
+      self.assertEqual(user_iterator.next(), user_rows[0])
+      user_iterator.close()
+      self.assertEqual(self.db_instance.ListRow('users', users_dict),
+                       user_rows)
+    finally:
+      self.db_instance.EndTransaction()
+    self.assertRaises(errors.TransactionError, self.db_instance.IterRow,
+                      'users', users_dict)
+
+  def testCompactRows(self):
+    self.db_instance.StartTransaction()
+    try:
+      users_dict = self.db_instance.GetEmptyRowDict('users')
+      credentials_dict = self.db_instance.GetEmptyRowDict('credentials')
+      user_rows = self.db_instance.ListRow('users', users_dict,
+                                           'credentials', credentials_dict)
+      compact_user_rows = self.db_instance.ListRow(
+          'users', users_dict, 'credentials', credentials_dict, compact=True)
+      self.assertEqual(list(compact_user_rows), list(user_rows))
+      self.assertEqual(list(self.db_instance.IterRow(
+          'users', users_dict, 'credentials', credentials_dict,
+          compact=True)), list(user_rows))
+      user_rows = self.db_instance.ListRow('users', users_dict)
+      compact_user_rows = self.db_instance.ListRow('users', users_dict,
+                                                   compact=True)
+    finally:
+      self.db_instance.EndTransaction()
+
+    self.assertEqual(list(compact_user_rows), list(user_rows))
+    compact_row = compact_user_rows[0]
+    self.assertTrue(isinstance(compact_row, db_access.CompactRow))
+    self.assertFalse(hasattr(compact_row, '__dict__'))
+    self.assertEqual(sorted(compact_row.keys()), sorted(user_rows[0].keys()))
+    self.assertTrue('user_name' in compact_row)
+    self.assertFalse('fake_column' in compact_row)
+    self.assertEqual(compact_row.get('fake_column', u'default'), u'default')
+    self.assertRaises(KeyError, compact_row.__getitem__, 'fake_column')
+    compact_row['user_name'] = u'new_name'
+    self.assertEqual(compact_row['user_name'], u'new_name')
+
+  def testForeignKeyGraph(self):
+    self.db_instance.StartTransaction()
+    try:
+      foreign_key_graph = self.db_instance.GetForeignKeyGraph()
+    finally:
+      self.db_instance.EndTransaction()
+    self.assertEqual(foreign_key_graph.GetJoinPredicates(
+        ['credentials', 'users']),
+        ('(credentials.credential_user_name=users.user_name)',))
+    self.assertEqual(foreign_key_graph.GetJoinPredicates(['acls', 'users']),
+                     ())
+
+    new_db_instance = self.config_instance.GetDb()
+    new_db_instance.db_debug = True
+    new_db_instance.db_debug_log = 'test_data/db_access_unittest_logfile.txt'
+    new_db_instance.StartTransaction()
+    try:
+      self.assertEqual(new_db_instance.GetForeignKeyGraph(), foreign_key_graph)
+      new_db_instance.ListRow(
+          'users', new_db_instance.GetEmptyRowDict('users'),
+          'credentials', new_db_instance.GetEmptyRowDict('credentials'))
+    finally:
+      new_db_instance.EndTransaction()
+      new_db_instance.close()
+    log_file_handle = open('test_data/db_access_unittest_logfile.txt', 'r')
+    log_file_read = log_file_handle.read()
+    log_file_handle.close()
+    os.system('rm -f test_data/db_access_unittest_logfile.txt')
+    self.assertFalse('information_schema' in log_file_read)
+
   def testGetZoneOrigins(self):
     # Add zones and views
     zones_dict1 = self.db_instance.GetEmptyRowDict('zones')
@@ -581,7 +1084,16 @@ class TestdbAccess(unittest.TestCase):
                       u'test_zone1': [u'10.0.1.IN-ADDR.ARPA.'],
                       u'test_zone2': [u'10.0.0.IN-ADDR.ARPA.',
                                       u'10.0.2.IN-ADDR.ARPA.']})
+
+    self.assertEquals(self.db_instance.GetZoneOriginsByView(
+        [u'test_zone2', u'test_zone1', u'test_zone2', u'no_zone']), {
+            u'test_zone1': {u'temp_view_dep1': [u'10.0.1.IN-ADDR.ARPA.']},
+            u'test_zone2': {u'temp_view_dep1': [u'10.0.0.IN-ADDR.ARPA.'],
+                            u'temp_view_dep2': [u'10.0.2.IN-ADDR.ARPA.']}})
+    self.assertEquals(self.db_instance.GetZoneOriginsByView([]), {})
     self.db_instance.EndTransaction()
+    self.assertRaises(errors.TransactionError,
+                      self.db_instance.GetZoneOriginsByView, [u'test_zone1'])
 
   def testGetRecordArgsDict(self):
     self.assertEquals(self.db_instance.GetRecordArgsDict(u'mx'),
@@ -601,12 +1113,51 @@ class TestdbAccess(unittest.TestCase):
     log_file_handle.close()
     os.system('rm -f test_data/db_access_unittest_logfile.txt')
     self.assertEquals(log_file_read,
-        'DO 0\n'
-        'SELECT `locked`, `lock_last_updated`, NOW() as `now` from `locks` WHERE `lock_name`="db_lock_lock"\n'
         'SELECT reserved_word FROM reserved_words\n'
         'SELECT record_type FROM record_types\n'
         'SELECT record_arguments.record_arguments_type,record_arguments.argument_name,record_arguments.argument_data_type,record_arguments.argument_order FROM record_arguments WHERE record_arguments_type=mx\n')
      
+  def testConnectionProbe(self):
+    self.db_instance.db_debug = True
+    self.db_instance.db_debug_log = 'test_data/db_access_unittest_logfile.txt'
+    self.db_instance.connection_probe_idle = 0
+    self.db_instance.StartTransaction()
+    self.db_instance.EndTransaction()
+    self.db_instance.connection_probe_idle = 3600
+    self.db_instance.StartTransaction()
+    self.db_instance.EndTransaction()
+    self.db_instance.db_debug = False
+
+    log_file_handle = open('test_data/db_access_unittest_logfile.txt', 'r')
+    log_file_read = log_file_handle.read()
+    log_file_handle.close()
+    os.system('rm -f test_data/db_access_unittest_logfile.txt')
+    self.assertEquals(log_file_read, 'DO 0\n')
+
+  def testLostConnection(self):
+    self.db_instance.connection_probe_idle = 3600
+    self.db_instance.StartTransaction()
+    try:
+      lost_connection = self.db_instance.connection
+      self.db_instance.cursor.execute('SELECT CONNECTION_ID() AS id')
+      connection_id = self.db_instance.cursor.fetchone()['id']
+    finally:
+      self.db_instance.EndTransaction()
+    kill_connection = self.db_instance.Connect()
+    try:
+      kill_connection.cursor().execute('KILL %s' % connection_id)
+    finally:
+      kill_connection.close()
+
+    self.db_instance.StartTransaction()
+    try:
+      self.assertEqual(self.db_instance.connection, lost_connection)
+      self.assertEqual(self.db_instance.ListRow(
+          'views', self.db_instance.GetEmptyRowDict('views')), ())
+      self.assertNotEqual(self.db_instance.connection, lost_connection)
+    finally:
+      self.db_instance.EndTransaction()
+
   def testValidateRecordArgsDict(self):
     record_args_dict = self.db_instance.GetEmptyRecordArgsDict(u'mx')
     self.assertRaises(errors.UnexpectedDataError,
@@ -670,9 +1221,11 @@ class TestdbAccess(unittest.TestCase):
       [u'acl_ranges', u'acls', u'audit_log', u'credentials', u'data_types', 
        u'dns_server_set_assignments', u'dns_server_set_view_assignments', 
        u'dns_server_sets', u'dns_servers', u'forward_zone_permissions', 
-       u'group_forward_permissions', u'group_reverse_permissions', u'groups', 
+       u'generations', u'group_forward_permissions',
+       u'group_reverse_permissions', u'groups', 
        u'ipv4_index', u'ipv6_index', u'locks', u'named_conf_global_options', 
-       u'record_arguments', u'record_arguments_records_assignments', 
+       u'record_arguments', u'record_arguments_records_assignments',
+       u'record_fingerprints',
        u'record_types', u'records', u'reserved_words', 
        u'reverse_range_permissions', u'reverse_range_zone_assignments', 
        u'user_group_assignments', u'users', u'view_acl_assignments', 
@@ -680,6 +1233,77 @@ class TestdbAccess(unittest.TestCase):
        u'zone_types', u'zone_view_assignments', u'zones'])
     self.db_instance.EndTransaction()
 
+  def testGenerations(self):
+    generation_dict = self.db_instance.GetEmptyRowDict('generations')
+    self.db_instance.StartTransaction()
+    try:
+      self.db_instance.MakeRow('views', {'view_name': u'test_view'})
+    finally:
+      self.db_instance.EndTransaction(rollback=True)
+    self.db_instance.StartTransaction()
+    try:
+      self.assertEqual(self.db_instance.ListRow('generations',
+                                                generation_dict), ())
+      self.db_instance.MakeRow('views', {'view_name': u'test_view'})
+      self.db_instance.MakeRow('acls', {'acl_name': u'test_acl'})
+      self.db_instance.MarkGenerationChanged(u'records', u'university.edu',
+                                             u'test_view_dep')
+    finally:
+      self.db_instance.EndTransaction()
+    self.db_instance.StartTransaction()
+    try:
+      self.db_instance.RemoveRow('views', {'view_name': u'test_view'})
+      self.db_instance.ListRow('users', self.db_instance.GetEmptyRowDict(
+          'users'))
+    finally:
+      self.db_instance.EndTransaction()
+    self.db_instance.StartTransaction()
+    try:
+      generation_rows = self.db_instance.ListRow('generations',
+                                                 generation_dict)
+    finally:
+      self.db_instance.EndTransaction()
+    self.assertEqual(sorted([(row['generation_name'],
+                              row['generation_zone_name'],
+                              row['generation_view_dependency'],
+                              row['generation']) for
+                             row in generation_rows]),
+                     [(u'acls', u'', u'', 1),
+                      (u'records', u'university.edu', u'test_view_dep', 1),
+                      (u'views', u'', u'', 2)])
+    self.assertRaises(errors.TransactionError,
+                      self.db_instance.MarkGenerationChanged, u'records')
+    self.assertEqual(self.db_instance.GetDatabaseGenerations(
+        [u'views', u'acls', u'users']), (2, 1, 0))
+
+    self.db_instance.StartTransaction()
+    try:
+      self.assertEqual(self.db_instance.GetDatabaseGenerations([u'views']),
+                       (2,))
+      self.db_instance.MarkAllGenerationsChanged()
+    finally:
+      self.db_instance.EndTransaction()
+    self.db_instance.StartTransaction()
+    try:
+      generation_rows = self.db_instance.ListRow('generations',
+                                                 generation_dict)
+    finally:
+      self.db_instance.EndTransaction()
+    self.assertEqual(sorted([(row['generation_name'],
+                              row['generation_zone_name'],
+                              row['generation_view_dependency'],
+                              row['generation']) for
+                             row in generation_rows]),
+                     [(u'acls', u'', u'', 2),
+                      (u'named_conf', u'', u'', 1),
+                      (u'records', u'university.edu', u'test_view_dep', 2),
+                      (u'reserved_words', u'', u'', 1),
+                      (u'users', u'', u'', 1),
+                      (u'views', u'', u'', 3),
+                      (u'zones', u'', u'', 1)])
+    self.assertRaises(errors.TransactionError,
+                      self.db_instance.MarkAllGenerationsChanged)
+
   def testCheckMaintenanceFlag(self):
     self.db_instance.StartTransaction()
     try:
@@ -745,6 +1369,57 @@ class TestdbAccess(unittest.TestCase):
                        'access_level': '0',
                        'user_name': "'tree_export_user'"})
 
+  def testIterDumpDatabase(self):
+    self.db_instance.StartTransaction()
+    try:
+      self.db_instance.MarkGenerationChanged(u'records', u'university.edu',
+                                             u'test_view_dep')
+    finally:
+      self.db_instance.EndTransaction()
+    self.db_instance.StartTransaction()
+    try:
+      dump = self.db_instance.DumpDatabase()
+      statements = list(self.db_instance.IterDumpDatabase())
+    finally:
+      self.db_instance.EndTransaction()
+
+    users_statements = [statement for table_name, statement in statements if
+                        table_name == u'users']
+    self.assertEqual(users_statements[0], u'DROP TABLE IF EXISTS `users`;\n')
+    self.assertEqual(users_statements[1], u'%s;\n' % dump['users']['schema'])
+    self.assertTrue(users_statements[2].startswith(
+        u'INSERT INTO users (users_id,user_name,access_level) VALUES\n'
+        u"(1,'tree_export_user',0)"))
+    self.assertEqual(len(users_statements), 3)
+    generations_statements = [statement for table_name, statement in
+                              statements if table_name == u'generations']
+    self.assertEqual(generations_statements[0], u'%s;\n' % (
+        dump['generations']['schema'].replace(
+            u'CREATE TABLE', u'CREATE TABLE IF NOT EXISTS', 1)))
+    self.assertTrue(generations_statements[1].endswith(
+        u' ON DUPLICATE KEY UPDATE '
+        u'generation=GREATEST(generation,VALUES(generation))+1;\n'))
+
+    self.db_instance.StartTransaction()
+    try:
+      self.db_instance.cursor.execute(
+          u'SET FOREIGN_KEY_CHECKS=0;\n%sSET FOREIGN_KEY_CHECKS=1;\n' %
+          u''.join([statement for table_name, statement in statements]))
+    finally:
+      self.db_instance.EndTransaction()
+
+    self.db_instance.StartTransaction()
+    try:
+      new_dump = self.db_instance.DumpDatabase()
+    finally:
+      self.db_instance.EndTransaction()
+    # Loading a dump counts its generations up instead of taking them back.
+    self.assertEqual(dump['generations']['rows'][0]['generation'], '1')
+    self.assertEqual(new_dump['generations']['rows'][0]['generation'], '2')
+    del dump['generations']['rows']
+    del new_dump['generations']['rows']
+    self.assertEqual(new_dump, dump)
+
   def testUnicode(self):
     ## snowman chars are unicode chars that don't exist in ascii
     snowman_chars = codecs.open('test_data/snowman', encoding='utf-8',
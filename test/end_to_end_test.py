@@ -3261,15 +3261,34 @@ class TestComplete(unittest.TestCase):
         '[0-9]{1,4}-[0-9]{1,2}-[0-9]{1,2} [0-9]{1,2}:[0-9]{1,2}:[0-9]{1,2}',
         ' ', newdump)
     newdb.close()
-    newdump_list = []
-    for line in newdump.split('\n'):
-      if( line.startswith('INSERT INTO audit_log') ):
-        number = int(line.split()[5].strip('(').strip(',').strip())
-        if( number < id ):
-          newdump_list.append(line)
-      else:
-        newdump_list.append(line)
-    newdump = '\n'.join(newdump_list)
+    # Audit log rows are one per line in multi-row INSERTs, the line
+    # endings are dropped as the last row kept is not the last row dumped.
+    # Generations keep counting up while the audit log is replayed, so they
+    # are left out.
+    dumps = []
+    for dump in [origdump, newdump]:
+      dump_list = []
+      audit_log_insert = False
+      generations_insert = False
+      for line in dump.split('\n'):
+        if( line.startswith('INSERT INTO ') ):
+          audit_log_insert = line.startswith('INSERT INTO audit_log')
+          generations_insert = line.startswith('INSERT INTO generations')
+          if( generations_insert ):
+            continue
+        elif( generations_insert and line.startswith('(') ):
+          continue
+        elif( audit_log_insert and line.startswith('(') ):
+          number = int(line.strip('(').split(',')[0])
+          if( number >= id ):
+            continue
+          line = line.rstrip(',;')
+        else:
+          audit_log_insert = False
+          generations_insert = False
+        dump_list.append(line)
+      dumps.append('\n'.join(dump_list))
+    origdump, newdump = dumps
     origdump = re.sub('AUTO_INCREMENT=[0-9]+', 'AUTO_INCREMENT=', origdump)
     newdump = re.sub('AUTO_INCREMENT=[0-9]+', 'AUTO_INCREMENT=', newdump)
     self.assertEqual(origdump, newdump)
@@ -0,0 +1,137 @@
+#!/usr/bin/python
+
+# Copyright (c) 2009, Purdue University
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+# 
+# Neither the name of the Purdue University nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Benchmark for GetFunctionNameAndArgs of helpers_lib.py
+
+Times finding the name and arguments of an audited method from inside it,
+with the argument names GetFunctionNameAndArgs caches by code object against
+walking the stack with inspect.getouterframes as every audited method used
+to.
+"""
+
+__copyright__ = 'Copyright (C) 2009, Purdue University'
+__license__ = 'BSD'
+__version__ = '#TRUNK#'
+
+
+import inspect
+import time
+
+from roster_core import helpers_lib
+
+
+CALLS = 10000
+# Frames between the audited method and main, as under the XML-RPC server
+STACK_DEPTH = 20
+
+
+def GetFunctionNameAndArgsInspect():
+  """Finds the calling function name and arguments the way
+  GetFunctionNameAndArgs did with inspect.getouterframes.
+
+  Outputs:
+    tuple: function name and current args
+  """
+  current_frame = inspect.currentframe()
+  try:
+    outer_frames = inspect.getouterframes(current_frame)
+    try:
+      function_name = unicode(outer_frames[1][3])
+      calling_frame = outer_frames[1][0]
+      try:
+        arg_values = inspect.getargvalues(calling_frame)
+      finally:
+        del calling_frame
+    finally:
+      del outer_frames
+  finally:
+    del current_frame
+  replay_args = []
+  audit_args = {}
+  for arg in arg_values[0]:
+    if( arg == 'self' ):
+      continue
+    audit_args[arg] = arg_values[3][arg]
+    replay_args.append(arg_values[3][arg])
+  current_args = {'audit_args': audit_args, 'replay_args': replay_args}
+  return (function_name, current_args)
+
+
+class AuditedClass(object):
+  """Class with a method shaped like a Core method."""
+
+  def MakeRecordInspect(self, record_type, target, zone_name,
+                        record_args_dict, view_name=None, ttl=None):
+    return GetFunctionNameAndArgsInspect()
+
+  def MakeRecordCached(self, record_type, target, zone_name,
+                       record_args_dict, view_name=None, ttl=None):
+    return helpers_lib.GetFunctionNameAndArgs()
+
+
+def TimeCalls(method, depth):
+  """Calls a method CALLS times from depth frames down.
+
+  Inputs:
+    method: method taking the MakeRecord arguments
+    depth: int of frames to add below the caller
+
+  Outputs:
+    float: microseconds per call
+  """
+  if( depth > 0 ):
+    return TimeCalls(method, depth - 1)
+  record_args_dict = {u'assignment_ip': u'192.168.1.1'}
+  start_time = time.time()
+  for call in range(CALLS):
+    method(u'a', u'host', u'university.edu', record_args_dict,
+           view_name=u'test_view')
+  seconds = time.time() - start_time
+  return seconds * 1000000 / CALLS
+
+
+def main():
+  audited_class = AuditedClass()
+  inspect_return = audited_class.MakeRecordInspect(
+      u'a', u'host', u'university.edu', {})
+  cached_return = audited_class.MakeRecordCached(
+      u'a', u'host', u'university.edu', {})
+  assert inspect_return[1] == cached_return[1]
+
+  old = TimeCalls(audited_class.MakeRecordInspect, STACK_DEPTH)
+  new = TimeCalls(audited_class.MakeRecordCached, STACK_DEPTH)
+  print '%d calls, %d frames deep' % (CALLS, STACK_DEPTH)
+  print '%-25s %12.2f us/call' % ('inspect.getouterframes', old)
+  print '%-25s %12.2f us/call' % ('code object cache', new)
+  print '%-25s %12.2fx' % ('speedup', old / new)
+
+
+if( __name__ == '__main__' ):
+  main()
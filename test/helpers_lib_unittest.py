@@ -51,6 +51,25 @@ class TestHelpersLib(unittest.TestCase):
         {'replay_args': ['test', 1],
          'audit_args': {'test_flag': 'test', 'other_flag': 1}})
 
+  def testGetFunctionNameAndArgsCache(self):
+    def AuditedFunction(self, test_flag, other_flag=None):
+      if( other_flag is None ):
+        other_flag = []
+      return helpers_lib.GetFunctionNameAndArgs()
+    self.assertFalse(AuditedFunction.func_code in
+                     helpers_lib.audited_functions)
+    self.assertEqual(AuditedFunction(self, u'test'),
+        (u'AuditedFunction',
+         {'replay_args': [u'test', []],
+          'audit_args': {'test_flag': u'test', 'other_flag': []}}))
+    self.assertEqual(
+        helpers_lib.audited_functions[AuditedFunction.func_code],
+        (u'AuditedFunction', ('test_flag', 'other_flag')))
+    self.assertEqual(AuditedFunction(self, u'again', u'other'),
+        (u'AuditedFunction',
+         {'replay_args': [u'again', u'other'],
+          'audit_args': {'test_flag': u'again', 'other_flag': u'other'}}))
+
   def testGetRowDict(self):
     self.assertEqual(helpers_lib.GetRowDict('acls'), 
                      {'acl_name': 'UnicodeString'})
@@ -127,5 +146,36 @@ class TestHelpersLib(unittest.TestCase):
     self.assertRaises(errors.InvalidInputError, helpers_lib.UnExpandIPV6,
         u'invalid') 
 
+  def testGetRecordFingerprint(self):
+    fingerprint = helpers_lib.GetRecordFingerprint(
+        u'mx', u'@', {u'priority': 10, u'mail_server': u'mail1.'})
+    self.assertEqual(fingerprint, u'2f8d26f5a4fe3f27ccb30a90288a871e38f1d6b4')
+    self.assertEqual(helpers_lib.GetRecordFingerprint(
+        u'mx', u'@', {u'mail_server': u'mail1.', u'priority': u'10'}),
+        fingerprint)
+    self.assertNotEqual(helpers_lib.GetRecordFingerprint(
+        u'mx', u'@', {u'priority': 20, u'mail_server': u'mail1.'}),
+        fingerprint)
+    self.assertNotEqual(helpers_lib.GetRecordFingerprint(
+        u'mx', u'host', {u'priority': 10, u'mail_server': u'mail1.'}),
+        fingerprint)
+    self.assertNotEqual(helpers_lib.GetRecordFingerprint(
+        u'soa', u'@', {u'priority': 10, u'mail_server': u'mail1.'}),
+        fingerprint)
+    self.assertNotEqual(helpers_lib.GetRecordFingerprint(
+        u'txt', u'@', {u'quoted_text': u'"a"\nb="c"'}),
+        helpers_lib.GetRecordFingerprint(
+            u'txt', u'@', {u'quoted_text': u'"a"', u'b': u'"c"'}))
+    soa_args_dict = {u'name_server': u'ns1.', u'admin_email': u'admin.',
+                     u'serial_number': 1, u'refresh_seconds': 5,
+                     u'retry_seconds': 5, u'expiry_seconds': 5,
+                     u'minimum_seconds': 5}
+    soa_fingerprint = helpers_lib.GetRecordFingerprint(u'soa', u'@',
+                                                       soa_args_dict)
+    soa_args_dict[u'serial_number'] = 2
+    self.assertEqual(helpers_lib.GetRecordFingerprint(u'soa', u'@',
+                                                      soa_args_dict),
+                     soa_fingerprint)
+
 if( __name__ == '__main__' ):
   unittest.main()
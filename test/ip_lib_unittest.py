@@ -0,0 +1,166 @@
+#!/usr/bin/python
+
+# Copyright (c) 2009, Purdue University
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+# 
+# Neither the name of the Purdue University nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Unittest for ip_lib.py"""
+
+
+__copyright__ = 'Copyright (C) 2009, Purdue University'
+__license__ = 'BSD'
+__version__ = '#TRUNK#'
+
+
+import unittest
+
+import IPy
+
+from roster_core import constants
+from roster_core import ip_lib
+
+
+ADDRESSES = [
+    '0.0.0.0', '192.168.1.4', u'192.168.1.4', '255.255.255.255', '10.1',
+    '10.1.0', '010.001.002.003', '192.168.0.0/24', '192.168.0/24',
+    '10.0.0.0/8', '0.0.0.0/0', '192.168.1.128/25', '192.168.1.4/32',
+    '192.168.1.0/255.255.255.0', '192.168.1.0-192.168.1.255', '127',
+    '0xc0a80104', '3232235780', '::', '::1', '::/0', '1::', 'fe80::1',
+    '2001:db8::/32', 'FEDC:BA98:7654:3210:FEDC:BA98:7654:3210',
+    u'4321:0000:0001:0002:0003:0004:0567:89ab', '4321:0:1:2::567:89ab',
+    '1:2:3:4:5:6:7::', '::2:3:4:5:6:7:8', '2001:db8::/64',
+    '2001:0db8:0000:0000:0000:0000:0000:0000/48', '::ffff:192.168.1.4',
+    '0:0:0:0:0:0:13.1.68.3', '00001::', '2001:db8::/128', ' 1.2.3.4 ']
+
+INVALID_ADDRESSES = [
+    '', 'notavalidip', '192.168.1.256', '192.168.1.1.1', '192.168.1.4/24',
+    '192.168.1.0/33', '192.168.1.0/-1', '1.2.3.4/24/2', '::1::', '1::2::3',
+    ':1::', 'a:::b', '1:2:3:4:5:6:7', '1:2:3:4:5:6:7:8:9', '1:2:3:4:5:6:7::8',
+    'fffff::', '2001:db8::/129', '2001:db8::1/64', 'ffff:192.168.1.4::',
+    '192.168.1.0-192.168.0.255', 'g::1']
+
+
+class TestIPLib(unittest.TestCase):
+
+  def setUp(self):
+    ip_lib.parse_cache.clear()
+
+  def testParseIP(self):
+    for address in ADDRESSES:
+      ip_object = IPy.IP(address)
+      self.assertEqual(ip_lib.ParseIP(address),
+                       (ip_object.version(), ip_object.int(),
+                        ip_object.prefixlen()))
+    for address in INVALID_ADDRESSES:
+      self.assertRaises(ValueError, IPy.IP, address)
+      self.assertRaises(ValueError, ip_lib.ParseIP, address)
+
+  def testParseIPCache(self):
+    self.assertEqual(ip_lib.ParseIP('192.168.1.4'), (4, 3232235780, 32))
+    self.assertEqual(ip_lib.parse_cache.keys(), ['192.168.1.4'])
+    self.assertEqual(ip_lib.ParseIP('::1'), (6, 1, 128))
+    self.assertEqual(ip_lib.ParseIP('192.168.1.4'), (4, 3232235780, 32))
+    self.assertEqual(ip_lib.parse_cache.keys(), ['::1', '192.168.1.4'])
+    for count in range(constants.IP_PARSE_CACHE_SIZE):
+      ip_lib.ParseIP(count + 256)
+    self.assertEqual(len(ip_lib.parse_cache), constants.IP_PARSE_CACHE_SIZE)
+    self.assertFalse('::1' in ip_lib.parse_cache)
+    self.assertRaises(ValueError, ip_lib.ParseIP, 'notavalidip')
+    self.assertFalse('notavalidip' in ip_lib.parse_cache)
+
+  def testParseInt(self):
+    for ip in [0, 1, 3232235780, 0xffffffff, 0x100000000,
+               0xffffffffffffffffffffffffffffffff]:
+      ip_object = IPy.IP(ip)
+      self.assertEqual(ip_lib.ParseInt(ip),
+                       (ip_object.version(), ip_object.int(),
+                        ip_object.prefixlen()))
+    self.assertRaises(ValueError, ip_lib.ParseInt,
+                      0x100000000000000000000000000000000)
+
+  def testFormatIP(self):
+    for address in ADDRESSES:
+      ip_object = IPy.IP(address)
+      self.assertEqual(ip_lib.ExpandIP(address), ip_object.strFullsize())
+      self.assertEqual(ip_lib.FormatIP(ip_object.int(), ip_object.version()),
+                       ip_object.strFullsize(0))
+      self.assertEqual(ip_lib.FormatIP(ip_object.int()),
+                       IPy.IP(ip_object.int()).strFullsize(0))
+    self.assertEqual(ip_lib.FormatIP(3232235780), '192.168.1.4')
+    self.assertEqual(ip_lib.FormatIP(1, 6),
+                     '0000:0000:0000:0000:0000:0000:0000:0001')
+    self.assertEqual(ip_lib.FormatIP(0x20010db8 << 96, 6, 32),
+                     '2001:0db8:0000:0000:0000:0000:0000:0000/32')
+    self.assertEqual(ip_lib.FormatIP(3232235776, 4, 32), '192.168.1.0')
+    self.assertRaises(ValueError, ip_lib.FormatIP, -1)
+    self.assertRaises(ValueError, ip_lib.FormatIP, 0x100000000, 4)
+
+  def testNetworkMath(self):
+    for address in ADDRESSES:
+      ip_object = IPy.IP(address)
+      network = ip_lib.ParseIP(address)
+      self.assertEqual(ip_lib.GetNetmask(network[0], network[2]),
+                       ip_object.netmask().int())
+      self.assertEqual(ip_lib.GetNetworkSize(network[0], network[2]),
+                       ip_object.len())
+      self.assertEqual(ip_lib.GetBroadcast(network),
+                       ip_object.broadcast().int())
+
+  def testContainsAndOverlaps(self):
+    for address in ADDRESSES:
+      for other_address in ADDRESSES:
+        ip_object = IPy.IP(address)
+        other_ip_object = IPy.IP(other_address)
+        network = ip_lib.ParseIP(address)
+        other_network = ip_lib.ParseIP(other_address)
+        self.assertEqual(ip_lib.Contains(network, other_network),
+                         other_ip_object in ip_object)
+        self.assertEqual(ip_lib.Overlaps(network, other_network),
+                         bool(ip_object.overlaps(other_ip_object)))
+
+  def testNetworkTrie(self):
+    network_trie = ip_lib.NetworkTrie()
+    for address in ADDRESSES:
+      network_trie.Insert(ip_lib.ParseIP(address), address)
+    for address in ADDRESSES:
+      network = ip_lib.ParseIP(address)
+      overlapping = []
+      for other_address in ADDRESSES:
+        other_network = ip_lib.ParseIP(other_address)
+        if( other_network[0] == network[0] and
+            ip_lib.Overlaps(network, other_network) ):
+          overlapping.append(other_address)
+      self.assertEqual(sorted(network_trie.FindOverlapping(network)),
+                       sorted(overlapping))
+    self.assertEqual(network_trie.FindOverlapping(
+                         ip_lib.ParseIP('172.16.0.1')),
+                     ['0.0.0.0/0'])
+    self.assertEqual(ip_lib.NetworkTrie().FindOverlapping(
+                         ip_lib.ParseIP('::1')), [])
+
+if( __name__ == '__main__' ):
+  unittest.main()
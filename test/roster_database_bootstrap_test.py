@@ -141,6 +141,37 @@ class TestRosterDatabaseBootstrap(unittest.TestCase):
     self.assertEquals(config_database['ssl'], False)
     self.assertEquals(config_database['ssl_ca'], '')
 
+  def testDBBootstrapConfigDefaults(self):
+    command = subprocess.Popen(self.base_command, shell=True,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    command.communicate(self.base_communicate)
+    config_file_name = '%s/config.conf' % self.cfg_exporter['backup_dir']
+    database_defaults = roster_core.constants.CONFIG_FILE_DEFAULTS['database']
+
+    # Written values are the defaults
+    config = roster_core.Config(file_name=config_file_name)
+    for variable in database_defaults:
+      self.assertEquals(config.config_file['database'][variable],
+                        database_defaults[variable])
+
+    # Config files written before the variables were added still load
+    config_parser = ConfigParser.SafeConfigParser()
+    config_parser.read(config_file_name)
+    for variable in database_defaults:
+      config_parser.remove_option('database', variable)
+    config_file = open(config_file_name, 'w')
+    try:
+      config_parser.write(config_file)
+    finally:
+      config_file.close()
+    config = roster_core.Config(file_name=config_file_name)
+    for variable in database_defaults:
+      self.assertEquals(config.config_file['database'][variable],
+                        database_defaults[variable])
+    db_instance = config.GetDb()
+    self.assertEquals(db_instance.maintenance_flag_ttl, 0)
+    self.assertEquals(db_instance.audit_log_write_behind, False)
+
   def testDBBootstrapUsername(self):
     command = subprocess.Popen('python %s -c %s/config.conf -u %s -U %s '
         '-d %s -n %s '
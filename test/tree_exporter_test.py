@@ -39,6 +39,7 @@ __copyright__ = 'Copyright (C) 2009, Purdue University'
 __license__ = 'BSD'
 __version__ = '#TRUNK#'
 
+import bz2
 import tarfile
 import unittest
 import os
@@ -578,6 +579,41 @@ class TestTreeExporter(tree_exporter_test_lib.TreeExportTestCase):
 
     self.assertNotEquals(raw_dump, raw_dump_2)
 
+  def testTreeExporterWriteDatabaseDumps(self):
+    replay_file_name = 'test_data/audit_log_replay_dump-test.bz2'
+    full_file_name = 'test_data/full_database_dump-test.bz2'
+    self.db_instance.StartTransaction()
+    try:
+      raw_dump = self.db_instance.DumpDatabase()
+      self.tree_exporter_instance.WriteDatabaseDumps(replay_file_name,
+                                                     full_file_name)
+    finally:
+      self.db_instance.EndTransaction()
+    try:
+      replay_file = bz2.BZ2File(replay_file_name)
+      replay_dump = replay_file.read()
+      replay_file.close()
+      full_file = bz2.BZ2File(full_file_name)
+      full_dump = full_file.read()
+      full_file.close()
+    finally:
+      os.remove(replay_file_name)
+      os.remove(full_file_name)
+    self.assertTrue('INSERT INTO audit_log' in full_dump)
+    self.assertFalse('INSERT INTO audit_log' in replay_dump)
+
+    self.core_instance.MakeZoneType(u'zonetype5')
+
+    self.db_instance.StartTransaction()
+    self.db_instance.cursor.execute(full_dump)
+    self.db_instance.EndTransaction()
+
+    self.db_instance.StartTransaction()
+    raw_dump_2 = self.db_instance.DumpDatabase()
+    self.db_instance.EndTransaction()
+
+    self.assertEquals(raw_dump, raw_dump_2)
+
   def testTreeExporterGetRawData(self):
     self.tree_exporter_instance.db_instance.StartTransaction()
     raw_data = self.tree_exporter_instance.GetRawData()
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+# Copyright (c) 2009, Purdue University
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# Redistributions in binary form must reproduce the above copyright notice, this
+# list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+# 
+# Neither the name of the Purdue University nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Benchmark for the reverse range checks of user.py
+
+Times finding the delegated reverse ranges of record addresses for a user
+with 10,000 delegated /24s, with the prefix trie User.Authorize uses against
+comparing every range with IPy and with ip_lib.
+"""
+
+__copyright__ = 'Copyright (C) 2009, Purdue University'
+__license__ = 'BSD'
+__version__ = '#TRUNK#'
+
+
+import random
+import time
+
+import IPy
+
+from roster_core import ip_lib
+
+
+RANGES = 10000
+LOOKUPS = 200
+
+
+def FindOverlappingIPy(reverse_ranges, ip_address):
+  """Finds reverse ranges the way User.Authorize did with IPy.
+
+  Inputs:
+    reverse_ranges: list of reverse range dicts
+    ip_address: string of ip address
+
+  Outputs:
+    list: group permissions of overlapping ranges
+  """
+  group_permissions = []
+  for reverse_range in reverse_ranges:
+    if( IPy.IP(reverse_range['cidr_block']).overlaps(ip_address) ):
+      group_permissions.append(reverse_range['group_permission'])
+  return group_permissions
+
+
+def FindOverlappingIPLib(reverse_ranges, ip_address):
+  """Finds reverse ranges by comparing every range with ip_lib.
+
+  Inputs:
+    reverse_ranges: list of reverse range dicts
+    ip_address: string of ip address
+
+  Outputs:
+    list: group permissions of overlapping ranges
+  """
+  group_permissions = []
+  ip = ip_lib.ParseIP(ip_address)
+  for reverse_range in reverse_ranges:
+    if( ip_lib.Overlaps(ip_lib.ParseIP(reverse_range['cidr_block']), ip) ):
+      group_permissions.append(reverse_range['group_permission'])
+  return group_permissions
+
+
+def TimeLookups(find_function, ip_addresses):
+  """Looks up every address once.
+
+  Inputs:
+    find_function: function taking an ip address string
+    ip_addresses: list of ip address strings
+
+  Outputs:
+    float: microseconds per lookup
+  """
+  start_time = time.time()
+  for ip_address in ip_addresses:
+    find_function(ip_address)
+  seconds = time.time() - start_time
+  return seconds * 1000000 / len(ip_addresses)
+
+
+def main():
+  random.seed(0)
+  reverse_ranges = []
+  network_trie = ip_lib.NetworkTrie()
+  for index in range(RANGES):
+    cidr_block = u'10.%d.%d.0/24' % (index >> 8, index & 0xff)
+    reverse_ranges.append({'cidr_block': cidr_block,
+                           'group_permission': u'ptr'})
+    network_trie.Insert(ip_lib.ParseIP(cidr_block), u'ptr')
+  ip_addresses = []
+  for index in range(LOOKUPS):
+    ip_addresses.append(u'10.%d.%d.%d' % (random.randint(0, 63),
+                                          random.randint(0, 255),
+                                          random.randint(1, 254)))
+
+  for ip_address in ip_addresses:
+    assert (network_trie.FindOverlapping(ip_lib.ParseIP(ip_address)) ==
+            FindOverlappingIPLib(reverse_ranges, ip_address))
+
+  ipy = TimeLookups(
+      lambda ip_address: FindOverlappingIPy(reverse_ranges, ip_address),
+      ip_addresses[:LOOKUPS / 10])
+  linear = TimeLookups(
+      lambda ip_address: FindOverlappingIPLib(reverse_ranges, ip_address),
+      ip_addresses)
+  trie = TimeLookups(
+      lambda ip_address: network_trie.FindOverlapping(
+          ip_lib.ParseIP(ip_address)),
+      ip_addresses)
+  print '%d reverse ranges, %d lookups' % (RANGES, LOOKUPS)
+  print '%-25s %12.2f us/lookup' % ('IPy every range', ipy)
+  print '%-25s %12.2f us/lookup' % ('ip_lib every range', linear)
+  print '%-25s %12.2f us/lookup' % ('prefix trie', trie)
+  print '%-25s %12.2fx' % ('speedup over IPy', ipy / trie)
+
+
+if( __name__ == '__main__' ):
+  main()
@@ -40,6 +40,7 @@ __license__ = 'BSD'
 __version__ = '#TRUNK#'
 
 
+import MySQLdb
 import unittest
 
 import roster_core
@@ -60,10 +61,7 @@ class TestUser(unittest.TestCase):
 
     self.db_instance = self.config_instance.GetDb()
 
-    schema = roster_core.embedded_files.SCHEMA_FILE
-    self.db_instance.StartTransaction()
-    self.db_instance.cursor.execute(schema)
-    self.db_instance.EndTransaction()
+    self.db_instance.CreateRosterDatabase()
 
     data = open(DATA_FILE, 'r').read()
     self.db_instance.StartTransaction()
@@ -264,6 +262,69 @@ class TestUser(unittest.TestCase):
     self.assertRaises(errors.MissingDataTypeError, user_instance.Authorize, u'MakeRecord',
                       no_record_args_dict_data)
 
+  def testAuthorizeMany(self):
+    user_instance = user.User(u'shuey', self.db_instance, self.log_instance)
+    good_record_data = {'target': u'host1', 'zone_name': u'cs.university.edu',
+                        'view_name': u'any', 'record_type': u'a',
+                        'record_args_dict': {u'assignment_ip': u'192.168.1.1'}}
+    bad_type_record_data = {
+        'target': u'host1', 'zone_name': u'cs.university.edu',
+        'view_name': u'any', 'record_type': u'ptr',
+        'record_args_dict': {u'assignment_host': u'host1.cs.university.edu.'}}
+    bad_view_record_data = {
+        'target': u'host1', 'zone_name': u'cs.university.edu',
+        'view_name': u'test_view_dep', 'record_type': u'a',
+        'record_args_dict': {u'assignment_ip': u'192.168.1.1'}}
+
+    self.assertEqual(user_instance.AuthorizeMany(u'MakeRecord', []), [])
+    self.assertEqual(user_instance.AuthorizeMany(
+        u'MakeRecord', [good_record_data, good_record_data]), [])
+    failures = user_instance.AuthorizeMany(
+        u'MakeRecord', [good_record_data, bad_type_record_data,
+                        good_record_data, bad_view_record_data])
+    self.assertEqual([failure.__class__ for failure in failures],
+                     [errors.AuthorizationError, errors.UnexpectedDataError])
+    self.assertEqual(str(failures[0]),
+                     'User shuey is not allowed to use MakeRecord with host1 '
+                     'on cs.university.edu of type ptr')
+    self.assertEqual(str(failures[1]),
+                     'Specified zone-view assignment does not exist for zone '
+                     'cs.university.edu view test_view')
+    # Authorize fails the same records one at a time
+    user_instance.Authorize(u'MakeRecord', good_record_data)
+    self.assertRaises(errors.AuthorizationError, user_instance.Authorize,
+                      u'MakeRecord', bad_type_record_data)
+    self.assertRaises(errors.UnexpectedDataError, user_instance.Authorize,
+                      u'MakeRecord', bad_view_record_data)
+
+    self.core_instance.SetMaintenanceFlag(1)
+    self.assertRaises(errors.MaintenanceError, user_instance.AuthorizeMany,
+                      u'MakeRecord', [good_record_data])
+    self.core_instance.SetMaintenanceFlag(0)
+
+  def testFindZoneOrigin(self):
+    user_instance = user.User(u'shuey', self.db_instance, self.log_instance)
+    self.assertEqual(user_instance._FindZoneOrigin(u'host.cs.university.edu.'),
+                     u'cs.university.edu.')
+    self.assertEqual(user_instance._FindZoneOrigin(u'cs.university.edu.'),
+                     u'cs.university.edu.')
+    self.assertEqual(user_instance._FindZoneOrigin(u'host.university.edu.'),
+                     None)
+    self.assertEqual(user_instance._FindZoneOrigin(u'host'), None)
+
+    user_instance._CacheZoneOrigins(u'university.edu', [u'university.edu.'])
+    self.assertEqual(user_instance._FindZoneOrigin(u'host.university.edu.'),
+                     u'university.edu.')
+    self.assertEqual(user_instance._FindZoneOrigin(u'host.cs.university.edu.'),
+                     u'cs.university.edu.')
+    self.assertEqual(user_instance.origin_zones[u'university.edu.'],
+                     set([u'university.edu']))
+    user_instance._CacheZoneOrigins(u'university.edu', [u'university.net.'])
+    self.assertEqual(user_instance._FindZoneOrigin(u'host.university.edu.'),
+                     None)
+    self.assertEqual(user_instance.zone_origin_cache[u'university.edu'],
+                     [u'university.net.'])
+
   def testGetUserName(self):
     user_instance = user.User(u'jcollins', self.db_instance, self.log_instance)
     self.assertEquals(user_instance.GetUserName(), 'jcollins')
@@ -274,6 +335,73 @@ class TestUser(unittest.TestCase):
                       {'user_access_level': 32, 'user_name': u'jcollins',
                        'forward_zones': [], 'groups': [], 'reverse_ranges': []})
 
+  def testAuthorizationSnapshot(self):
+    user_instance = user.User(u'jcollins', self.db_instance, self.log_instance)
+    # Nothing changed, so the snapshot is used again after only reading the
+    # generations table.
+    self.db_instance.GetUserAuthorizationInfo = None
+    cached_user_instance = user.User(u'jcollins', self.db_instance,
+                                     self.log_instance)
+    self.assertTrue(cached_user_instance.user_perms is
+                    user_instance.user_perms)
+
+    # Within authorization_ttl the database is not used at all.
+    self.db_instance.authorization_ttl = 3600
+    user.User(u'jcollins', self.db_instance, self.log_instance)
+    self.db_instance.GetDatabaseGenerations = None
+    cached_user_instance = user.User(u'jcollins', self.db_instance,
+                                     self.log_instance)
+    self.assertTrue(cached_user_instance.user_perms is
+                    user_instance.user_perms)
+    del self.db_instance.GetDatabaseGenerations
+    del self.db_instance.GetUserAuthorizationInfo
+    self.db_instance.authorization_ttl = 0
+
+    generation = self.db_instance.GetAuthorizationGeneration()
+    self.core_instance.MakeUserGroupAssignment(u'jcollins', u'cs')
+    self.assertEqual(self.db_instance.GetAuthorizationGeneration(),
+                     generation + 1)
+    new_user_instance = user.User(u'jcollins', self.db_instance,
+                                  self.log_instance)
+    self.assertFalse(new_user_instance.user_perms is
+                     user_instance.user_perms)
+
+  def testAuthorizationSnapshotOtherProcess(self):
+    self.core_instance.MakeUserGroupAssignment(u'jcollins', u'cs')
+    record_data = {'target': u'good',
+                   'zone_name': u'cs.university.edu',
+                   'view_name': u'any',
+                   'record_type': u'a',
+                   'record_args_dict': {u'assignment_ip': u'192.168.0.1'}}
+    user_instance = user.User(u'jcollins', self.db_instance, self.log_instance)
+    user_instance.Authorize(u'MakeRecord', record_data)
+
+    # Another process takes the permission away, only the generations table
+    # tells this one about it.
+    generation = self.db_instance.GetAuthorizationGeneration()
+    connection = MySQLdb.connect(
+        host=self.db_instance.db_host, user=self.db_instance.db_user,
+        passwd=self.db_instance.db_passwd, db=self.db_instance.db_name,
+        use_unicode=True, charset='utf8')
+    try:
+      cursor = connection.cursor()
+      cursor.execute('DELETE FROM user_group_assignments WHERE '
+                     'user_group_assignments_user_name="jcollins" AND '
+                     'user_group_assignments_group_name="cs"')
+      cursor.execute('INSERT INTO generations (generation_name, generation) '
+                     'VALUES ("users", 1) ON DUPLICATE KEY UPDATE '
+                     'generation=generation+1')
+      connection.commit()
+    finally:
+      connection.close()
+    self.assertEqual(self.db_instance.GetAuthorizationGeneration(),
+                     generation)
+
+    new_user_instance = user.User(u'jcollins', self.db_instance,
+                                  self.log_instance)
+    self.assertRaises(errors.AuthorizationError, new_user_instance.Authorize,
+                      u'MakeRecord', record_data)
+
 
 if( __name__ == '__main__' ):
     unittest.main()